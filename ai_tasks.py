@@ -0,0 +1,591 @@
+"""
+AI 任务定义
+分类（含批量）、合并建议、整理（含长文分块整理）以及分类+整理合并（ingest）任务的提示词与响应解析，
+供同步（app.py）与异步（asgi_app.py）两条调用路径共用
+"""
+import json
+import math
+
+import json_extract
+from stream_parser import IncrementalJSONParser
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful AI assistant."
+CLASSIFY_SYSTEM_MESSAGE = "You are a content classification expert."
+ORGANIZE_SYSTEM_MESSAGE = "You are a content organization expert that outputs well-structured Markdown."
+INGEST_SYSTEM_MESSAGE = "You are a content classification and organization expert that outputs well-structured Markdown."
+
+# 模型响应无法解析时兜底结果的理由
+FALLBACK_REASON = 'AI 响应格式处理中'
+
+# 合并建议提示中新内容的最大长度
+MERGE_CONTENT_CHARS = 1000
+
+# 各任务响应的格式（见 json_extract.validate），用于提取校验与修复提示
+CLASSIFY_SCHEMA = {'is_note': bool, 'note_type': str, 'confidence': float, 'reason': str}
+CLASSIFY_BATCH_SCHEMA = [dict(CLASSIFY_SCHEMA, id=int)]
+MERGE_SCHEMA = {'should_merge': bool, 'merge_target': (str, None), 'merge_reason': str, 'confidence': float}
+ORGANIZE_SCHEMA = {'organized_markdown': str, 'key_dates': list, 'key_points': list, 'summary': str}
+SUMMARY_SCHEMA = {'summary': str}
+INGEST_SCHEMA = {**CLASSIFY_SCHEMA, 'title': str, **ORGANIZE_SCHEMA}
+
+
+# ==================== 提示词 ====================
+
+def classify_prompt(content):
+    """构造 AI 分类提示"""
+    return f"""请分析以下内容，确定它是否应该被保存为笔记。
+
+内容：
+{content}
+
+请按以下 JSON 格式回复：
+{{
+    "is_note": true/false,
+    "note_type": "待办事项/零散知识/灵感想法/参考材料/会议记录/代码片段/其他",
+    "confidence": 0-1之间的置信度,
+    "reason": "简要说明理由"
+}}
+
+只返回 JSON，不要其他文本。"""
+
+
+def classify_batch_prompt(contents):
+    """构造批量分类提示，条目以从 1 开始的序号标识"""
+    items = '\n\n'.join(f"[{index}]\n{content}" for index, content in enumerate(contents, 1))
+    return f"""请逐条分析以下 {len(contents)} 条内容，分别确定它们是否应该被保存为笔记。
+
+{items}
+
+请按以下 JSON 数组格式回复，每条内容一个对象，id 为内容前的序号：
+[
+    {{
+        "id": 1,
+        "is_note": true/false,
+        "note_type": "待办事项/零散知识/灵感想法/参考材料/会议记录/代码片段/其他",
+        "confidence": 0-1之间的置信度,
+        "reason": "简要说明理由"
+    }}
+]
+
+只返回 JSON，不要其他文本。"""
+
+
+def merge_prompt(content, note_type, candidates):
+    """构造合并建议提示，candidates 为相似笔记检索返回的同类候选（见 similar_notes.SimilarNotesIndex.query）"""
+    existing_notes = '\n'.join(
+        f"- {item['title']}（内容相似度 {item['similarity']}）：{item['excerpt']}" for item in candidates)
+    return f"""请分析以下新内容，判断是否应该与现有笔记合并。
+
+新内容：
+{content[:MERGE_CONTENT_CHARS]}
+
+笔记类型：{note_type}
+
+内容最相似的现有同类笔记（标题、相似度与内容摘录）：
+{existing_notes if existing_notes else '暂无'}
+
+请按以下 JSON 格式回复：
+{{
+    "should_merge": true/false,
+    "merge_target": "目标笔记标题（如不需合并则为null）",
+    "merge_reason": "合并理由",
+    "confidence": 0-1之间的置信度
+}}
+
+只返回 JSON，不要其他文本。"""
+
+
+def merge_without_llm(candidates, auto_threshold):
+    """
+    无需大模型即可判断时直接给出合并建议：没有相似的同类笔记时不合并，
+    最相似笔记的相似度不低于 auto_threshold 时合并到该笔记；其余情况返回 None
+    """
+    if not candidates:
+        return {
+            'should_merge': False,
+            'merge_target': None,
+            'merge_reason': '没有内容相似的同类笔记',
+            'confidence': 0.9,
+            'candidates': [],
+            'source': 'lsh',
+        }
+    best = candidates[0]
+    if best['similarity'] >= auto_threshold:
+        return {
+            'should_merge': True,
+            'merge_target': best['title'],
+            'merge_target_id': best['id'],
+            'merge_reason': f"与现有笔记“{best['title']}”内容高度重合（相似度 {best['similarity']}）",
+            'confidence': best['similarity'],
+            'candidates': candidates,
+            'source': 'lsh',
+        }
+    return None
+
+
+def organize_prompt(content, note_type, part=None):
+    """构造整理提示；part 为 (序号, 总数) 时说明这是长文中的一部分"""
+    part_hint = f"（这是一篇长文的第 {part[0]}/{part[1]} 部分，只整理这一部分）" if part else ''
+    return f"""请整理以下内容为结构化 Markdown，并提取重要时间点。{part_hint}
+
+原始内容：
+{content}
+
+笔记类型：{note_type}
+
+请按照以下 JSON 格式回复：
+{{
+    "organized_markdown": "整理后的 Markdown 格式内容",
+    "key_dates": [
+        {{"date": "YYYY-MM-DD", "description": "事件描述"}},
+        ...
+    ],
+    "key_points": ["要点1", "要点2", "要点3"],
+    "summary": "一句话总结"
+}}
+
+只返回 JSON，不要其他文本。"""
+
+
+def summary_prompt(summaries, note_type):
+    """构造长文分块整理的汇总提示：由各部分摘要生成整体的一句话总结"""
+    parts = '\n'.join(f"{index}. {summary}" for index, summary in enumerate(summaries, 1))
+    return f"""以下是一篇长文各部分的摘要（按原文顺序）：
+
+{parts}
+
+笔记类型：{note_type}
+
+请按以下 JSON 格式回复整篇内容的一句话总结：
+{{
+    "summary": "一句话总结"
+}}
+
+只返回 JSON，不要其他文本。"""
+
+
+def ingest_prompt(content, note_type=''):
+    """构造分类 + 整理合并提示，一次调用同时返回两部分结果；note_type 非空时不再判断类型"""
+    type_hint = f"笔记类型已确定为：{note_type}" if note_type else \
+        '笔记类型从以下选项中选择：待办事项/零散知识/灵感想法/参考材料/会议记录/代码片段/其他'
+    return f"""请分析以下内容：判断它是否应该被保存为笔记，并将其整理为结构化 Markdown、提取重要时间点。
+
+内容：
+{content}
+
+{type_hint}
+
+请按以下 JSON 格式回复：
+{{
+    "is_note": true/false,
+    "note_type": "笔记类型",
+    "confidence": 0-1之间的置信度,
+    "reason": "简要说明理由",
+    "title": "不超过 30 字的标题",
+    "organized_markdown": "整理后的 Markdown 格式内容（不是笔记时为空字符串）",
+    "key_dates": [
+        {{"date": "YYYY-MM-DD", "description": "事件描述"}},
+        ...
+    ],
+    "key_points": ["要点1", "要点2", "要点3"],
+    "summary": "一句话总结"
+}}
+
+只返回 JSON，不要其他文本。"""
+
+
+# ==================== 响应解析 ====================
+
+def parse_classify_response(response_text):
+    result = json_extract.extract(response_text, CLASSIFY_SCHEMA).value
+    if result is None:
+        return {
+            'is_note': True,
+            'note_type': '零散知识',
+            'confidence': 0.7,
+            'reason': FALLBACK_REASON
+        }
+    return result
+
+
+def parse_classify_batch_response(response_text, count):
+    """解析批量分类结果，返回 {条目下标（从 0 开始）: 分类结果}；格式错误或缺失的条目不包含在内"""
+    parsed = json_extract.extract(response_text, CLASSIFY_BATCH_SCHEMA).value or []
+    results = {}
+    for entry in parsed:
+        entry, errors = json_extract.validate(entry, CLASSIFY_BATCH_SCHEMA[0])
+        if errors:
+            continue
+        index = entry['id'] - 1
+        if 0 <= index < count and index not in results:
+            results[index] = {key: value for key, value in entry.items() if key != 'id'}
+    return results
+
+
+def parse_merge_response(response_text, candidates=()):
+    """解析大模型的合并建议；merge_target 与某个候选标题相同时补充 merge_target_id"""
+    result = json_extract.extract(response_text, MERGE_SCHEMA).value
+    if result is None:
+        result = {
+            'should_merge': False,
+            'merge_target': None,
+            'merge_reason': FALLBACK_REASON,
+            'confidence': 0.5
+        }
+    for item in candidates:
+        if result.get('merge_target') and item['title'] == result['merge_target']:
+            result['merge_target_id'] = item['id']
+            break
+    result['candidates'] = list(candidates)
+    result['source'] = 'llm'
+    return result
+
+
+def organize_fallback(content):
+    return {
+        'organized_markdown': content,
+        'key_dates': [],
+        'key_points': [],
+        'summary': 'Content received'
+    }
+
+
+def parse_organize_response(response_text, content):
+    result = json_extract.extract(response_text, ORGANIZE_SCHEMA).value
+    return result if result is not None else organize_fallback(content)
+
+
+def parse_summary_response(response_text, summaries):
+    """解析汇总结果，格式错误时拼接各部分摘要"""
+    result = json_extract.extract(response_text, SUMMARY_SCHEMA).value
+    if result and result['summary']:
+        return result['summary']
+    return '；'.join(summaries)
+
+
+def parse_ingest_response(response_text, content, note_type=''):
+    result = json_extract.extract(response_text, INGEST_SCHEMA).value
+    if result is None:
+        result = {**parse_classify_response(''), **organize_fallback(content)}
+    if note_type:
+        result['note_type'] = note_type
+    return result
+
+
+def ingest_note_data(result, data, content):
+    """
+    根据 ingest 结果构造保存笔记所需的数据（与 /api/save-note 请求体相同）
+    未要求保存，或模型判断不是笔记且调用方未指定类型时返回 None
+    """
+    if not data.get('save'):
+        return None
+    if not (result.get('is_note') or data.get('note_type')):
+        return None
+    title = data.get('title') or result.get('title') or content.split('\n')[0][:50] or '无标题笔记'
+    return {
+        'title': title,
+        'type': result.get('note_type') or '零散知识',
+        'original_content': content,
+        'organized_markdown': result.get('organized_markdown') or '',
+        'summary': result.get('summary', ''),
+        'key_dates': result.get('key_dates') or [],
+        'tags': data.get('tags', [])
+    }
+
+
+# ==================== 流式整理 ====================
+
+def format_sse(event, data):
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class OrganizeStream:
+    """
+    将整理任务的流式输出转换为 SSE 消息：
+        markdown  {"delta": "..."}               organized_markdown 新增的文本
+        field     {"key": "...", "value": ...}   key_dates / key_points / summary 等字段完整后立即发送
+        result    与 /api/organize-content 相同的完整结果（模型未按格式输出时同样兜底）
+    JSON 对象完整后 complete 为 True，调用方可以不再读取其后的输出；finish 之后 outcome 为解析结果（见 json_extract.OUTCOMES）
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.parser = IncrementalJSONParser(['organized_markdown'])
+        self.scanner = json_extract.JSONScanner('{')
+        self.chunks = []
+        self.outcome = None
+
+    @property
+    def text(self):
+        return ''.join(self.chunks)
+
+    @property
+    def complete(self):
+        return self.scanner.done
+
+    def feed(self, text):
+        self.chunks.append(text)
+        self.scanner.feed(text)
+        messages = []
+        for kind, key, value in self.parser.feed(text):
+            if kind == 'delta':
+                messages.append(format_sse('markdown', {'delta': value}))
+            else:
+                messages.append(format_sse('field', {'key': key, 'value': value}))
+        return messages
+
+    def finish(self):
+        result = None
+        if self.scanner.done:
+            result, errors = json_extract.validate(self.scanner.value, ORGANIZE_SCHEMA)
+            if errors:
+                result = None
+            else:
+                self.outcome = 'ok'
+        if result is None:
+            extraction = json_extract.extract(self.text, ORGANIZE_SCHEMA)
+            result = extraction.value if extraction.value is not None else organize_fallback(self.content)
+            self.outcome = extraction.outcome or 'failed'
+        return format_sse('result', result)
+
+
+# ==================== 批量分类 ====================
+
+class ClassifyBatch:
+    """
+    批量分类的打包与结果组装（模型调用由调用方以同步或异步方式完成）
+    条目为字符串或 {"id": ..., "content": ...}；内容相同的条目只分类一次，每 batch_size 条打包为一个提示，
+    批量结果中缺失或无法解析的条目由调用方逐条重新分类（见 missing）
+    传入 classifier（local_classifier.LocalClassifier）时，本地能确定的条目不再打包，模型结果也交给它学习
+    """
+
+    def __init__(self, raw_items, batch_size, classifier=None):
+        self.items = []
+        for index, raw in enumerate(raw_items):
+            if isinstance(raw, str):
+                self.items.append((str(index), raw))
+            elif isinstance(raw, dict):
+                self.items.append((str(raw.get('id', index)), raw.get('content') or ''))
+            else:
+                raise ValueError('Each item must be a string or an object with "id" and "content"')
+        self.unique = list(dict.fromkeys(content for _, content in self.items if content))
+        self.classifier = classifier
+        # 内容 -> 分类结果
+        self.results = {}
+        if classifier is not None:
+            for content in self.unique:
+                result = classifier.classify(content)
+                if result is not None:
+                    self.results[content] = result
+        remaining = self.missing()
+        self.chunks = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
+
+    def _add_model_result(self, content, result, source):
+        if self.classifier is not None:
+            self.classifier.learn(content, result)
+        self.results[content] = dict(result, source=source)
+
+    def add_batch_response(self, chunk, response_text):
+        for index, result in parse_classify_batch_response(response_text, len(chunk)).items():
+            self._add_model_result(chunk[index], result, 'batch')
+
+    def missing(self):
+        return [content for content in self.unique if content not in self.results]
+
+    def add_single_response(self, content, response_text):
+        self._add_model_result(content, parse_classify_response(response_text), 'single')
+
+    def add_error(self, content, error):
+        self.results[content] = {'error': str(error), 'source': 'single'}
+
+    def output(self):
+        """按请求顺序返回每个条目的结果"""
+        output = []
+        for item_id, content in self.items:
+            if content:
+                output.append({'id': item_id, **self.results[content]})
+            else:
+                output.append({'id': item_id, 'error': 'Content is required'})
+        return output
+
+
+# ==================== 长文分块整理 ====================
+
+SENTENCE_ENDS = '。！？!?.；;\n'
+
+
+def _split_line(line, max_chars):
+    """超长的行优先在句末切开，找不到合适的句末时按长度硬切"""
+    pieces = []
+    while len(line) > max_chars:
+        cut = max(line.rfind(char, 0, max_chars) for char in SENTENCE_ENDS) + 1
+        if cut < max_chars // 2:
+            cut = max_chars
+        pieces.append(line[:cut])
+        line = line[cut:]
+    if line:
+        pieces.append(line)
+    return pieces
+
+
+def _markdown_blocks(content):
+    """按空行与标题切分为段落块，代码块（``` 或 ~~~ 包围）内部不切分"""
+    blocks = []
+    current = []
+    in_fence = False
+    for line in content.splitlines(keepends=True):
+        stripped = line.strip()
+        if not in_fence and stripped.startswith('#') and current:
+            blocks.append(''.join(current))
+            current = []
+        current.append(line)
+        if stripped.startswith(('```', '~~~')):
+            in_fence = not in_fence
+        elif not in_fence and not stripped:
+            blocks.append(''.join(current))
+            current = []
+    if current:
+        blocks.append(''.join(current))
+    return blocks
+
+
+def _split_block(block, max_chars):
+    """切分超长段落块；切开的代码块在每一段首尾补上围栏，保持各段自身完整"""
+    if len(block) <= max_chars:
+        return [block]
+    pieces = []
+    current = ''
+    for line in block.splitlines(keepends=True):
+        for piece in _split_line(line, max_chars):
+            if current and len(current) + len(piece) > max_chars:
+                pieces.append(current)
+                current = ''
+            current += piece
+    if current:
+        pieces.append(current)
+    opening = block.lstrip().split('\n', 1)[0].strip()
+    if opening.startswith(('```', '~~~')) and len(pieces) > 1:
+        fence = opening[:3]
+        pieces = [(opening + '\n' if index else '') + piece.rstrip('\n') +
+                  ('\n' + fence + '\n' if index < len(pieces) - 1 else '\n')
+                  for index, piece in enumerate(pieces)]
+    return pieces
+
+
+def _merge_neighbours(chunks, max_chunks):
+    """分块数超过上限时，反复合并相邻两块中合计最短的一对"""
+    chunks = list(chunks)
+    while len(chunks) > max(max_chunks, 1):
+        index = min(range(len(chunks) - 1), key=lambda i: len(chunks[i]) + len(chunks[i + 1]))
+        chunks[index:index + 2] = [chunks[index] + '\n\n' + chunks[index + 1]]
+    return chunks
+
+
+def split_content(content, max_chars, max_chunks=None):
+    """
+    将长文切分为不超过 max_chars 的分块：在段落边界切分，已过半时优先从标题处另起一块；
+    超长段落按行、超长行按句切分；给出 max_chunks 时，超出的分块与相邻分块合并（合并后可能超过 max_chars）
+    """
+    if len(content) <= max_chars:
+        return [content]
+    chunks = []
+    current = ''
+    for block in _markdown_blocks(content):
+        for piece in _split_block(block, max_chars):
+            heading = piece.lstrip().startswith('#')
+            if current and (len(current) + len(piece) > max_chars or (heading and len(current) >= max_chars // 2)):
+                chunks.append(current)
+                current = ''
+            current += piece
+    chunks.append(current)
+    chunks = [chunk.strip() for chunk in chunks if chunk.strip()]
+    return _merge_neighbours(chunks, max_chunks) if max_chunks else chunks
+
+
+def _dedupe_key(text):
+    return ''.join(str(text).split()).lower()
+
+
+class OrganizeMapReduce:
+    """
+    长文整理：超过 chunk_chars 的内容切分后逐块整理（map，模型调用由调用方并行完成），再合并（reduce）：
+    organized_markdown 按顺序拼接，key_dates 与 key_points 去重，各部分摘要交给模型汇总为一句话（见 summary_prompt）
+    分块数不超过 max_chunks，内容更长时相应增大分块；整理失败的分块保留原文，并在 chunks 中记录错误
+    """
+
+    def __init__(self, content, note_type, chunk_chars, max_chunks):
+        self.content = content
+        self.note_type = note_type
+        chunk_chars = max(chunk_chars, math.ceil(len(content) / max_chunks))
+        self.chunks = split_content(content, chunk_chars, max_chunks)
+        self.results = [None] * len(self.chunks)
+        self.seconds = [0.0] * len(self.chunks)
+        self.errors = [None] * len(self.chunks)
+
+    def prompts(self):
+        total = len(self.chunks)
+        return [organize_prompt(chunk, self.note_type, part=(index, total))
+                for index, chunk in enumerate(self.chunks, 1)]
+
+    def add_chunk_response(self, index, response_text, seconds):
+        self.results[index] = parse_organize_response(response_text, self.chunks[index])
+        self.seconds[index] = seconds
+
+    def add_chunk_error(self, index, error, seconds):
+        """分块整理失败：保留该块原文，不参与摘要汇总"""
+        self.results[index] = dict(organize_fallback(self.chunks[index]), summary='')
+        self.seconds[index] = seconds
+        self.errors[index] = error
+
+    def failed(self):
+        """所有分块都整理失败（调用方应返回错误而不是原文）"""
+        return all(error is not None for error in self.errors)
+
+    def summaries(self):
+        return [result.get('summary') for result in self.results
+                if isinstance(result.get('summary'), str) and result.get('summary')]
+
+    def needs_summary(self):
+        return len(self.summaries()) > 1
+
+    def summary_prompt(self):
+        return summary_prompt(self.summaries(), self.note_type)
+
+    def output(self, summary_response_text='', reduce_seconds=0.0):
+        markdown = []
+        key_dates = []
+        key_points = []
+        seen_dates = set()
+        seen_points = set()
+        for result in self.results:
+            section = result.get('organized_markdown')
+            if isinstance(section, str) and section.strip():
+                markdown.append(section.strip())
+            for entry in result.get('key_dates') or []:
+                if not isinstance(entry, dict):
+                    continue
+                key = (str(entry.get('date', '')).strip(), _dedupe_key(entry.get('description', '')))
+                if key not in seen_dates:
+                    seen_dates.add(key)
+                    key_dates.append(entry)
+            for point in result.get('key_points') or []:
+                key = _dedupe_key(point)
+                if key and key not in seen_points:
+                    seen_points.add(key)
+                    key_points.append(point)
+        summaries = self.summaries()
+        if self.needs_summary():
+            summary = parse_summary_response(summary_response_text, summaries)
+        else:
+            summary = summaries[0] if summaries else 'Content received'
+        return {
+            'organized_markdown': '\n\n'.join(markdown),
+            'key_dates': key_dates,
+            'key_points': key_points,
+            'summary': summary,
+            'chunks': [dict({'index': index, 'chars': len(chunk), 'seconds': round(seconds, 3)},
+                            **({'error': str(error)} if error is not None else {}))
+                       for index, (chunk, seconds, error) in enumerate(zip(self.chunks, self.seconds, self.errors))],
+            'reduce_seconds': round(reduce_seconds, 3)
+        }
@@ -1,11 +1,32 @@
 import os
 import json
+import time
+import base64
+import bisect
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from storage import create_store, shard_file_name, NOTES_LAYOUTS
+from index_cache import IndexCache
+from search_index import SearchIndex, make_snippet
+from blob_store import BlobStore
+from llm_cache import LLMCache, make_cache_key
+import ai_tasks
+import json_extract
+from llm_transport import LLMTransport, CircuitBreaker, SharedRateLimiter, LLMError
+from local_classifier import LocalClassifier, bootstrap_samples
+from similar_notes import SimilarNotesIndex
+from related_notes import RelatedNotesIndex, NUMPY_AVAILABLE
+from timeline_index import TimelineIndex, normalize_key_dates, parse_date
+from facet_index import FacetIndex
+from job_queue import JobQueue, FINISHED_STATUSES
 
 # 加载环境变量
 load_dotenv()
@@ -18,66 +39,411 @@ DASHSCOPE_API_KEY = os.getenv('DASHSCOPE_API_KEY')
 if not DASHSCOPE_API_KEY:
     raise ValueError("DASHSCOPE_API_KEY environment variable is required!")
 
-# 创建 OpenAI 客户端（通义千问兼容接口）
-client = OpenAI(
-    api_key=DASHSCOPE_API_KEY,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-)
+# 模型接口（默认通义千问 OpenAI 兼容接口，可指向任意兼容服务，例如测试用的本地桩服务）
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', "https://dashscope.aliyuncs.com/compatible-mode/v1")
+LLM_MODEL = os.getenv('LLM_MODEL', "qwen-plus")
+# 采样参数（同步与异步调用路径共用，也是响应缓存键的一部分）
+LLM_PARAMS = {'temperature': 0.7, 'top_p': 0.9}
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', 60))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 100))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+# 限流配额（0 表示不限制，共用同一数据目录的所有进程合计）：每分钟请求数与 token 数（输入按字符数估计，收到响应后按实际用量修正）
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 600))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 1000000))
 
 DATA_DIR = Path('./data')
 NOTES_DIR = DATA_DIR / 'notes'
 INDEX_FILE = DATA_DIR / 'index.json'
+INDEX_JOURNAL_FILE = DATA_DIR / 'index.journal'
+INDEX_JOURNAL_MAX_BYTES = int(os.getenv('INDEX_JOURNAL_MAX_BYTES', 1024 * 1024))
+
+# 存储后端：json（默认）或 sqlite
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+SQLITE_DB_FILE = Path(os.getenv('SQLITE_DB_FILE', DATA_DIR / 'notes.sqlite3'))
+SQLITE_STORE_BODIES = os.getenv('SQLITE_STORE_BODIES', 'False').lower() == 'true'
+
+# 新笔记的目录布局：flat（默认）、month（YYYY/MM/）或 hash；已有笔记用 migrate.py reshard 迁移
+NOTES_LAYOUT = os.getenv('NOTES_LAYOUT', 'flat')
+if NOTES_LAYOUT not in NOTES_LAYOUTS:
+    raise ValueError(f"NOTES_LAYOUT must be one of {', '.join(NOTES_LAYOUTS)}")
+
+# 内容寻址正文存储：大段落去重并压缩存入 data/blobs（默认关闭，笔记文件保持为完整 Markdown）
+BLOB_STORE_ENABLED = os.getenv('BLOB_STORE_ENABLED', 'False').lower() == 'true'
+BLOB_DIR = DATA_DIR / 'blobs'
+BLOB_COMPRESSION = os.getenv('BLOB_COMPRESSION', 'gzip')
+BLOB_MIN_BYTES = int(os.getenv('BLOB_MIN_BYTES', 256))
+BLOB_GC_GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', 300))
+
+# 大模型响应缓存：进程内 LRU + data/ 下的 SQLite，请求体中 "no_cache": true 可跳过
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_CACHE_FILE = Path(os.getenv('LLM_CACHE_FILE', DATA_DIR / 'llm_cache.sqlite3'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', 512))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 10000))
+
+# 批量分类：每个提示打包的条目数、单次请求的条目上限与并行提示数
+CLASSIFY_BATCH_SIZE = int(os.getenv('CLASSIFY_BATCH_SIZE', 20))
+CLASSIFY_BATCH_MAX_ITEMS = int(os.getenv('CLASSIFY_BATCH_MAX_ITEMS', 500))
+CLASSIFY_BATCH_WORKERS = int(os.getenv('CLASSIFY_BATCH_WORKERS', 4))
+
+# 长文整理：超过 ORGANIZE_CHUNK_CHARS 个字符的内容分块并行整理后合并；分块数上限与并行数
+ORGANIZE_CHUNK_CHARS = int(os.getenv('ORGANIZE_CHUNK_CHARS', 6000))
+ORGANIZE_MAX_CHUNKS = int(os.getenv('ORGANIZE_MAX_CHUNKS', 20))
+ORGANIZE_WORKERS = int(os.getenv('ORGANIZE_WORKERS', 4))
+
+# 本地快速分类：规则与朴素贝叶斯模型足够确定时不调用大模型；模型以最近的笔记与剪切板历史冷启动，
+# 每个类别都有 LOCAL_CLASSIFIER_MIN_CLASS_DOCS 篇样本、且预测类别的留出准确率不低于 LOCAL_CLASSIFIER_MIN_CONFIDENCE 时才回答
+LOCAL_CLASSIFIER_ENABLED = os.getenv('LOCAL_CLASSIFIER_ENABLED', 'True').lower() == 'true'
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv('LOCAL_CLASSIFIER_MIN_CONFIDENCE', 0.95))
+LOCAL_CLASSIFIER_MIN_CLASS_DOCS = int(os.getenv('LOCAL_CLASSIFIER_MIN_CLASS_DOCS', 20))
+LOCAL_CLASSIFIER_MAX_NOTES = int(os.getenv('LOCAL_CLASSIFIER_MAX_NOTES', 2000))
+CLIPBOARD_HISTORY_FILE = Path(os.getenv('CLIPBOARD_HISTORY_FILE', './clipboard_history.json'))
+
+# 合并建议：交给大模型的相似候选数与最低相似度；最相似笔记的相似度不低于 MERGE_AUTO_THRESHOLD 时直接建议合并
+MERGE_CANDIDATES = int(os.getenv('MERGE_CANDIDATES', 5))
+MERGE_MIN_SIMILARITY = float(os.getenv('MERGE_MIN_SIMILARITY', 0.2))
+MERGE_AUTO_THRESHOLD = float(os.getenv('MERGE_AUTO_THRESHOLD', 0.8))
+
+# 相关笔记：TF-IDF 矩阵保存在 RELATED_NOTES_DIR，累计 RELATED_NOTES_FLUSH_ROWS 行变化后写回（需要 numpy）
+RELATED_NOTES_ENABLED = os.getenv('RELATED_NOTES_ENABLED', 'True').lower() == 'true'
+RELATED_NOTES_DIR = Path(os.getenv('RELATED_NOTES_DIR', DATA_DIR / 'related'))
+RELATED_NOTES_FLUSH_ROWS = int(os.getenv('RELATED_NOTES_FLUSH_ROWS', 64))
+RELATED_NOTES_MAX_LIMIT = 50
+
+# 时间线查询每页条数
+TIMELINE_DEFAULT_LIMIT = 200
+TIMELINE_MAX_LIMIT = 1000
+
+# 后台任务队列：工作线程数（0 表示本进程只提交不执行）、租约时长、最多执行次数、结束任务的保留时间、长轮询上限
+JOBS_DB_FILE = Path(os.getenv('JOBS_DB_FILE', DATA_DIR / 'jobs.sqlite3'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 7 * 24 * 3600))
+JOB_WAIT_MAX_SECONDS = 60
 
 # 创建必要的目录
 DATA_DIR.mkdir(exist_ok=True)
 NOTES_DIR.mkdir(exist_ok=True)
 
-# 初始化索引文件
-if not INDEX_FILE.exists():
-    INDEX_FILE.write_text(json.dumps([], ensure_ascii=False, indent=2))
+# 模型调用传输层：并发上限、限流（配额保存在任务数据库中，所有进程共用）、截止时间、重试与熔断
+llm = LLMTransport(
+    api_key=DASHSCOPE_API_KEY,
+    base_url=LLM_BASE_URL,
+    model=LLM_MODEL,
+    params=LLM_PARAMS,
+    timeout=LLM_TIMEOUT_SECONDS,
+    max_retries=LLM_MAX_RETRIES,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET_SECONDS),
+    rate_limiter=SharedRateLimiter(JOBS_DB_FILE, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE),
+)
+
+# 搜索分页
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# 笔记列表分页
+NOTES_DEFAULT_LIMIT = 50
+NOTES_MAX_LIMIT = 500
+NOTES_SORT_FIELDS = ('created_at', 'updated_at')
+
+# 初始化存储后端
+store = create_store(STORAGE_BACKEND, DATA_DIR, NOTES_DIR, INDEX_FILE,
+                     sqlite_file=SQLITE_DB_FILE, store_bodies=SQLITE_STORE_BODIES,
+                     journal_file=INDEX_JOURNAL_FILE, compact_threshold=INDEX_JOURNAL_MAX_BYTES)
+
+# 关闭时仍需还原已有的引用，因此始终挂载，只是不再打包新内容
+store.blob_store = BlobStore(BLOB_DIR, enabled=BLOB_STORE_ENABLED, compression=BLOB_COMPRESSION,
+                             min_size=BLOB_MIN_BYTES, gc_grace_seconds=BLOB_GC_GRACE_SECONDS,
+                             lock=store.write_lock)
+
+llm_cache = LLMCache(LLM_CACHE_FILE, memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+                     max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS) if LLM_CACHE_ENABLED else None
+
+# 进程内索引缓存（id 查找表 + 类型分组）
+notes_index = IndexCache(store)
+
+# 全文倒排索引（首次搜索时建立，随增删改增量更新）
+search_index = SearchIndex(store, notes_index)
+
+# 相似笔记检索（MinHash LSH，首次合并建议时建立，随增删改增量更新）
+similar_notes = SimilarNotesIndex(store, notes_index)
+
+# 相关笔记（TF-IDF 余弦相似度，首次查询时加载或建立，随增删改增量更新）
+related_notes = RelatedNotesIndex(store, notes_index, RELATED_NOTES_DIR, flush_rows=RELATED_NOTES_FLUSH_ROWS) \
+    if RELATED_NOTES_ENABLED and NUMPY_AVAILABLE else None
+if RELATED_NOTES_ENABLED and not NUMPY_AVAILABLE:
+    print("⚠️  numpy not available. Related notes are disabled (pip install -r requirements.txt).")
+
+# 重要日期时间线（首次查询时建立，随增删改增量更新）
+timeline_index = TimelineIndex(notes_index)
+
+# 类型/标签/固定状态的分面索引（首次筛选时建立，随增删改增量更新）
+facet_index = FacetIndex(notes_index)
+
+# 本地快速分类（首次分类时训练）
+local_classifier = LocalClassifier(
+    min_confidence=LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+    min_class_docs=LOCAL_CLASSIFIER_MIN_CLASS_DOCS,
+    bootstrap=lambda: bootstrap_samples(CLIPBOARD_HISTORY_FILE, store, notes_index.all(),
+                                        max_notes=LOCAL_CLASSIFIER_MAX_NOTES)
+) if LOCAL_CLASSIFIER_ENABLED else None
 
 
 # ==================== 工具函数 ====================
 
 def get_index():
-    """获取索引文件内容"""
-    try:
-        return json.loads(INDEX_FILE.read_text(encoding='utf-8'))
-    except:
-        return []
+    """获取索引内容（来自内存缓存，只读）"""
+    return notes_index.all()
 
 
-def save_index(index_data):
-    """保存索引文件"""
-    INDEX_FILE.write_text(json.dumps(index_data, ensure_ascii=False, indent=2), encoding='utf-8')
+_filename_lock = threading.Lock()
+_last_filename = {'base': None, 'seq': 0}
 
 
 def generate_filename():
-    """生成唯一的文件名"""
-    return datetime.now().strftime('%Y%m%d_%H%M%S')
+    """生成唯一的文件名（同一秒内生成多个时依次追加序号）"""
+    with _filename_lock:
+        base = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if base != _last_filename['base']:
+            _last_filename['base'] = base
+            _last_filename['seq'] = 0
+        while True:
+            seq = _last_filename['seq']
+            _last_filename['seq'] += 1
+            filename = base if seq == 0 else f"{base}_{seq}"
+            if notes_index.get(filename) is None:
+                return filename
+
+
+def release_blobs(digests):
+    """回收不再被任何笔记引用的正文内容"""
+    if digests:
+        store.blob_store.collect(digests, notes_index.blob_refcount)
+
+
+def _sync_derived_indexes(added=(), updated=(), removed=()):
+    """
+    笔记写入索引后同步全文、相似、相关笔记、时间线与分面索引，所有写入路径都经由这里
+    added / updated 为 [(索引条目, 正文)]，正文为 None 表示未改动（从存储读取）；removed 为笔记 id 列表
+    """
+    changed = [*added, *updated]
+    for index_item, markdown_content in changed:
+        if markdown_content is None:
+            markdown_content = store.read_body(index_item) or ''
+        search_index.add_document(index_item, markdown_content)
+        similar_notes.add_document(index_item, markdown_content)
+        if related_notes is not None:
+            related_notes.add_document(index_item, markdown_content)
+        timeline_index.add_document(index_item)
+    facet_index.add_documents([index_item for index_item, _ in changed])
+    if removed:
+        search_index.remove_documents(removed)
+        similar_notes.remove_documents(removed)
+        if related_notes is not None:
+            related_notes.remove_documents(removed)
+        timeline_index.remove_documents(removed)
+        facet_index.remove_documents(removed)
+
+
+def create_note(data):
+    """构造并保存一条笔记（正文、索引与派生索引），返回索引条目"""
+    index_item, markdown_content = build_note(data)
+    store.write_body(index_item, markdown_content)
+    notes_index.add(index_item)
+    _sync_derived_indexes(added=[(index_item, markdown_content)])
+    return index_item
+
+
+def build_note(data):
+    """根据请求数据构造索引条目与 Markdown 正文"""
+    title = data.get('title', 'Untitled')
+    note_type = data.get('type', '零散知识')
+    original_content = data.get('original_content', '')
+    organized_markdown = data.get('organized_markdown', '')
+    summary = data.get('summary', '')
+    
+    # 生成文件名
+    filename = generate_filename()
+    file_name = shard_file_name(f"{filename}_{note_type}.md", NOTES_LAYOUT)
+    
+    # 构造 Markdown 内容
+    markdown_content = f"""# {title}
 
+**类型**: {note_type}  
+**创建时间**: {datetime.now().isoformat()}  
+**文件ID**: {filename}
+
+---
+
+## 原始内容
+
+{original_content}
+
+---
+
+## AI 整理内容
+
+{organized_markdown}
+
+---
+
+## 元数据
+
+- 摘要: {summary}
+- 类型: {note_type}
+"""
+    
+    index_item = {
+        'id': filename,
+        'title': title,
+        'type': note_type,
+        'summary': summary,
+        'file_name': file_name,
+        'created_at': datetime.now().isoformat(),
+        'updated_at': datetime.now().isoformat(),
+        'tags': data.get('tags', []),
+        'key_dates': normalize_key_dates(data.get('key_dates'))
+    }
+    return index_item, markdown_content
+
+
+def cache_bypassed():
+    """当前请求是否要求跳过响应缓存（请求体 "no_cache": true 或请求头 Cache-Control: no-cache）"""
+    data = request.get_json(silent=True) or {}
+    return bool(data.get('no_cache')) or 'no-cache' in request.headers.get('Cache-Control', '')
+
+
+def llm_cache_key(prompt, system_message):
+    """响应缓存键，未启用缓存时返回 None"""
+    return make_cache_key(LLM_MODEL, system_message, prompt, **LLM_PARAMS) if llm_cache else None
+
+
+def ensure_json(content, schema, task):
+    """
+    响应中提取不出符合 schema 的 JSON 时请求模型修复一次；返回 (响应, 是否可用)，修复失败时返回原响应（由解析函数兜底）
+    解析结果计入 json_extract.parse_stats
+    """
+    check = json_extract.ResponseCheck(content, schema, task)
+    repaired = ''
+    if check.prompt:
+        try:
+            repaired = llm.complete(check.prompt, json_extract.REPAIR_SYSTEM_MESSAGE)
+        except LLMError:
+            pass
+    return check.finish(repaired)
+
+
+def call_dashscope_api(prompt, system_message=ai_tasks.DEFAULT_SYSTEM_MESSAGE, use_cache=True,
+                       schema=None, task=''):
+    """
+    调用大模型（OpenAI 兼容接口），失败时抛出 LLMError
+    成功的响应写入缓存；use_cache=False 时跳过读取缓存，但仍以新结果刷新缓存
+    传入 schema 时检查响应格式（见 ensure_json），修复后的响应代替原响应写入缓存，仍不可用的响应不写入缓存；
+    缓存中不符合 schema 的响应视为未命中
+    """
+    cache_key = llm_cache_key(prompt, system_message)
+    if cache_key and use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None and json_extract.conforms(cached, schema):
+            return cached
+    content = llm.complete(prompt, system_message)
+    usable = True
+    if schema is not None:
+        content, usable = ensure_json(content, schema, task)
+    if cache_key and usable:
+        llm_cache.put(cache_key, content)
+    return content
+
+
+def classify_locally(content, data):
+    """本地快速分类，未启用、请求体 "force_llm": true 或不够确定时返回 None"""
+    if local_classifier is None or data.get('force_llm'):
+        return None
+    return local_classifier.classify(content)
+
+
+def classify(content, data, use_cache=True):
+    """分类内容：本地快速分类优先，不够确定时调用模型；结果带 source 字段"""
+    result = classify_locally(content, data)
+    if result is not None:
+        return result
+    response_text = call_dashscope_api(ai_tasks.classify_prompt(content),
+                                       system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                       use_cache=use_cache, schema=ai_tasks.CLASSIFY_SCHEMA, task='classify')
+    result = ai_tasks.parse_classify_response(response_text)
+    if local_classifier:
+        local_classifier.learn(content, result)
+    return dict(result, source='llm')
+
+
+def organize_long(content, note_type, use_cache=True):
+    """
+    长文整理：分块并行整理（map），合并结果并由模型汇总摘要（reduce），结果带各分块耗时
+    单个分块调用失败时保留该块原文，全部失败时抛出第一个分块的 LLMError
+    """
+    job = ai_tasks.OrganizeMapReduce(content, note_type, ORGANIZE_CHUNK_CHARS, ORGANIZE_MAX_CHUNKS)
+    
+    def organize_chunk(prompt):
+        started = time.perf_counter()
+        try:
+            response_text = call_dashscope_api(prompt, system_message=ai_tasks.ORGANIZE_SYSTEM_MESSAGE,
+                                               use_cache=use_cache, schema=ai_tasks.ORGANIZE_SCHEMA, task='organize')
+        except LLMError as e:
+            return None, e, time.perf_counter() - started
+        return response_text, None, time.perf_counter() - started
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(ORGANIZE_WORKERS, len(job.chunks)))) as pool:
+        for index, (response_text, error, seconds) in enumerate(pool.map(organize_chunk, job.prompts())):
+            if error is None:
+                job.add_chunk_response(index, response_text, seconds)
+            else:
+                job.add_chunk_error(index, error, seconds)
+    if job.failed():
+        raise job.errors[0]
+    
+    started = time.perf_counter()
+    summary_text = ''
+    if job.needs_summary():
+        try:
+            summary_text = call_dashscope_api(job.summary_prompt(), use_cache=use_cache,
+                                              schema=ai_tasks.SUMMARY_SCHEMA, task='summary')
+        except LLMError:
+            # 汇总失败时拼接各部分摘要
+            pass
+    return job.output(summary_text, time.perf_counter() - started)
+
+
+def organize(content, note_type, use_cache=True):
+    """整理内容并提取重要时间点，超长内容分块整理"""
+    if len(content) > ORGANIZE_CHUNK_CHARS:
+        return organize_long(content, note_type, use_cache)
+    response_text = call_dashscope_api(ai_tasks.organize_prompt(content, note_type),
+                                       system_message=ai_tasks.ORGANIZE_SYSTEM_MESSAGE,
+                                       use_cache=use_cache, schema=ai_tasks.ORGANIZE_SCHEMA, task='organize')
+    return ai_tasks.parse_organize_response(response_text, content)
+
+
+def run_classify_job(payload):
+    return classify(payload['content'], payload, use_cache=not payload.get('no_cache'))
+
+
+def run_organize_job(payload):
+    return organize(payload['content'], payload.get('note_type', ''), use_cache=not payload.get('no_cache'))
 
-def call_dashscope_api(prompt, system_message="You are a helpful AI assistant."):
-    """调用通义千问 API (OpenAI 兼容接口)"""
-    try:
-        # 使用通义千问 OpenAI 兼容接口
-        completion = client.chat.completions.create(
-            model="qwen-plus",  # 使用正确的模型名称
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            top_p=0.9
-        )
-        # 处理响应
-        if hasattr(completion, 'choices') and len(completion.choices) > 0:
-            return completion.choices[0].message.content
-        return "Error: No valid response from API"
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return f"Error calling Dashscope API: {str(e)}"
+
+def is_transient_error(error):
+    """上游超时、限流、熔断等暂时性故障，后台任务稍后重试"""
+    return isinstance(error, LLMError) and error.transient
+
+
+# 后台任务队列（任务类型 -> 执行函数）；工作线程由服务入口启动（见 __main__ 与 asgi_app 的 lifespan），导入时不启动
+job_queue = JobQueue(JOBS_DB_FILE, {'classify': run_classify_job, 'organize': run_organize_job},
+                     workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                     retention_seconds=JOB_RETENTION_SECONDS, is_transient=is_transient_error)
 
 
 # ==================== API 端点 ====================
@@ -96,7 +462,16 @@ def index():
 
 def health():
     """健康检查"""
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'llm': llm.stats(),
+        'llm_cache': llm_cache.stats() if llm_cache else None,
+        'local_classifier': local_classifier.stats() if local_classifier else None,
+        'job_queue': job_queue.stats(),
+        'related_notes': related_notes.stats() if related_notes else None,
+        'json_parse': json_extract.parse_stats.stats()
+    })
 
 
 @app.route('/api/classify-content', methods=['POST'])
@@ -104,6 +479,7 @@ def classify_content():
     """
     第一部分 AI 分类
     判断内容是否应为笔记，返回笔记类型
+    source 字段说明结果来源：rules / model / duplicate 为本地判定，llm 为大模型判定
     """
     try:
         data = request.json
@@ -112,45 +488,70 @@ def classify_content():
         if not content:
             return jsonify({'error': 'Content is required'}), 400
         
-        # 构造 AI 分类提示
-        classification_prompt = f"""请分析以下内容，确定它是否应该被保存为笔记。
-
-内容：
-{content}
+        return jsonify(classify(content, data, use_cache=not cache_bypassed()))
+    
+    except LLMError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-请按以下 JSON 格式回复：
-{{
-    "is_note": true/false,
-    "note_type": "待办事项/零散知识/灵感想法/参考材料/会议记录/代码片段/其他",
-    "confidence": 0-1之间的置信度,
-    "reason": "简要说明理由"
-}}
 
-只返回 JSON，不要其他文本。"""
+@app.route('/api/classify-batch', methods=['POST'])
+def classify_batch():
+    """
+    批量分类
+    请求体：{"items": ["内容", {"id": "a", "content": "内容"}, ...]}
+    本地快速分类能确定的条目直接返回，其余多条内容打包进一个提示（并行发送多个提示），批量结果中缺失的条目再逐条分类
+    每条结果的 source：rules / model / duplicate（本地）、batch（批量提示）、single（逐条重试）
+    """
+    try:
+        data = request.json or {}
+        raw_items = data.get('items', [])
         
-        response_text = call_dashscope_api(classification_prompt, 
-                                           system_message="You are a content classification expert.")
+        if not raw_items:
+            return jsonify({'error': 'No items provided'}), 400
+        if len(raw_items) > CLASSIFY_BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {CLASSIFY_BATCH_MAX_ITEMS} items per request'}), 400
         
-        # 提取 JSON
         try:
-            # 清理响应文本
-            json_str = response_text.strip()
-            if json_str.startswith('```json'):
-                json_str = json_str[7:]
-            if json_str.startswith('```'):
-                json_str = json_str[3:]
-            if json_str.endswith('```'):
-                json_str = json_str[:-3]
-            
-            result = json.loads(json_str.strip())
-            return jsonify(result)
-        except json.JSONDecodeError:
-            return jsonify({
-                'is_note': True,
-                'note_type': '零散知识',
-                'confidence': 0.7,
-                'reason': 'AI 响应格式处理中'
-            })
+            batch = ai_tasks.ClassifyBatch(raw_items, CLASSIFY_BATCH_SIZE,
+                                           classifier=None if data.get('force_llm') else local_classifier)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        use_cache = not cache_bypassed()
+        
+        def classify_chunk(chunk):
+            try:
+                return call_dashscope_api(ai_tasks.classify_batch_prompt(chunk),
+                                          system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                          use_cache=use_cache, schema=ai_tasks.CLASSIFY_BATCH_SCHEMA,
+                                          task='classify_batch')
+            except LLMError:
+                # 整批失败时由下方逐条重试
+                return ''
+        
+        def classify_single(content):
+            try:
+                return call_dashscope_api(ai_tasks.classify_prompt(content),
+                                          system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                          use_cache=use_cache, schema=ai_tasks.CLASSIFY_SCHEMA,
+                                          task='classify'), None
+            except LLMError as e:
+                return None, e
+        
+        workers = max(1, min(CLASSIFY_BATCH_WORKERS, len(batch.unique)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk, response_text in zip(batch.chunks, pool.map(classify_chunk, batch.chunks)):
+                batch.add_batch_response(chunk, response_text)
+            missing = batch.missing()
+            for content, (response_text, error) in zip(missing, pool.map(classify_single, missing)):
+                if error is not None:
+                    batch.add_error(content, error)
+                else:
+                    batch.add_single_response(content, response_text)
+        
+        results = batch.output()
+        return jsonify({'results': results, 'count': len(results)})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -169,54 +570,19 @@ def suggest_merge():
         if not content:
             return jsonify({'error': 'Content is required'}), 400
         
-        # 获取索引
-        index = get_index()
-        
-        # 构造合并建议提示
-        existing_notes = [item for item in index if item.get('type') == note_type]
-        existing_titles = '\n'.join([f"- {item['title']}" for item in existing_notes[:5]])
-        
-        merge_prompt = f"""请分析以下新内容，判断是否应该与现有笔记合并。
-
-新内容摘要：
-{content[:200]}
-
-笔记类型：{note_type}
-
-现有同类笔记标题（如有）：
-{existing_titles if existing_titles else '暂无'}
-
-请按以下 JSON 格式回复：
-{{
-    "should_merge": true/false,
-    "merge_target": "目标笔记标题（如不需合并则为null）",
-    "merge_reason": "合并理由",
-    "confidence": 0-1之间的置信度
-}}
-
-只返回 JSON，不要其他文本。"""
-        
-        response_text = call_dashscope_api(merge_prompt)
-        
-        try:
-            json_str = response_text.strip()
-            if json_str.startswith('```json'):
-                json_str = json_str[7:]
-            if json_str.startswith('```'):
-                json_str = json_str[3:]
-            if json_str.endswith('```'):
-                json_str = json_str[:-3]
-            
-            result = json.loads(json_str.strip())
+        # 只把内容最相似的同类笔记交给大模型；没有相似笔记或高度重合时直接返回
+        candidates = similar_notes.query(content, k=MERGE_CANDIDATES, note_type=note_type,
+                                         min_similarity=MERGE_MIN_SIMILARITY)
+        result = ai_tasks.merge_without_llm(candidates, MERGE_AUTO_THRESHOLD)
+        if result is not None:
             return jsonify(result)
-        except json.JSONDecodeError:
-            return jsonify({
-                'should_merge': False,
-                'merge_target': None,
-                'merge_reason': 'AI 响应格式处理中',
-                'confidence': 0.5
-            })
+        response_text = call_dashscope_api(ai_tasks.merge_prompt(content, note_type, candidates),
+                                           use_cache=not cache_bypassed(), schema=ai_tasks.MERGE_SCHEMA,
+                                           task='merge')
+        return jsonify(ai_tasks.parse_merge_response(response_text, candidates))
     
+    except LLMError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -235,137 +601,329 @@ def organize_content():
         if not content:
             return jsonify({'error': 'Content is required'}), 400
         
-        # 构造整理提示
-        organize_prompt = f"""请整理以下内容为结构化 Markdown，并提取重要时间点。
+        return jsonify(organize(content, note_type, use_cache=not cache_bypassed()))
+    
+    except LLMError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-原始内容：
-{content}
 
-笔记类型：{note_type}
+@app.route('/api/organize-content/stream', methods=['POST'])
+def organize_content_stream():
+    """
+    流式整理：以 Server-Sent Events 边生成边返回（事件格式见 ai_tasks.OrganizeStream）
+    连接建立前的失败返回 JSON 错误；生成过程中的失败以 error 事件通知
+    """
+    try:
+        data = request.json
+        content = data.get('content', '')
+        note_type = data.get('note_type', '')
+        
+        if not content:
+            return jsonify({'error': 'Content is required'}), 400
+        
+        prompt = ai_tasks.organize_prompt(content, note_type)
+        cache_key = llm_cache_key(prompt, ai_tasks.ORGANIZE_SYSTEM_MESSAGE)
+        cached = llm_cache.get(cache_key) if cache_key and not cache_bypassed() else None
+        upstream = None
+        if cached is not None:
+            chunks = [cached]
+        else:
+            upstream = llm.stream(prompt, ai_tasks.ORGANIZE_SYSTEM_MESSAGE)
+            # 取得第一段后再开始响应，上游不可用时仍能返回正确的状态码
+            chunks = itertools.chain([next(upstream, '')], upstream)
+    
+    except LLMError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        streamer = ai_tasks.OrganizeStream(content)
+        try:
+            for chunk in chunks:
+                for message in streamer.feed(chunk):
+                    yield message
+                if streamer.complete:
+                    # JSON 已完整，不再读取模型其后的说明文字
+                    break
+            result = streamer.finish()
+            if cached is None:
+                json_extract.parse_stats.record('organize_stream', streamer.outcome)
+                # 只缓存能解析出完整结果的输出，兜底结果不写入缓存
+                if cache_key and streamer.outcome != 'failed':
+                    llm_cache.put(cache_key, streamer.text)
+            yield result
+        except LLMError as e:
+            yield ai_tasks.format_sse('error', {'error': str(e), 'status': e.status_code})
+        finally:
+            # 客户端断开时释放上游连接
+            if upstream is not None:
+                upstream.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-请按照以下 JSON 格式回复：
-{{
-    "organized_markdown": "整理后的 Markdown 格式内容",
-    "key_dates": [
-        {{"date": "YYYY-MM-DD", "description": "事件描述"}},
-        ...
-    ],
-    "key_points": ["要点1", "要点2", "要点3"],
-    "summary": "一句话总结"
-}}
 
-只返回 JSON，不要其他文本。"""
+@app.route('/api/ingest', methods=['POST'])
+def ingest():
+    """
+    分类 + 整理 +（可选）保存的一站式流程
+    一次模型调用同时返回分类与整理结果；请求体：{content, note_type?, title?, tags?, save?}
+    """
+    try:
+        data = request.json
+        content = data.get('content', '')
+        note_type = data.get('note_type', '')
+        
+        if not content:
+            return jsonify({'error': 'Content is required'}), 400
         
-        response_text = call_dashscope_api(organize_prompt,
-                                           system_message="You are a content organization expert that outputs well-structured Markdown.")
+        response_text = call_dashscope_api(ai_tasks.ingest_prompt(content, note_type),
+                                           system_message=ai_tasks.INGEST_SYSTEM_MESSAGE,
+                                           use_cache=not cache_bypassed(), schema=ai_tasks.INGEST_SCHEMA,
+                                           task='ingest')
+        result = ai_tasks.parse_ingest_response(response_text, content, note_type)
         
-        try:
-            json_str = response_text.strip()
-            if json_str.startswith('```json'):
-                json_str = json_str[7:]
-            if json_str.startswith('```'):
-                json_str = json_str[3:]
-            if json_str.endswith('```'):
-                json_str = json_str[:-3]
-            
-            result = json.loads(json_str.strip())
-            return jsonify(result)
-        except json.JSONDecodeError:
-            return jsonify({
-                'organized_markdown': content,
-                'key_dates': [],
-                'key_points': [],
-                'summary': 'Content received'
-            })
+        note_data = ai_tasks.ingest_note_data(result, data, content)
+        note = create_note(note_data) if note_data else None
+        result['saved'] = note is not None
+        result['note'] = {'id': note['id'], 'file_name': note['file_name'], 'title': note['title']} if note else None
+        return jsonify(result)
     
+    except LLMError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/save-note', methods=['POST'])
-def save_note():
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
     """
-    保存笔记到本地文件
-    存储：原始内容、AI 整理内容、用户编辑内容
+    提交后台任务，立即返回 202 与任务信息
+    请求体：{"type": "classify" | "organize", "content": "...", "note_type": "...", "no_cache": false, "force_llm": false}
     """
     try:
-        data = request.json
-        title = data.get('title', 'Untitled')
-        note_type = data.get('type', '零散知识')
-        original_content = data.get('original_content', '')
-        organized_markdown = data.get('organized_markdown', '')
-        user_edited_content = data.get('user_edited_content', '')
-        summary = data.get('summary', '')
+        data = request.json or {}
+        job_type = data.get('type', '')
+        content = data.get('content', '')
         
-        # 生成文件名
-        filename = generate_filename()
-        file_path = NOTES_DIR / f"{filename}_{note_type}.md"
+        if not content:
+            return jsonify({'error': 'Content is required'}), 400
         
-        # 构造 Markdown 内容
-        markdown_content = f"""# {title}
+        payload = {key: data[key] for key in ('content', 'note_type', 'no_cache', 'force_llm') if key in data}
+        if 'no-cache' in request.headers.get('Cache-Control', ''):
+            payload['no_cache'] = True
+        try:
+            job = job_queue.submit(job_type, payload)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(job), 202
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-**类型**: {note_type}  
-**创建时间**: {datetime.now().isoformat()}  
-**文件ID**: {filename}
 
----
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """最近提交的任务，可用 ?status=queued|running|done|failed|cancelled 筛选"""
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), NOTES_MAX_LIMIT)
+        jobs = job_queue.list(request.args.get('status', ''), limit)
+        return jsonify({'jobs': jobs, 'count': len(jobs)})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-## 原始内容
 
-{original_content}
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态与结果；?wait=秒数 时长轮询，任务结束或超时后返回（最多 JOB_WAIT_MAX_SECONDS 秒）"""
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), JOB_WAIT_MAX_SECONDS)
+        job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+        
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
----
 
-## AI 整理内容
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    订阅任务状态（Server-Sent Events）：每次状态变化发送 status 事件（内容为任务信息），任务结束后连接关闭
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        current = job
+        yield ai_tasks.format_sse('status', current)
+        while current['status'] not in FINISHED_STATUSES:
+            latest = job_queue.wait(job_id, 15, after_status=current['status'])
+            if latest is None:
+                return
+            if latest['status'] == current['status']:
+                # 保持连接
+                yield ': keep-alive\n\n'
+                continue
+            current = latest
+            yield ai_tasks.format_sse('status', current)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-{organized_markdown}
 
----
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消排队中的任务"""
+    try:
+        if job_queue.cancel(job_id):
+            return jsonify(job_queue.get(job_id))
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({'error': f"Job is {job['status']}, only queued jobs can be cancelled"}), 409
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-## 元数据
 
-- 摘要: {summary}
-- 类型: {note_type}
-"""
-        
-        # 保存文件
-        file_path.write_text(markdown_content, encoding='utf-8')
-        
-        # 更新索引
-        index = get_index()
-        index_item = {
-            'id': filename,
-            'title': title,
-            'type': note_type,
-            'summary': summary,
-            'file_name': file_path.name,
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat(),
-            'tags': data.get('tags', [])
-        }
-        index.append(index_item)
-        save_index(index)
+@app.route('/api/save-note', methods=['POST'])
+def save_note():
+    """
+    保存笔记到本地文件
+    存储：原始内容、AI 整理内容、用户编辑内容
+    """
+    try:
+        data = request.json
+        index_item = create_note(data)
         
         return jsonify({
             'success': True,
             'message': 'Note saved successfully',
-            'file_name': file_path.name,
-            'id': filename
+            'file_name': index_item['file_name'],
+            'id': index_item['id']
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def parse_facet_filters(args):
+    """
+    解析分面筛选参数：type、tag（可重复，需全部包含）、pinned（true/false）
+    返回 (类型, 标签列表, 固定状态)，未指定的条件为 None/空；参数格式错误时抛出 ValueError
+    """
+    note_type = args.get('type') or None
+    tags = [tag for tag in args.getlist('tag') if tag]
+    pinned = args.get('pinned', '').lower()
+    if pinned not in ('', 'true', 'false', '1', '0'):
+        raise ValueError('Invalid pinned (expected true or false)')
+    return note_type, tags, (pinned in ('true', '1')) if pinned else None
+
+
+def filtered_items(field, note_type, tags, pinned):
+    """满足分面条件的索引条目，按 (field, id) 升序排列，返回 (排序键列表, 条目列表)"""
+    items = [item for item in map(notes_index.get, facet_index.select(note_type, tags, pinned)) if item]
+    items.sort(key=lambda item: (item.get(field) or '', item['id']))
+    return [(item.get(field) or '', item['id']) for item in items], items
+
+
+def encode_cursor(key):
+    """将排序键编码为不透明游标"""
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        value, note_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return (str(value), str(note_id))
+
+
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
-    """获取所有笔记索引"""
+    """
+    获取笔记索引
+    - 不带参数时按插入顺序返回全部笔记
+    - limit/cursor：按 sort（created_at/updated_at，默认 created_at）与 order（desc/asc，默认 desc）游标分页
+    - fields：逗号分隔的字段投影，例如 fields=id,title,type
+    - type / tag（可重复）/ pinned：由分面索引筛选，不扫描全部笔记
+    - 支持 ETag / If-None-Match，索引未变化时返回 304
+    """
     try:
-        index = get_index()
-        response = jsonify({'notes': index, 'total': len(index)})
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        limit = request.args.get('limit')
+        cursor = request.args.get('cursor')
+        sort_field = request.args.get('sort', 'created_at')
+        order = request.args.get('order', 'desc')
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+        
+        if sort_field not in NOTES_SORT_FIELDS or order not in ('asc', 'desc'):
+            return jsonify({'error': 'Invalid sort or order'}), 400
+        try:
+            note_type, tags, pinned = parse_facet_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        filtered = note_type is not None or tags or pinned is not None
+        
+        # 标识由索引内容与查询参数共同决定
+        query_key = json.dumps([limit, cursor, sort_field, order, fields, note_type, tags, pinned],
+                               ensure_ascii=False)
+        etag = f"{notes_index.version_tag()}-{hashlib.sha1(query_key.encode('utf-8')).hexdigest()[:8]}"
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        next_cursor = None
+        if limit is None and cursor is None and 'sort' not in request.args:
+            if filtered:
+                notes = [item for item in map(notes_index.get, facet_index.select(note_type, tags, pinned)) if item]
+            else:
+                notes = get_index()
+            total = len(notes)
+        else:
+            try:
+                limit = min(max(int(limit or NOTES_DEFAULT_LIMIT), 1), NOTES_MAX_LIMIT)
+                cursor_key = decode_cursor(cursor) if cursor else None
+            except ValueError:
+                return jsonify({'error': 'Invalid limit or cursor'}), 400
+            
+            if filtered:
+                keys, items = filtered_items(sort_field, note_type, tags, pinned)
+            else:
+                keys, items = notes_index.sorted_items(sort_field)
+            total = len(items)
+            if order == 'asc':
+                start = bisect.bisect_right(keys, cursor_key) if cursor_key else 0
+                end = min(start + limit, total)
+                notes = items[start:end]
+                has_more = end < total
+            else:
+                end = bisect.bisect_left(keys, cursor_key) if cursor_key else total
+                start = max(end - limit, 0)
+                notes = items[start:end][::-1]
+                has_more = start > 0
+            if notes and has_more:
+                next_cursor = encode_cursor(keys[start if order == 'desc' else end - 1])
+        
+        if fields:
+            notes = [{f: item[f] for f in ['id'] + fields if f in item} for item in notes]
+        
+        response = jsonify({'notes': notes, 'total': total, 'next_cursor': next_cursor})
+        response.set_etag(etag)
+        # 允许浏览器缓存但每次都需要用 ETag 重新验证
+        response.headers['Cache-Control'] = 'no-cache'
         return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -375,17 +933,15 @@ def get_notes():
 def get_note(note_id):
     """获取单个笔记内容"""
     try:
-        index = get_index()
-        note_item = next((item for item in index if item['id'] == note_id), None)
+        note_item = notes_index.get(note_id)
         
         if not note_item:
             return jsonify({'error': 'Note not found'}), 404
         
-        file_path = NOTES_DIR / note_item['file_name']
-        if not file_path.exists():
+        content = store.read_body(note_item)
+        if content is None:
             return jsonify({'error': 'Note file not found'}), 404
         
-        content = file_path.read_text(encoding='utf-8')
         response = jsonify({
             'note': note_item,
             'content': content
@@ -400,19 +956,50 @@ def get_note(note_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/notes/<note_id>/related', methods=['GET'])
+def get_related_notes(note_id):
+    """
+    相关笔记：按标题、摘要与正文的 TF-IDF 余弦相似度排序，limit 条（默认 10）
+    """
+    try:
+        if related_notes is None:
+            if RELATED_NOTES_ENABLED:
+                return jsonify({'error': 'Related notes require numpy, which is not installed (pip install numpy)'}), 503
+            return jsonify({'error': 'Related notes are disabled (RELATED_NOTES_ENABLED=False)'}), 503
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), RELATED_NOTES_MAX_LIMIT)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        
+        hits = related_notes.related(note_id, limit)
+        if hits is None:
+            return jsonify({'error': 'Note not found'}), 404
+        
+        results = []
+        for related_id, score in hits:
+            item = notes_index.get(related_id)
+            if not item:
+                continue
+            # 索引缓存中的条目只读，附加得分时复制
+            results.append(dict(item, score=score))
+        
+        return jsonify({'note_id': note_id, 'results': results, 'count': len(results)})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/notes/<note_id>/edit', methods=['PUT'])
 def edit_note(note_id):
     """编辑笔记"""
     try:
         data = request.json
-        index = get_index()
-        note_item = next((item for item in index if item['id'] == note_id), None)
+        note_item = notes_index.get(note_id)
         
         if not note_item:
             return jsonify({'error': 'Note not found'}), 404
         
-        file_path = NOTES_DIR / note_item['file_name']
-        
         # 获取新的md文档内容
         new_content = data.get('content', '')
         
@@ -420,7 +1007,8 @@ def edit_note(note_id):
             return jsonify({'error': 'No content provided'}), 400
         
         # 保存整个md文档内容到本地文件
-        file_path.write_text(new_content, encoding='utf-8')
+        old_blobs = note_item.get('blobs', [])
+        store.write_body(note_item, new_content)
         
         # 处理标题更新：如果新内容的第一行是标题，则提取并更新索引
         content_lines = new_content.splitlines()
@@ -437,10 +1025,14 @@ def edit_note(note_id):
             note_item['tags'] = data['tags']
         if 'is_pinned' in data:
             note_item['is_pinned'] = data['is_pinned']
+        if 'key_dates' in data:
+            note_item['key_dates'] = normalize_key_dates(data['key_dates'])
         
         # 更新索引时间
         note_item['updated_at'] = datetime.now().isoformat()
-        save_index(index)
+        notes_index.update(note_item)
+        _sync_derived_indexes(updated=[(note_item, new_content)])
+        release_blobs(set(old_blobs) - set(note_item.get('blobs', [])))
         
         return jsonify(note_item)
     
@@ -452,18 +1044,15 @@ def edit_note(note_id):
 def delete_note(note_id):
     """删除单条笔记"""
     try:
-        index = get_index()
-        note_item = next((item for item in index if item['id'] == note_id), None)
+        note_item = notes_index.get(note_id)
         
         if not note_item:
             return jsonify({'error': 'Note not found'}), 404
         
-        file_path = NOTES_DIR / note_item['file_name']
-        if file_path.exists():
-            file_path.unlink()
-        
-        index = [item for item in index if item['id'] != note_id]
-        save_index(index)
+        store.delete_body(note_item)
+        notes_index.delete([note_id])
+        _sync_derived_indexes(removed=[note_id])
+        release_blobs(note_item.get('blobs', []))
         
         return jsonify({'success': True, 'message': 'Note deleted successfully'})
     
@@ -481,20 +1070,13 @@ def batch_delete_notes():
         if not note_ids:
             return jsonify({'error': 'No note IDs provided'}), 400
         
-        index = get_index()
-        deleted_count = 0
-        
-        for note_id in note_ids:
-            note_item = next((item for item in index if item['id'] == note_id), None)
-            if note_item:
-                file_path = NOTES_DIR / note_item['file_name']
-                if file_path.exists():
-                    file_path.unlink()
-                
-                index = [item for item in index if item['id'] != note_id]
-                deleted_count += 1
-        
-        save_index(index)
+        # 一次集合过滤 + 一次索引提交，再删除对应文件
+        deleted = notes_index.delete(note_ids)
+        for note_item in deleted:
+            store.delete_body(note_item)
+        _sync_derived_indexes(removed=[item['id'] for item in deleted])
+        release_blobs([digest for item in deleted for digest in item.get('blobs', [])])
+        deleted_count = len(deleted)
         
         return jsonify({
             'success': True, 
@@ -506,25 +1088,183 @@ def batch_delete_notes():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/notes/batch', methods=['POST'])
+def batch_save_notes():
+    """
+    批量保存笔记
+    请求体：{"notes": [{title, type, original_content, organized_markdown, summary, tags, key_dates}, ...]}
+    所有笔记的索引条目在一次索引提交中写入
+    """
+    try:
+        data = request.json or {}
+        notes = data.get('notes', [])
+        
+        if not notes:
+            return jsonify({'error': 'No notes provided'}), 400
+        
+        built = [build_note(note) for note in notes]
+        for index_item, markdown_content in built:
+            store.write_body(index_item, markdown_content)
+        
+        notes_index.apply([('put', index_item) for index_item, _ in built])
+        _sync_derived_indexes(added=built)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{len(built)} note(s) saved successfully',
+            'saved_count': len(built),
+            'notes': [{'id': item['id'], 'file_name': item['file_name']} for item, _ in built]
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/notes/batch', methods=['PUT'])
+def batch_update_notes():
+    """
+    批量更新标签与固定状态
+    请求体：{"updates": [{"id": ..., "tags": [...], "add_tags": [...], "remove_tags": [...], "is_pinned": true}, ...]}
+    所有修改在一次索引提交中写入
+    """
+    try:
+        data = request.json or {}
+        updates = data.get('updates', [])
+        
+        if not updates:
+            return jsonify({'error': 'No updates provided'}), 400
+        
+        now = datetime.now().isoformat()
+        changed = {}
+        not_found = []
+        for update in updates:
+            note_id = update.get('id')
+            note_item = changed.get(note_id) or notes_index.get(note_id)
+            if not note_item:
+                not_found.append(note_id)
+                continue
+            
+            tags = list(update['tags']) if 'tags' in update else list(note_item.get('tags', []))
+            tags += [tag for tag in update.get('add_tags', []) if tag not in tags]
+            remove_tags = set(update.get('remove_tags', []))
+            note_item['tags'] = [tag for tag in tags if tag not in remove_tags]
+            if 'is_pinned' in update:
+                note_item['is_pinned'] = bool(update['is_pinned'])
+            note_item['updated_at'] = now
+            changed[note_id] = note_item
+        
+        results = notes_index.apply([('update', item) for item in changed.values()])
+        updated = [item for item in results if item is not None]
+        # 只改了标签与固定状态，正文不变；updated_at 已变，派生索引据此对账，需一并刷新
+        _sync_derived_indexes(updated=[(item, None) for item in updated])
+        
+        return jsonify({
+            'success': True,
+            'updated_count': len(updated),
+            'notes': updated,
+            'not_found': not_found
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/search', methods=['GET'])
 def search_notes():
-    """搜索笔记"""
+    """
+    搜索笔记（标题、摘要与正文）
+    多个关键词以空格分隔需同时命中，引号内为短语，type 参数按笔记类型过滤
+    结果按相关度排序，每页 limit 条（默认 20），下一页使用返回的 next_cursor
+    """
     try:
-        query = request.args.get('q', '').lower()
+        query = request.args.get('q', '')
         note_type = request.args.get('type', '')
         
-        index = get_index()
+        try:
+            limit = min(max(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+            offset = max(int(request.args.get('cursor') or 0), 0)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit or cursor'}), 400
+        
+        total, hits = search_index.search(query, note_type, limit=limit, offset=offset)
+        
         results = []
+        for note_id, score in hits:
+            item = notes_index.get(note_id)
+            if not item:
+                continue
+            # 优先从正文截取摘要，正文未命中时依次尝试摘要与标题
+            sources = [store.read_body(item) or '', item.get('summary') or '', item.get('title') or '']
+            snippets = [make_snippet(text, query) for text in sources]
+            item['score'] = round(score, 4)
+            item['snippet'] = next((snippet for snippet in snippets if snippet['highlights']), snippets[0])
+            results.append(item)
         
-        for item in index:
-            title_match = query in item['title'].lower()
-            summary_match = query in item['summary'].lower()
-            type_match = not note_type or item['type'] == note_type
-            
-            if (title_match or summary_match) and type_match:
-                results.append(item)
+        next_offset = offset + len(hits)
+        return jsonify({
+            'results': results,
+            'count': total,
+            'next_cursor': str(next_offset) if next_offset < total else None
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/facets', methods=['GET'])
+def get_facets():
+    """
+    各类型、各标签与固定笔记的数量；带 type / tag / pinned 参数时为满足这些条件的笔记中的数量
+    """
+    try:
+        try:
+            note_type, tags, pinned = parse_facet_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({'results': results, 'count': len(results)})
+        return jsonify(facet_index.counts(note_type, tags, pinned))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/timeline', methods=['GET'])
+def get_timeline():
+    """
+    重要日期时间线：日期在 [from, to] 内（YYYY-MM-DD，均可省略）的事件，按日期升序
+    type 参数按笔记类型过滤，每页 limit 条（默认 200），下一页使用返回的 next_cursor
+    """
+    try:
+        start = request.args.get('from', '')
+        end = request.args.get('to', '')
+        note_type = request.args.get('type', '')
+        
+        if (start and parse_date(start) is None) or (end and parse_date(end) is None):
+            return jsonify({'error': 'Invalid date (expected YYYY-MM-DD)'}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', TIMELINE_DEFAULT_LIMIT)), 1), TIMELINE_MAX_LIMIT)
+            offset = max(int(request.args.get('cursor') or 0), 0)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit or cursor'}), 400
+        
+        total, events = timeline_index.between(parse_date(start) if start else None,
+                                               parse_date(end) if end else None,
+                                               note_type, limit=limit, offset=offset)
+        
+        results = []
+        for event in events:
+            item = notes_index.get(event.pop('note_id'))
+            if not item:
+                continue
+            event['note'] = {'id': item['id'], 'title': item.get('title'), 'type': item.get('type')}
+            results.append(event)
+        
+        next_offset = offset + len(events)
+        return jsonify({
+            'results': results,
+            'count': total,
+            'next_cursor': str(next_offset) if next_offset < total else None
+        })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -548,4 +1288,8 @@ if __name__ == '__main__':
     print(f"🚀 Flask server starting on http://127.0.0.1:5001")
     print(f"📁 Data directory: {DATA_DIR}")
     print(f"🔑 Dashscope API Key: {'***' + DASHSCOPE_API_KEY[-4:]}")
+    print(f"🤖 LLM: {LLM_MODEL} @ {LLM_BASE_URL}")
+    # 调试模式的重载器会再启动一个子进程运行应用，只在子进程中启动工作线程
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start()
     app.run(debug=True, port=5001, host='127.0.0.1')
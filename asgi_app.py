@@ -0,0 +1,377 @@
+"""
+ASGI 入口
+AI 端点（分类、批量分类、合并建议、整理、ingest）在事件循环上通过异步客户端调用模型，进行中的请求不占用工作线程；
+其余端点仍由 Flask 应用处理（经 a2wsgi 在线程池中执行），模型调用再慢也不会阻塞笔记增删改查。
+缓存、格式检查与修复的流程与 app.py 共用（见 json_extract.ResponseCheck），这里只把模型与缓存的读写换成异步调用
+
+用法：
+    uvicorn asgi_app:application --host 127.0.0.1 --port 5001
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+
+import ai_tasks
+import json_extract
+from app import app as flask_app, llm, llm_cache, llm_cache_key, local_classifier, similar_notes, create_note, \
+    job_queue, classify_locally, CLASSIFY_BATCH_SIZE, CLASSIFY_BATCH_MAX_ITEMS, ORGANIZE_CHUNK_CHARS, \
+    ORGANIZE_MAX_CHUNKS, MERGE_CANDIDATES, MERGE_MIN_SIMILARITY, MERGE_AUTO_THRESHOLD
+from llm_transport import LLMError
+
+# 执行 Flask 端点的线程数
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 32))
+
+
+async def ensure_json_async(content, schema, task):
+    """app.ensure_json 的异步版本"""
+    check = json_extract.ResponseCheck(content, schema, task)
+    repaired = ''
+    if check.prompt:
+        try:
+            repaired = await llm.acomplete(check.prompt, json_extract.REPAIR_SYSTEM_MESSAGE)
+        except LLMError:
+            pass
+    return check.finish(repaired)
+
+
+async def call_dashscope_api_async(prompt, system_message=ai_tasks.DEFAULT_SYSTEM_MESSAGE, use_cache=True,
+                                   schema=None, task=''):
+    """call_dashscope_api 的异步版本，共用传输层、响应缓存与格式修复，失败时抛出 LLMError"""
+    cache_key = llm_cache_key(prompt, system_message)
+    if cache_key and use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None and json_extract.conforms(cached, schema):
+            return cached
+    content = await llm.acomplete(prompt, system_message)
+    usable = True
+    if schema is not None:
+        content, usable = await ensure_json_async(content, schema, task)
+    if cache_key and usable:
+        await asyncio.to_thread(llm_cache.put, cache_key, content)
+    return content
+
+
+# ==================== 异步 AI 端点 ====================
+# 与 app.py 中同名端点的请求与响应格式一致，返回 (状态码, 响应数据)
+
+def _use_cache(data, headers):
+    return not (data.get('no_cache') or 'no-cache' in headers.get('cache-control', ''))
+
+
+async def classify_content(data, headers):
+    content = data.get('content', '')
+    if not content:
+        return 400, {'error': 'Content is required'}
+    # 首次分类时需要读取笔记训练模型，放到线程中执行
+    result = await asyncio.to_thread(classify_locally, content, data)
+    if result is not None:
+        return 200, result
+    response_text = await call_dashscope_api_async(ai_tasks.classify_prompt(content),
+                                                   system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                                   use_cache=_use_cache(data, headers),
+                                                   schema=ai_tasks.CLASSIFY_SCHEMA, task='classify')
+    result = ai_tasks.parse_classify_response(response_text)
+    if local_classifier:
+        # 学习会更新模型并写回磁盘，不在事件循环上执行
+        await asyncio.to_thread(local_classifier.learn, content, result)
+    return 200, dict(result, source='llm')
+
+
+async def classify_batch(data, headers):
+    raw_items = data.get('items', [])
+    if not raw_items:
+        return 400, {'error': 'No items provided'}
+    if len(raw_items) > CLASSIFY_BATCH_MAX_ITEMS:
+        return 400, {'error': f'At most {CLASSIFY_BATCH_MAX_ITEMS} items per request'}
+    try:
+        batch = await asyncio.to_thread(ai_tasks.ClassifyBatch, raw_items, CLASSIFY_BATCH_SIZE,
+                                        None if data.get('force_llm') else local_classifier)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    use_cache = _use_cache(data, headers)
+
+    async def classify_chunk(chunk):
+        try:
+            return await call_dashscope_api_async(ai_tasks.classify_batch_prompt(chunk),
+                                                  system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                                  use_cache=use_cache, schema=ai_tasks.CLASSIFY_BATCH_SCHEMA,
+                                                  task='classify_batch')
+        except LLMError:
+            return ''
+
+    async def classify_single(content):
+        try:
+            return await call_dashscope_api_async(ai_tasks.classify_prompt(content),
+                                                  system_message=ai_tasks.CLASSIFY_SYSTEM_MESSAGE,
+                                                  use_cache=use_cache, schema=ai_tasks.CLASSIFY_SCHEMA,
+                                                  task='classify'), None
+        except LLMError as e:
+            return None, e
+
+    def add_batch_responses(responses):
+        for chunk, response_text in zip(batch.chunks, responses):
+            batch.add_batch_response(chunk, response_text)
+
+    def add_single_responses(missing, responses):
+        for content, (response_text, error) in zip(missing, responses):
+            if error is not None:
+                batch.add_error(content, error)
+            else:
+                batch.add_single_response(content, response_text)
+
+    # 模型调用在事件循环上并发进行；结果交给本地分类器学习的部分在线程中依次执行
+    responses = await asyncio.gather(*(classify_chunk(chunk) for chunk in batch.chunks))
+    await asyncio.to_thread(add_batch_responses, responses)
+    missing = batch.missing()
+    responses = await asyncio.gather(*(classify_single(content) for content in missing))
+    await asyncio.to_thread(add_single_responses, missing, responses)
+    results = batch.output()
+    return 200, {'results': results, 'count': len(results)}
+
+
+async def suggest_merge(data, headers):
+    content = data.get('content', '')
+    note_type = data.get('note_type', '')
+    if not content:
+        return 400, {'error': 'Content is required'}
+    candidates = await asyncio.to_thread(similar_notes.query, content, MERGE_CANDIDATES, note_type,
+                                         MERGE_MIN_SIMILARITY)
+    result = ai_tasks.merge_without_llm(candidates, MERGE_AUTO_THRESHOLD)
+    if result is not None:
+        return 200, result
+    response_text = await call_dashscope_api_async(ai_tasks.merge_prompt(content, note_type, candidates),
+                                                   use_cache=_use_cache(data, headers),
+                                                   schema=ai_tasks.MERGE_SCHEMA, task='merge')
+    return 200, ai_tasks.parse_merge_response(response_text, candidates)
+
+
+async def organize_long(content, note_type, use_cache):
+    """app.organize_long 的异步版本，各分块同时整理"""
+    job = ai_tasks.OrganizeMapReduce(content, note_type, ORGANIZE_CHUNK_CHARS, ORGANIZE_MAX_CHUNKS)
+
+    async def organize_chunk(index, prompt):
+        started = time.perf_counter()
+        try:
+            response_text = await call_dashscope_api_async(prompt, system_message=ai_tasks.ORGANIZE_SYSTEM_MESSAGE,
+                                                           use_cache=use_cache, schema=ai_tasks.ORGANIZE_SCHEMA,
+                                                           task='organize')
+        except LLMError as e:
+            job.add_chunk_error(index, e, time.perf_counter() - started)
+        else:
+            job.add_chunk_response(index, response_text, time.perf_counter() - started)
+
+    await asyncio.gather(*(organize_chunk(index, prompt) for index, prompt in enumerate(job.prompts())))
+    if job.failed():
+        raise job.errors[0]
+    started = time.perf_counter()
+    summary_text = ''
+    if job.needs_summary():
+        try:
+            summary_text = await call_dashscope_api_async(job.summary_prompt(), use_cache=use_cache,
+                                                          schema=ai_tasks.SUMMARY_SCHEMA, task='summary')
+        except LLMError:
+            pass
+    return job.output(summary_text, time.perf_counter() - started)
+
+
+async def organize_content(data, headers):
+    content = data.get('content', '')
+    note_type = data.get('note_type', '')
+    if not content:
+        return 400, {'error': 'Content is required'}
+    if len(content) > ORGANIZE_CHUNK_CHARS:
+        return 200, await organize_long(content, note_type, _use_cache(data, headers))
+    response_text = await call_dashscope_api_async(ai_tasks.organize_prompt(content, note_type),
+                                                   system_message=ai_tasks.ORGANIZE_SYSTEM_MESSAGE,
+                                                   use_cache=_use_cache(data, headers),
+                                                   schema=ai_tasks.ORGANIZE_SCHEMA, task='organize')
+    return 200, ai_tasks.parse_organize_response(response_text, content)
+
+
+async def ingest(data, headers):
+    content = data.get('content', '')
+    note_type = data.get('note_type', '')
+    if not content:
+        return 400, {'error': 'Content is required'}
+    response_text = await call_dashscope_api_async(ai_tasks.ingest_prompt(content, note_type),
+                                                   system_message=ai_tasks.INGEST_SYSTEM_MESSAGE,
+                                                   use_cache=_use_cache(data, headers),
+                                                   schema=ai_tasks.INGEST_SCHEMA, task='ingest')
+    result = ai_tasks.parse_ingest_response(response_text, content, note_type)
+    note_data = ai_tasks.ingest_note_data(result, data, content)
+    note = await asyncio.to_thread(create_note, note_data) if note_data else None
+    result['saved'] = note is not None
+    result['note'] = {'id': note['id'], 'file_name': note['file_name'], 'title': note['title']} if note else None
+    return 200, result
+
+
+async def organize_content_stream(data, headers):
+    """返回 (状态码, 异步 SSE 消息迭代器)，与 app.py 中的同名端点一致"""
+    content = data.get('content', '')
+    note_type = data.get('note_type', '')
+    if not content:
+        return 400, {'error': 'Content is required'}
+    prompt = ai_tasks.organize_prompt(content, note_type)
+    cache_key = llm_cache_key(prompt, ai_tasks.ORGANIZE_SYSTEM_MESSAGE)
+    cached = None
+    if cache_key and _use_cache(data, headers):
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+    upstream = None
+    first = cached
+    if cached is None:
+        upstream = llm.astream(prompt, ai_tasks.ORGANIZE_SYSTEM_MESSAGE)
+        # 取得第一段后再开始响应，上游不可用时仍能返回正确的状态码
+        first = await anext(upstream, '')
+
+    async def generate():
+        streamer = ai_tasks.OrganizeStream(content)
+        try:
+            for message in streamer.feed(first):
+                yield message
+            if upstream is not None:
+                async for chunk in upstream:
+                    if streamer.complete:
+                        # JSON 已完整，不再读取模型其后的说明文字
+                        break
+                    for message in streamer.feed(chunk):
+                        yield message
+            result = streamer.finish()
+            if upstream is not None:
+                json_extract.parse_stats.record('organize_stream', streamer.outcome)
+                # 只缓存能解析出完整结果的输出，兜底结果不写入缓存
+                if cache_key and streamer.outcome != 'failed':
+                    await asyncio.to_thread(llm_cache.put, cache_key, streamer.text)
+            yield result
+        except LLMError as e:
+            yield ai_tasks.format_sse('error', {'error': str(e), 'status': e.status_code})
+        finally:
+            if upstream is not None:
+                await upstream.aclose()
+
+    return 200, generate()
+
+
+ASYNC_ROUTES = {
+    '/api/classify-content': classify_content,
+    '/api/classify-batch': classify_batch,
+    '/api/suggest-merge': suggest_merge,
+    '/api/organize-content': organize_content,
+    '/api/ingest': ingest,
+    '/api/organize-content/stream': organize_content_stream,
+}
+
+
+# ==================== ASGI 应用 ====================
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, status, payload):
+    body = flask_app.json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            # 与 Flask-CORS 的默认配置一致
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_sse(send, status, messages):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    try:
+        async for message in messages:
+            await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+    finally:
+        await messages.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class AsyncApp:
+    """异步处理 ASYNC_ROUTES 中的 POST 请求，其余请求经 a2wsgi 在线程池中交给 WSGI 应用（逐块转发，支持流式响应）"""
+
+    def __init__(self, wsgi_app, routes, threads=WSGI_THREADS):
+        self.routes = routes
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get(scope['path']) if scope['method'] == 'POST' else None
+        if handler is not None:
+            await self._handle_async(handler, scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                job_queue.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(job_queue.stop)
+                await llm.aclose()
+                self.wsgi.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle_async(self, handler, scope, receive, send):
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        try:
+            data = json.loads(await read_body(receive) or b'{}')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await send_json(send, 400, {'error': 'Request body must be a JSON object'})
+            return
+        try:
+            status, payload = await handler(data, headers)
+        except LLMError as e:
+            status, payload = e.status_code, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        if hasattr(payload, '__aiter__'):
+            await send_sse(send, status, payload)
+        else:
+            await send_json(send, status, payload)
+
+
+application = AsyncApp(flask_app, ASYNC_ROUTES)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ uvicorn is required to run the ASGI app: pip install uvicorn")
+        sys.exit(1)
+    print(f"🚀 ASGI server starting on http://127.0.0.1:5001")
+    uvicorn.run(application, host='127.0.0.1', port=5001)
@@ -0,0 +1,161 @@
+"""
+内容寻址的正文存储
+笔记中较大的「原始内容」「AI 整理内容」段落按 SHA-256 存入 data/blobs，相同内容只保存一次；
+笔记文件中对应段落替换为 <!-- blob:sha256:... --> 引用，读取时还原。
+引用计数由索引条目的 blobs 字段推导，删除/编辑笔记后回收不再被引用的内容
+"""
+import gzip
+import hashlib
+import os
+import re
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from file_lock import FileLock, atomic_write_bytes
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# 可被替换为引用的段落
+PACKED_SECTIONS = ('原始内容', 'AI 整理内容')
+SECTION_RE = re.compile(
+    r'(^## (?:' + '|'.join(re.escape(s) for s in PACKED_SECTIONS) + r')[ \t]*\n)(.*?)(?=\n---[ \t]*\r?\n|\Z)',
+    re.MULTILINE | re.DOTALL
+)
+BLOB_REF_RE = re.compile(r'<!-- blob:sha256:([0-9a-f]{64}) -->')
+
+
+class BlobStore:
+    """
+    按内容哈希命名的文件存储
+    compression：gzip（默认）、zstd（需安装 zstandard）或 none
+    enabled 为 False 时不再打包新内容，但仍可还原已有引用
+    """
+
+    def __init__(self, root: Path, enabled: bool = True, compression: str = 'gzip', min_size: int = 256,
+                 gc_grace_seconds: int = 300, lock: Optional[FileLock] = None):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.root.mkdir(parents=True, exist_ok=True)
+        if compression == 'zstd' and not ZSTD_AVAILABLE:
+            print("⚠️  zstandard not available. Falling back to gzip.")
+            compression = 'gzip'
+        self.compression = compression
+        self.min_size = min_size
+        self.gc_grace_seconds = gc_grace_seconds
+        self.lock = lock
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == 'gzip':
+            return gzip.compress(data, mtime=0)
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor().compress(data)
+        return data
+
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        if data.startswith(GZIP_MAGIC):
+            return gzip.decompress(data)
+        if data.startswith(ZSTD_MAGIC):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("Blob is zstd-compressed but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+    # ==================== 读写 ====================
+
+    def put(self, text: str) -> str:
+        """保存内容并返回其哈希；内容已存在时只刷新修改时间（避免被并发回收）"""
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(exist_ok=True)
+        atomic_write_bytes(path, self._compress(data))
+        return digest
+
+    def get(self, digest: str) -> Optional[str]:
+        try:
+            return self._decompress(self._path(digest).read_bytes()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    # ==================== 正文打包 ====================
+
+    def pack(self, content: str) -> Tuple[str, List[str]]:
+        """将大段落替换为引用，返回 (打包后的正文, 引用的哈希列表)"""
+        if not self.enabled:
+            return content, []
+        digests = []
+
+        def replace(match):
+            body = match.group(2)
+            existing = BLOB_REF_RE.fullmatch(body.strip())
+            if existing:
+                # 已经是引用（如复制打包后的正文），保留引用并计入引用计数
+                digests.append(existing.group(1))
+                return match.group(0)
+            if len(body.encode('utf-8')) < self.min_size:
+                return match.group(0)
+            digest = self.put(body)
+            digests.append(digest)
+            return f"{match.group(1)}<!-- blob:sha256:{digest} -->"
+
+        packed = SECTION_RE.sub(replace, content)
+        return packed, list(dict.fromkeys(digests))
+
+    def unpack(self, content: str) -> str:
+        """还原正文中的引用，缺失的内容保持引用原样"""
+        def replace(match):
+            body = self.get(match.group(1))
+            return body if body is not None else match.group(0)
+
+        return BLOB_REF_RE.sub(replace, content)
+
+    # ==================== 回收 ====================
+
+    def collect(self, digests: Iterable[str], refcount: Callable[[str], int]) -> int:
+        """
+        删除引用计数为 0 的内容
+        最近被写入或复用过（宽限期内）的内容暂不删除，防止与尚未提交索引的并发保存冲突
+        """
+        removed = 0
+        deadline = time.time() - self.gc_grace_seconds
+        with self.lock or nullcontext():
+            for digest in dict.fromkeys(digests):
+                if refcount(digest) > 0:
+                    continue
+                path = self._path(digest)
+                try:
+                    if path.stat().st_mtime > deadline:
+                        continue
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
+
+    def sweep(self, referenced: Iterable[str]) -> int:
+        """全量回收：删除所有未被引用且超过宽限期的内容"""
+        referenced = set(referenced)
+        digests = [
+            path.parent.name + path.name
+            for path in self.root.glob('??/*')
+            if path.is_file() and not path.name.startswith('.')
+        ]
+        return self.collect(digests, lambda digest: 1 if digest in referenced else 0)
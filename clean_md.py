@@ -1,21 +1,33 @@
 import os
 import re
+from pathlib import Path
+
+from file_lock import FileLock, atomic_write_text
+from storage import iter_note_files
 
 # 获取notes目录路径
-notes_dir = os.path.join(os.getcwd(), 'data', 'notes')
+data_dir = os.path.join(os.getcwd(), 'data')
+notes_dir = os.path.join(data_dir, 'notes')
+
+# 与后端共用写锁，避免与正在运行的服务同时改写同一篇笔记
+write_lock = FileLock(Path(data_dir) / '.write.lock')
 
-# 遍历所有.md文件
-for filename in os.listdir(notes_dir):
-    if filename.endswith('.md'):
-        file_path = os.path.join(notes_dir, filename)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+# 遍历所有.md文件（包括分片子目录）
+for _, entry in iter_note_files(notes_dir):
+    file_path = entry.path
+    with write_lock:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            # 遍历期间被删除或被迁移到其他分片目录
+            continue
         # 删除用户编辑内容部分
         modified_content = re.sub(r'---\s*## 用户编辑内容.*?(?=---|\Z)', '', content, flags=re.DOTALL)
         # 确保没有连续的分隔符
         modified_content = re.sub(r'---\s*---', '---', modified_content, flags=re.DOTALL)
-        # 保存修改
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(modified_content)
+        # 保存修改（临时文件 + 重命名，服务端不会读到写了一半的文件）
+        if modified_content != content:
+            atomic_write_text(Path(file_path), modified_content)
 
-print("All MD files cleaned successfully.")
\ No newline at end of file
+print("All MD files cleaned successfully.")
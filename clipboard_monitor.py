@@ -1,7 +1,11 @@
+import os
 import time
 import json
+import hashlib
 import threading
+import unicodedata
 import requests
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, Any
@@ -21,6 +25,97 @@ except ImportError:
     PYPERCLIP_AVAILABLE = False
     print("⚠️  pyperclip not available.")
 
+# 近期内容去重：时间窗口（秒）、最多记住的条数、近似重复的 SimHash 海明距离上限
+CLIPBOARD_DEDUPE_WINDOW_SECONDS = int(os.getenv('CLIPBOARD_DEDUPE_WINDOW_SECONDS', 3600))
+CLIPBOARD_DEDUPE_MAX_ENTRIES = int(os.getenv('CLIPBOARD_DEDUPE_MAX_ENTRIES', 256))
+CLIPBOARD_SIMHASH_DISTANCE = int(os.getenv('CLIPBOARD_SIMHASH_DISTANCE', 5))
+# 短于该长度（规范化后）的内容只做完全相同的判断，SimHash 对短文本不可靠
+SIMHASH_MIN_CHARS = 32
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角、转为小写，合并所有空白（包括各种换行符）为单个空格"""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text: str, size: int = 3) -> int:
+    """以字符 size 元组为特征的 64 位 SimHash（text 应已规范化）"""
+    weights = [0] * 64
+    for start in range(max(len(text) - size + 1, 1)):
+        value = _hash64(text[start:start + size])
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class RecentFingerprints:
+    """
+    近期内容指纹：规范化文本的哈希判断完全重复，SimHash 海明距离判断近似重复
+    只保留 window_seconds 内的最近 max_entries 条，每条记录对应的分类结果与捕获时间
+    """
+
+    def __init__(self, window_seconds: float = 3600, max_entries: int = 256, max_distance: int = 5):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        # 规范化文本的 sha1 -> {simhash, classification, timestamp, captured_at}
+        self._entries: OrderedDict = OrderedDict()
+
+    def _expire(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry['captured_at'] <= self.window_seconds and len(self._entries) <= self.max_entries:
+                break
+            self._entries.pop(key)
+
+    def add(self, text: str, classification: Dict[str, Any], timestamp: str, captured_at: Optional[float] = None):
+        normalized = normalize_text(text)
+        if not normalized:
+            return
+        key = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        self._entries.pop(key, None)
+        self._entries[key] = {
+            'simhash': simhash(normalized) if len(normalized) >= SIMHASH_MIN_CHARS else None,
+            'classification': classification,
+            'timestamp': timestamp,
+            'captured_at': time.time() if captured_at is None else captured_at,
+        }
+        self._expire(time.time())
+
+    def find(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        查找窗口内的重复内容，返回 {match: exact/near, distance, classification, timestamp}，没有时返回 None
+        """
+        self._expire(time.time())
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        entry = self._entries.get(hashlib.sha1(normalized.encode('utf-8')).hexdigest())
+        if entry is not None:
+            return {'match': 'exact', 'distance': 0, 'classification': entry['classification'],
+                    'timestamp': entry['timestamp']}
+        if len(normalized) < SIMHASH_MIN_CHARS:
+            return None
+        fingerprint = simhash(normalized)
+        best = None
+        for entry in self._entries.values():
+            if entry['simhash'] is None:
+                continue
+            distance = bin(fingerprint ^ entry['simhash']).count('1')
+            if distance <= self.max_distance and (best is None or distance <= best[0]):
+                best = (distance, entry)
+        if best is None:
+            return None
+        return {'match': 'near', 'distance': best[0], 'classification': best[1]['classification'],
+                'timestamp': best[1]['timestamp']}
+
+    def __len__(self):
+        return len(self._entries)
+
 
 class ClipboardMonitor:
     """
@@ -28,11 +123,16 @@ class ClipboardMonitor:
     支持文本、图片、链接等多种格式
     """
     
-    def __init__(self, backend_url: str = "http://127.0.0.1:5001"):
+    def __init__(self, backend_url: str = "http://127.0.0.1:5001",
+                 dedupe_window_seconds: float = CLIPBOARD_DEDUPE_WINDOW_SECONDS,
+                 dedupe_max_entries: int = CLIPBOARD_DEDUPE_MAX_ENTRIES,
+                 simhash_distance: int = CLIPBOARD_SIMHASH_DISTANCE):
         self.backend_url = backend_url
         self.last_clipboard_content = None
         self.monitoring = False
         self.captured_items = []
+        # 近期已分类内容，重复或近似重复时不再请求后端
+        self.recent = RecentFingerprints(dedupe_window_seconds, dedupe_max_entries, simhash_distance)
         try:
             base_dir = Path(__file__).parent.absolute()
         except (NameError, AttributeError):
@@ -47,6 +147,21 @@ class ClipboardMonitor:
                 self.captured_items = json.loads(self.history_file.read_text(encoding='utf-8'))
         except:
             self.captured_items = []
+        self._remember_history()
+    
+    def _remember_history(self):
+        """以历史中时间窗口内的分类结果初始化近期指纹"""
+        now = time.time()
+        for item in self.captured_items[-self.recent.max_entries:]:
+            if not isinstance(item, dict) or not item.get('ai_classification') or item.get('duplicate_of'):
+                continue
+            try:
+                captured_at = datetime.fromisoformat(item['timestamp']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if now - captured_at <= self.recent.window_seconds:
+                self.recent.add(item.get('content') or '', item['ai_classification'], item['timestamp'],
+                                captured_at)
     
     def save_history(self):
         """保存剪切板历史"""
@@ -173,6 +288,7 @@ class ClipboardMonitor:
                 # 记录到历史
                 self.captured_items.append(payload)
                 self.save_history()
+                self.recent.add(text_content, result, payload['timestamp'])
                 
                 return True
             else:
@@ -183,6 +299,21 @@ class ClipboardMonitor:
             print(f"❌ Failed to send to backend: {e}")
             return False
     
+    def record_duplicate(self, content: Dict[str, Any], match: Dict[str, Any]):
+        """重复内容不请求后端，以先前的分类结果记入历史（duplicate_of 为先前捕获的时间）"""
+        text_content = content.get('content', '')
+        self.captured_items.append({
+            'content': text_content,
+            'type': content.get('type'),
+            'urls': self.extract_urls(text_content),
+            'timestamp': datetime.now().isoformat(),
+            'source': 'clipboard_monitor',
+            'ai_classification': match['classification'],
+            'duplicate_of': match['timestamp'],
+            'duplicate_match': match['match'],
+        })
+        self.save_history()
+    
     def monitor_loop(self, interval: float = 1.0):
         """
         主监听循环
@@ -203,8 +334,14 @@ class ClipboardMonitor:
                         print(f"   Type: {clipboard_content.get('type')}")
                         print(f"   Preview: {current_content[:100]}...")
                         
+                        # 近期分类过的相同（或仅空白不同、近似）内容直接沿用先前的结果
+                        match = self.recent.find(current_content)
+                        if match is not None:
+                            self.record_duplicate(clipboard_content, match)
+                            print(f"♻️  Duplicate of content captured at {match['timestamp']} ({match['match']}), "
+                                  f"reusing its classification")
                         # 发送到后端进行 AI 分类
-                        if self.send_to_backend(clipboard_content):
+                        elif self.send_to_backend(clipboard_content):
                             print(f"✅ Content sent to backend for classification")
                         
                         self.last_clipboard_content = current_content
@@ -238,6 +375,8 @@ class ClipboardMonitor:
     def clear_history(self):
         """清空历史"""
         self.captured_items = []
+        self.recent = RecentFingerprints(self.recent.window_seconds, self.recent.max_entries,
+                                         self.recent.max_distance)
         self.save_history()
 
 
@@ -1,5 +1,6 @@
 """
 配置文件：集中管理系统配置
+后端（app.py）与剪切板监听（clipboard_monitor.py）的其余设置在各自模块中读取环境变量，说明见 README_BACKEND.md，不在此重复
 """
 import os
 from pathlib import Path
@@ -0,0 +1,177 @@
+"""
+分面索引
+为每篇笔记分配一个序号，类型、标签与固定状态各用一个整数位图记录包含的笔记，筛选时按位与求交集；
+各类型/标签的笔记数随保存、编辑、删除与批量更新增量维护，不带筛选条件的计数无需任何计算
+"""
+import threading
+from collections import Counter
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+if hasattr(int, 'bit_count'):
+    def popcount(bits: int) -> int:
+        return bits.bit_count()
+else:
+    def popcount(bits: int) -> int:
+        return bin(bits).count('1')
+
+
+def item_facets(item: Dict[str, Any]) -> Tuple[str, Tuple[str, ...], bool]:
+    """(类型, 去重后的标签, 是否固定)"""
+    tags = item.get('tags') or []
+    return item.get('type') or '', tuple(dict.fromkeys(tag for tag in tags if isinstance(tag, str))), \
+        bool(item.get('is_pinned'))
+
+
+class FacetIndex:
+    """
+    维护方式与 SearchIndex 相同：首次使用时从索引缓存建立（只读索引条目），随增删改增量更新，
+    索引被其他进程修改后整体重建
+    """
+
+    def __init__(self, notes_index):
+        self.notes_index = notes_index
+        self._lock = threading.RLock()
+        self._generation = None
+        self._reset()
+
+    def _reset(self):
+        # 笔记 id <-> 位图中的序号（删除后的序号不复用，空位过多时重新编号）
+        self._ordinals: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._facets: Dict[str, Tuple[str, Tuple[str, ...], bool]] = {}
+        self._all = 0
+        self._types: Dict[str, int] = {}
+        self._tags: Dict[str, int] = {}
+        self._pinned = 0
+        self._type_counts: Counter = Counter()
+        self._tag_counts: Counter = Counter()
+        self._pinned_count = 0
+
+    # ==================== 维护 ====================
+
+    def _index(self, item: Dict[str, Any]):
+        note_id = item['id']
+        facets = item_facets(item)
+        if self._facets.get(note_id) == facets:
+            return
+        self._remove(note_id)
+        ordinal = self._ordinals.get(note_id)
+        if ordinal is None:
+            ordinal = self._ordinals[note_id] = len(self._ids)
+            self._ids.append(note_id)
+        bit = 1 << ordinal
+        note_type, tags, pinned = facets
+        self._facets[note_id] = facets
+        self._all |= bit
+        self._types[note_type] = self._types.get(note_type, 0) | bit
+        self._type_counts[note_type] += 1
+        for tag in tags:
+            self._tags[tag] = self._tags.get(tag, 0) | bit
+            self._tag_counts[tag] += 1
+        if pinned:
+            self._pinned |= bit
+            self._pinned_count += 1
+
+    def _remove(self, note_id: str):
+        facets = self._facets.pop(note_id, None)
+        if facets is None:
+            return
+        mask = ~(1 << self._ordinals[note_id])
+        note_type, tags, pinned = facets
+        self._all &= mask
+        self._types[note_type] &= mask
+        self._type_counts[note_type] -= 1
+        if not self._type_counts[note_type]:
+            del self._types[note_type], self._type_counts[note_type]
+        for tag in tags:
+            self._tags[tag] &= mask
+            self._tag_counts[tag] -= 1
+            if not self._tag_counts[tag]:
+                del self._tags[tag], self._tag_counts[tag]
+        if pinned:
+            self._pinned &= mask
+            self._pinned_count -= 1
+
+    def _compact(self):
+        """已删除笔记的空位超过一半时重新编号"""
+        if len(self._ids) <= 2 * len(self._facets) + 1024:
+            return
+        facets = self._facets
+        self._reset()
+        for note_id, (note_type, tags, pinned) in facets.items():
+            self._index({'id': note_id, 'type': note_type, 'tags': list(tags), 'is_pinned': pinned})
+
+    def _sync(self):
+        generation = self.notes_index.generation
+        if self._generation == generation:
+            return
+        self._reset()
+        for item in self.notes_index.all():
+            self._index(item)
+        self._generation = generation
+
+    def add_documents(self, items: Iterable[Dict[str, Any]]):
+        """新增或更新笔记（类型、标签或固定状态变化）"""
+        with self._lock:
+            if self._generation is not None:
+                for item in items:
+                    self._index(item)
+
+    def remove_documents(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                self._remove(note_id)
+            self._compact()
+
+    # ==================== 查询 ====================
+
+    def _select(self, note_type: Optional[str], tags: Iterable[str], pinned: Optional[bool]) -> int:
+        bits = self._all if note_type is None else self._types.get(note_type, 0)
+        for tag in tags:
+            bits &= self._tags.get(tag, 0)
+        if pinned is not None:
+            bits = bits & self._pinned if pinned else bits & ~self._pinned
+        return bits
+
+    def _decode(self, bits: int) -> List[str]:
+        """位图 -> 笔记 id 列表（按序号，即加入索引的顺序）"""
+        ids = []
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        for offset, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                ids.append(self._ids[offset * 8 + low.bit_length() - 1])
+                byte ^= low
+        return ids
+
+    def select(self, note_type: Optional[str] = None, tags: Iterable[str] = (),
+               pinned: Optional[bool] = None) -> List[str]:
+        """同时满足各条件的笔记 id：note_type 为 None 时不限类型，tags 需全部包含，pinned 为 None 时不限"""
+        with self._lock:
+            self._sync()
+            return self._decode(self._select(note_type, tags, pinned))
+
+    def counts(self, note_type: Optional[str] = None, tags: Iterable[str] = (),
+               pinned: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        在筛选条件下各类型、各标签与固定笔记的数量（用于侧边栏逐级筛选）；不带条件时直接返回增量维护的计数
+        """
+        tags = list(tags)
+        with self._lock:
+            self._sync()
+            if note_type is None and not tags and pinned is None:
+                return {
+                    'total': len(self._facets),
+                    'types': dict(self._type_counts.most_common()),
+                    'tags': dict(self._tag_counts.most_common()),
+                    'pinned': self._pinned_count,
+                }
+            bits = self._select(note_type, tags, pinned)
+            type_counts = {key: popcount(bits & value) for key, value in self._types.items()}
+            tag_counts = {key: popcount(bits & value) for key, value in self._tags.items()}
+            return {
+                'total': popcount(bits),
+                'types': {key: count for key, count in sorted(type_counts.items(), key=lambda kv: -kv[1]) if count},
+                'tags': {key: count for key, count in sorted(tag_counts.items(), key=lambda kv: -kv[1]) if count},
+                'pinned': popcount(bits & self._pinned),
+            }
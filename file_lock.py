@@ -0,0 +1,112 @@
+"""
+跨进程文件锁与原子写入
+多个后端进程（或与 clean_md.py 等脚本）同时修改数据目录时，用于串行化写入并避免写出半截文件
+"""
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    MSVCRT_AVAILABLE = False
+
+
+class FileLock:
+    """
+    基于锁文件的排他锁
+    POSIX 使用 fcntl.flock，Windows 使用 msvcrt.locking；同一进程内可重入
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _lock_fd(self, fd):
+        if FCNTL_AVAILABLE:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        elif MSVCRT_AVAILABLE:
+            while True:
+                try:
+                    # LK_LOCK 重试约 10 秒后仍失败会抛出 OSError，继续等待
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    return
+                except OSError:
+                    continue
+
+    def _unlock_fd(self, fd):
+        if FCNTL_AVAILABLE:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        elif MSVCRT_AVAILABLE:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    self._lock_fd(fd)
+                except Exception:
+                    os.close(fd)
+                    raise
+            except Exception:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                self._unlock_fd(fd)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def atomic_write_bytes(path: Path, data: bytes, lock: FileLock = None):
+    """
+    原子写入文件：写入同目录临时文件并 fsync，再重命名覆盖目标
+    读者只会看到旧内容或完整的新内容；传入 lock 时仅在重命名期间持有
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if lock is not None:
+            with lock:
+                os.replace(tmp_path, path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def atomic_write_text(path: Path, text: str, lock: FileLock = None, encoding: str = 'utf-8'):
+    """原子写入文本文件（见 atomic_write_bytes）"""
+    atomic_write_bytes(path, text.encode(encoding), lock=lock)
@@ -0,0 +1,245 @@
+"""
+进程内索引缓存
+索引只从存储后端加载一次，之后按 id 字典与类型分组直接在内存中读取；
+本进程的修改同步更新缓存，其他进程的修改通过存储指纹（文件 mtime/大小或数据库版本号）检测后整体重载
+
+写入采用 group commit：并发提交的修改排队，由一个线程在跨进程写锁内整批提交到存储（只做一次持久化），
+其余线程等待结果，从而在并行保存时保持吞吐
+"""
+import hashlib
+import threading
+from collections import Counter
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+from storage import NoteStore
+
+
+class _PendingWrite:
+    """排队等待提交的索引操作"""
+
+    __slots__ = ('op', 'result', 'error', 'done')
+
+    def __init__(self, op):
+        self.op = op
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class IndexCache:
+    """带 id 查找表与类型分组的索引缓存"""
+
+    def __init__(self, store: NoteStore):
+        self.store = store
+        self.version = 0
+        # 每次从存储整体重载时递增，派生索引据此判断是否需要与缓存对账（见 generation）
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._fingerprint = None
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._by_type: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # 内容哈希 -> 引用该内容的笔记数（见 blob_store.py）
+        self._blob_refs: Counter = Counter()
+        self._snapshot: Optional[List[Dict[str, Any]]] = None
+        # 排序字段 -> (排序键列表, 条目列表)，索引变化后失效
+        self._sorted: Dict[str, Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]] = {}
+        # group commit 队列
+        self._commit_cond = threading.Condition()
+        self._queue: List[_PendingWrite] = []
+        self._committing = False
+
+    # ==================== 内部维护 ====================
+
+    def _reload(self):
+        """从存储后端重新加载全部索引"""
+        fingerprint = self.store.fingerprint()
+        items = self.store.load_index()
+        self._items = {}
+        self._by_type = {}
+        self._blob_refs = Counter()
+        for item in items:
+            self._put(item)
+        self._fingerprint = fingerprint
+        self._loaded = True
+        self._generation += 1
+        self._changed()
+
+    def _ensure_fresh(self):
+        if not self._loaded or self.store.fingerprint() != self._fingerprint:
+            self._reload()
+
+    def _changed(self):
+        self.version += 1
+        self._snapshot = None
+        self._sorted = {}
+
+    def _put(self, item):
+        previous = self._items.get(item['id'])
+        if previous is not None:
+            if previous.get('type') != item.get('type'):
+                self._by_type.get(previous.get('type'), {}).pop(item['id'], None)
+            self._blob_refs.subtract(previous.get('blobs', []))
+        self._items[item['id']] = item
+        self._by_type.setdefault(item.get('type'), {})[item['id']] = item
+        self._blob_refs.update(item.get('blobs', []))
+
+    def _remove(self, note_id):
+        item = self._items.pop(note_id, None)
+        if item is not None:
+            group = self._by_type.get(item.get('type'), {})
+            group.pop(note_id, None)
+            if not group:
+                self._by_type.pop(item.get('type'), None)
+            self._blob_refs.subtract(item.get('blobs', []))
+        return item
+
+    def _apply(self, op, result):
+        kind, _ = op
+        if kind == 'put' or (kind == 'update' and result is not None):
+            self._put(dict(result))
+        elif kind == 'delete':
+            for item in result:
+                self._remove(item['id'])
+
+    def _commit(self, batch: List[_PendingWrite]):
+        """
+        将一批操作提交到存储并同步缓存
+        若提交前存储指纹已与缓存不一致（其他进程修改过），则不做增量更新，下次读取时整体重载
+        """
+        ops = [pending.op for pending in batch]
+        try:
+            with self.store.write_lock:
+                fingerprint_before = self.store.fingerprint()
+                results = self.store.apply_batch(ops)
+                fingerprint_after = self.store.fingerprint()
+        except Exception as e:
+            with self._lock:
+                self._loaded = False
+            for pending in batch:
+                pending.error = e
+                pending.done = True
+            return
+
+        with self._lock:
+            if self._loaded and self._fingerprint == fingerprint_before:
+                for op, result in zip(ops, results):
+                    self._apply(op, result)
+                self._fingerprint = fingerprint_after
+                self._changed()
+            elif self._fingerprint != fingerprint_after:
+                self._loaded = False
+        for pending, result in zip(batch, results):
+            pending.result = result
+            pending.done = True
+
+    def _submit(self, ops):
+        """
+        提交一组操作（保证进入同一次提交）
+        无人提交时成为提交者并带上队列中的全部操作，否则等待其他线程代为提交
+        """
+        pendings = [_PendingWrite(op) for op in ops]
+        last = pendings[-1]
+        with self._commit_cond:
+            self._queue.extend(pendings)
+            while self._committing and not last.done:
+                self._commit_cond.wait()
+            if last.done:
+                batch = None
+            else:
+                self._committing = True
+                batch, self._queue = self._queue, []
+
+        if batch is not None:
+            try:
+                self._commit(batch)
+            finally:
+                with self._commit_cond:
+                    self._committing = False
+                    self._commit_cond.notify_all()
+
+        if last.error is not None:
+            raise last.error
+        return [pending.result for pending in pendings]
+
+    # ==================== 读取 ====================
+
+    @property
+    def generation(self) -> int:
+        """整体重载的次数；读取前先检查存储指纹，其他进程的修改在此时即被发现"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._generation
+
+    def all(self) -> List[Dict[str, Any]]:
+        """按插入顺序返回全部索引条目（只读，请勿修改）"""
+        with self._lock:
+            self._ensure_fresh()
+            if self._snapshot is None:
+                self._snapshot = list(self._items.values())
+            return self._snapshot
+
+    def get(self, note_id: str) -> Optional[Dict[str, Any]]:
+        """按 id 获取索引条目的副本"""
+        with self._lock:
+            self._ensure_fresh()
+            item = self._items.get(note_id)
+            return dict(item) if item is not None else None
+
+    def sorted_items(self, field: str) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]:
+        """
+        按 (field, id) 升序排列的索引条目及对应排序键（只读，请勿修改）
+        同一版本内只排序一次，可配合 bisect 做游标分页
+        """
+        with self._lock:
+            self._ensure_fresh()
+            if field not in self._sorted:
+                items = sorted(self._items.values(), key=lambda item: (item.get(field) or '', item['id']))
+                keys = [(item.get(field) or '', item['id']) for item in items]
+                self._sorted[field] = (keys, items)
+            return self._sorted[field]
+
+    def version_tag(self) -> str:
+        """
+        索引内容标识，用作 ETag
+        取自存储指纹而非进程内版本号，多个进程对同一份数据给出相同的值
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return hashlib.sha1(repr(self._fingerprint).encode('utf-8')).hexdigest()[:16]
+
+    def blob_refcount(self, digest: str) -> int:
+        """引用指定内容哈希的笔记数"""
+        with self._lock:
+            self._ensure_fresh()
+            return max(self._blob_refs.get(digest, 0), 0)
+
+    def by_type(self, note_type: str) -> List[Dict[str, Any]]:
+        """返回指定类型的索引条目（只读，请勿修改）"""
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._by_type.get(note_type, {}).values())
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._items)
+
+    # ==================== 写入 ====================
+
+    def add(self, item: Dict[str, Any]):
+        self._submit([('put', dict(item))])
+
+    def update(self, item: Dict[str, Any]):
+        self._submit([('update', dict(item))])
+
+    def delete(self, note_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """删除索引条目，返回实际被删除的条目"""
+        return self._submit([('delete', list(note_ids))])[0]
+
+    def apply(self, ops: List[Tuple[str, Any]]) -> List[Any]:
+        """在一次索引提交中执行多个操作（格式见 NoteStore.apply_batch）"""
+        if not ops:
+            return []
+        ops = [(kind, dict(payload) if isinstance(payload, dict) else list(payload)) for kind, payload in ops]
+        return self._submit(ops)
@@ -0,0 +1,310 @@
+"""
+后台任务队列
+提交后立即返回任务 id，由固定数量的工作线程执行分类、整理等 AI 任务，客户端轮询或订阅结果。
+任务保存在 data/ 下的 SQLite 文件中，排队中的任务在重启后继续执行；领取任务时加租约，执行期间定时续租，
+执行中的进程退出后，租约到期的任务会被重新领取（最多 max_attempts 次）；handler 因暂时性故障失败时按指数退避重新排队，
+同样最多执行 max_attempts 次。多个进程可共用同一数据库。
+每次领取以 attempts 区分，只有持有当前租约的执行者能写入结果，失去租约的执行者的结果被丢弃
+"""
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class JobQueue:
+    """
+    handlers 为 {任务类型: handler(payload) -> 结果 dict}；handler 抛出的异常记为任务失败，
+    异常带 status_code 属性时一并记录（如 LLMError 的 502/503）。
+    is_transient(异常) 为 True 时（如上游超时、限流）任务不直接失败，而是在 retry_base_seconds * 2^(n-1)（带抖动，
+    最多 retry_max_seconds）秒后重新排队，执行满 max_attempts 次后才记为失败
+    """
+
+    def __init__(self, db_file: Path, handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]],
+                 workers: int = 4, lease_seconds: float = 300, max_attempts: int = 3,
+                 retention_seconds: float = 7 * 24 * 3600, poll_interval: float = 1.0,
+                 is_transient: Optional[Callable[[Exception], bool]] = None,
+                 retry_base_seconds: float = 5.0, retry_max_seconds: float = 300.0):
+        self.db_file = Path(db_file)
+        self.handlers = handlers
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.is_transient = is_transient
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        # 本进程内提交或完成任务时唤醒等待的工作线程与订阅者；其他进程的变化靠定时轮询发现
+        self._changed = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._purged_at = 0.0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                error_status INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL,
+                retry_at REAL
+            )
+        ''')
+        # 旧版本创建的数据库没有 retry_at 列
+        if 'retry_at' not in {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}:
+            conn.execute('ALTER TABLE jobs ADD COLUMN retry_at REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+
+    @staticmethod
+    def _to_dict(row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'type': row['type'],
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'error_status': row['error_status'],
+            'attempts': row['attempts'],
+            'created_at': _isoformat(row['created_at']),
+            'started_at': _isoformat(row['started_at']),
+            'finished_at': _isoformat(row['finished_at']),
+            'retry_at': _isoformat(row['retry_at']) if row['status'] == 'queued' else None,
+        }
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    # ==================== 提交与查询 ====================
+
+    def submit(self, job_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """加入队列，任务类型未知时抛出 ValueError"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type} (expected one of {', '.join(self.handlers)})")
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute('INSERT INTO jobs (id, type, payload, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                     (job_id, job_type, json.dumps(payload, ensure_ascii=False), 'queued', time.time()))
+        self._notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: str = '', limit: int = 50) -> List[Dict[str, Any]]:
+        """最近提交的任务，可按状态筛选"""
+        conn = self._connect()
+        if status:
+            rows = conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?',
+                                (status, limit)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排队中的任务，已开始或已结束的任务返回 False"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id))
+        if cursor.rowcount:
+            self._notify()
+        return cursor.rowcount > 0
+
+    def wait(self, job_id: str, timeout: float, after_status: str = '') -> Optional[Dict[str, Any]]:
+        """
+        等待任务结束或状态不再是 after_status（为空时只等结束），最多 timeout 秒，返回最新状态；任务不存在时返回 None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in FINISHED_STATUSES or \
+                    (after_status and job['status'] != after_status):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_interval))
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        return {'workers': len(self._threads), 'jobs': counts}
+
+    # ==================== 执行 ====================
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """
+        领取最早的排队任务（等待重试的任务需到达 retry_at）或租约已过期的执行中任务；超过重试次数的过期任务直接记为失败
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Job exceeded max attempts' "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND (retry_at IS NULL OR retry_at <= ?)) "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY created_at LIMIT 1", (now, now)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? "
+                    "WHERE id = ?", (now, now + self.lease_seconds, row['id']))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _renew(self, job_id, attempt) -> bool:
+        """延长租约；任务已结束或已被重新领取时返回 False"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job_id, attempt))
+        return cursor.rowcount > 0
+
+    def _heartbeat(self, job_id, attempt, done: threading.Event):
+        """任务执行期间每隔租约的三分之一续租一次（独立线程，结束时关闭本线程的连接）"""
+        try:
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not self._renew(job_id, attempt):
+                        return
+                except sqlite3.Error as e:
+                    print(f"⚠️  Job lease renewal failed: {e}")
+        finally:
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+                self._local.conn = None
+
+    def _finish(self, job_id, attempt, status, result=None, error=None, error_status=None) -> bool:
+        """记录结果；任务已被重新领取（attempts 不同）或已结束时不写入，返回 False"""
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, error_status = ?, finished_at = ?, lease_until = NULL '
+            "WHERE id = ? AND attempts = ? AND status = 'running'",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, error_status, time.time(), job_id, attempt))
+        self._notify()
+        return cursor.rowcount > 0
+
+    def _retry_delay(self, attempt: int) -> float:
+        """第 attempt 次执行失败后重新排队的等待秒数"""
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** (attempt - 1)))
+        return random.uniform(delay / 2, delay)
+
+    def _requeue(self, job_id, attempt, error, error_status) -> bool:
+        """暂时性失败：记录本次错误并在退避后重新排队；任务已被重新领取或已结束时返回 False"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', error = ?, error_status = ?, lease_until = NULL, retry_at = ? "
+            "WHERE id = ? AND attempts = ? AND status = 'running'",
+            (error, error_status, time.time() + self._retry_delay(attempt), job_id, attempt))
+        self._notify()
+        return cursor.rowcount > 0
+
+    def run_once(self) -> bool:
+        """领取并执行一个任务，队列为空时返回 False"""
+        row = self._claim()
+        if row is None:
+            return False
+        attempt = row['attempts'] + 1
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(row['id'], attempt, done),
+                                     name=f"job-lease-{row['id'][:8]}", daemon=True)
+        heartbeat.start()
+        retry = False
+        try:
+            result = self.handlers[row['type']](json.loads(row['payload']))
+        except Exception as e:
+            outcome = ('failed', None, str(e), getattr(e, 'status_code', 500))
+            retry = attempt < self.max_attempts and self.is_transient is not None and self.is_transient(e)
+        else:
+            outcome = ('done', result, None, None)
+        finally:
+            done.set()
+            heartbeat.join()
+        if retry:
+            written = self._requeue(row['id'], attempt, *outcome[2:])
+        else:
+            written = self._finish(row['id'], attempt, *outcome)
+        if not written:
+            print(f"⚠️  Job {row['id']} lost its lease, result discarded")
+        return True
+
+    def purge(self) -> int:
+        """删除结束超过 retention_seconds 的任务，返回删除数量"""
+        return self._connect().execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) AND finished_at < ?",
+            (*FINISHED_STATUSES, time.time() - self.retention_seconds)).rowcount
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                if self.run_once():
+                    continue
+                # 队列空闲时每小时清理一次过期任务
+                if time.monotonic() - self._purged_at > 3600:
+                    self._purged_at = time.monotonic()
+                    self.purge()
+            except sqlite3.Error as e:
+                print(f"⚠️  Job worker database error: {e}")
+            with self._changed:
+                if not self._stopping:
+                    self._changed.wait(self.poll_interval)
+
+    def start(self):
+        """启动工作线程（重复调用无效），并清理过期任务"""
+        if self._threads or self.workers <= 0:
+            return
+        self._purged_at = time.monotonic()
+        self.purge()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        self._notify()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,317 @@
+"""
+模型响应的 JSON 提取
+在任意文本（或逐段到达的流式输出）中找出第一个括号配平且能解析的 JSON 对象或数组，容忍前后的说明文字、
+Markdown 代码块标记与多余的尾随逗号；再按各任务的格式（schema）校验并做简单的类型转换。
+无法提取时由调用方以修复提示重试一次（见 ResponseCheck），各任务的解析结果计入 parse_stats
+"""
+import re
+import json
+import threading
+from collections import Counter, deque, namedtuple
+from typing import Optional, Dict, Any, Deque, List, Tuple
+
+REPAIR_SYSTEM_MESSAGE = "You repair malformed JSON. Reply with JSON only."
+# 超过该长度的响应不做修复重试（修复提示需要带上原文）
+REPAIR_MAX_CHARS = 8000
+
+# 解析结果：ok 直接解析成功，extracted 从说明文字或代码块中提取成功，repaired 修复重试后成功，failed 最终失败
+OUTCOMES = ('ok', 'extracted', 'repaired', 'failed')
+
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+CLOSERS = {'{': '}', '[': ']'}
+
+Extraction = namedtuple('Extraction', ['value', 'outcome', 'errors'])
+
+
+class JSONScanner:
+    """
+    增量扫描：feed 逐段传入文本，遇到第一个括号配平且能解析的 JSON 值后 done 为 True、value 为解析结果
+    opening 为允许的起始括号；配平但无法解析的候选（如说明文字中的 {xxx}）会被跳过，从其后继续扫描；
+    结果不符合要求时可调用 resume 跳过它继续查找。
+    每段文本只扫描一次，只保留当前候选值的文本（不拼接整个响应），逐段传入的总耗时与文本长度成线性
+    """
+
+    def __init__(self, opening: str = '{['):
+        self.opening = opening
+        self.done = False
+        self.value = None
+        # 待扫描的文本段（跳过候选时，其起始括号之后的文本重新放回这里）
+        self._pending: Deque[str] = deque()
+        # 当前候选值在之前各段中的文本
+        self._candidate: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+
+    def _restart(self, scanned: str, rest: str) -> str:
+        """
+        结束当前候选，返回其完整文本；其起始括号之后的文本与当前文本段未扫描的部分放回待扫描队列
+        scanned 为候选值在当前文本段中已扫描的部分
+        """
+        candidate = ''.join(self._candidate) + scanned
+        self._candidate = []
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        if rest:
+            self._pending.appendleft(rest)
+        if len(candidate) > 1:
+            self._pending.appendleft(candidate[1:])
+        return candidate
+
+    def _try_parse(self, candidate):
+        try:
+            return True, json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+        cleaned = TRAILING_COMMA_RE.sub(r'\1', candidate)
+        if cleaned != candidate:
+            try:
+                return True, json.loads(cleaned)
+            except json.JSONDecodeError:
+                pass
+        return False, None
+
+    def _scan(self) -> bool:
+        while self._pending:
+            text = self._pending.popleft()
+            # 候选值在当前文本段中的起点
+            segment = 0
+            pos = 0
+            while pos < len(text):
+                char = text[pos]
+                pos += 1
+                if not self._stack:
+                    if char in self.opening:
+                        segment = pos - 1
+                        self._stack = [CLOSERS[char]]
+                    continue
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == '\\':
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in CLOSERS:
+                    self._stack.append(CLOSERS[char])
+                elif char in '}]':
+                    if char != self._stack[-1]:
+                        self._restart(text[segment:pos], text[pos:])
+                        break
+                    self._stack.pop()
+                    if not self._stack:
+                        parsed, value = self._try_parse(self._restart(text[segment:pos], text[pos:]))
+                        if parsed:
+                            self.done = True
+                            self.value = value
+                            return True
+                        break
+            else:
+                if self._stack:
+                    self._candidate.append(text[segment:])
+        return False
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        if chunk:
+            self._pending.append(chunk)
+        return self._scan()
+
+    def resume(self) -> bool:
+        """放弃当前结果，从其起始括号之后继续查找"""
+        if not self.done:
+            return False
+        self.done = False
+        self.value = None
+        return self._scan()
+
+
+# ==================== 格式校验 ====================
+# schema 为 {字段: 类型}，类型为 bool / int / float / str / list / dict，或包含 None 的元组（表示可为 null）；
+# [schema] 表示数组（也接受 {"results": [...]}），元素格式由调用方逐条检查
+
+def _coerce(value, expected):
+    """按期望类型转换，无法转换时抛出 ValueError"""
+    if isinstance(expected, tuple):
+        if value is None and None in expected:
+            return None
+        errors = []
+        for option in expected:
+            if option is None:
+                continue
+            try:
+                return _coerce(value, option)
+            except ValueError as e:
+                errors.append(str(e))
+        raise ValueError('; '.join(errors))
+    if expected is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+            return value.strip().lower() == 'true'
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+    elif expected in (int, float):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return expected(value)
+        if isinstance(value, str):
+            try:
+                return expected(value.strip())
+            except ValueError:
+                pass
+    elif expected is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif expected is list:
+        if isinstance(value, list):
+            return value
+        if isinstance(value, str):
+            return [value] if value else []
+    elif isinstance(value, expected):
+        return value
+    raise ValueError(f"expected {getattr(expected, '__name__', expected)}, got {type(value).__name__}")
+
+
+def validate(value, schema) -> Tuple[Any, List[str]]:
+    """校验并转换，返回 (转换后的值, 错误列表)；对象中多余的字段原样保留"""
+    if isinstance(schema, list):
+        if isinstance(value, dict) and isinstance(value.get('results'), list):
+            value = value['results']
+        if not isinstance(value, list) or not all(isinstance(entry, dict) for entry in value):
+            return value, ['expected a JSON array of objects']
+        return value, []
+    if not isinstance(value, dict):
+        return value, ['expected a JSON object']
+    result = dict(value)
+    errors = []
+    for key, expected in schema.items():
+        if key not in value:
+            errors.append(f'missing field "{key}"')
+            continue
+        try:
+            result[key] = _coerce(value[key], expected)
+        except ValueError as e:
+            errors.append(f'field "{key}": {e}')
+    return result, errors
+
+
+def extract(text: str, schema) -> Extraction:
+    """
+    提取并校验：整段文本就是合格的 JSON 时 outcome 为 ok，否则取文本中第一个合格的 JSON 值，outcome 为 extracted；
+    都失败时 value 与 outcome 为 None，errors 说明原因
+    """
+    stripped = (text or '').strip()
+    opening = '[{' if isinstance(schema, list) else '{'
+    if stripped and stripped[0] in opening:
+        try:
+            value, errors = validate(json.loads(stripped), schema)
+            if not errors:
+                return Extraction(value, 'ok', [])
+        except json.JSONDecodeError:
+            pass
+    scanner = JSONScanner(opening)
+    errors = ['no JSON value found']
+    found = scanner.feed(stripped)
+    while found:
+        value, errors = validate(scanner.value, schema)
+        if not errors:
+            return Extraction(value, 'extracted', [])
+        found = scanner.resume()
+    return Extraction(None, None, errors)
+
+
+def _describe(expected):
+    if isinstance(expected, tuple):
+        return ' | '.join('null' if option is None else _describe(option) for option in expected)
+    return {bool: 'boolean', int: 'integer', float: 'number', str: 'string', list: 'array', dict: 'object'}.get(
+        expected, 'value')
+
+
+def describe_schema(schema) -> str:
+    if isinstance(schema, list):
+        return f"[{describe_schema(schema[0])}, ...]"
+    fields = ', '.join(f'"{key}": {_describe(expected)}' for key, expected in schema.items())
+    return '{' + fields + '}'
+
+
+def repair_prompt(text: str, schema, errors: List[str]) -> Optional[str]:
+    """构造修复提示；响应过长不值得修复时返回 None"""
+    if not text or len(text) > REPAIR_MAX_CHARS:
+        return None
+    return f"""以下文本本应是符合格式要求的 JSON，但无法解析或不符合格式：
+
+{text}
+
+格式要求：
+{describe_schema(schema)}
+
+问题：{'; '.join(errors)}
+
+请保留原有内容，只返回修正后的 JSON，不要其他文本。"""
+
+
+def conforms(text: str, schema) -> bool:
+    """能否从 text 中提取出符合 schema 的 JSON（schema 为 None 时不检查），用于判断缓存中的响应是否可用"""
+    return schema is None or extract(text, schema).value is not None
+
+
+class ResponseCheck:
+    """
+    模型响应的格式检查与一次修复（修复调用由调用方以同步或异步方式完成）：
+    prompt 不为 None 时以它与 REPAIR_SYSTEM_MESSAGE 调用模型，把修复响应传给 finish（调用失败时省略）；
+    prompt 为 None（响应已可用，或过长不值得修复）时直接调用 finish()。
+    finish 返回 (响应, 是否可用)，修复失败时返回原响应（由解析函数兜底）；解析结果计入 parse_stats
+    """
+
+    def __init__(self, content: str, schema, task: str):
+        self.content = content
+        self.schema = schema
+        self.task = task
+        extraction = extract(content, schema)
+        self.outcome = extraction.outcome
+        self.prompt = repair_prompt(content, schema, extraction.errors) if self.outcome is None else None
+
+    def finish(self, repaired: str = '') -> Tuple[str, bool]:
+        content, outcome = self.content, self.outcome
+        if repaired and extract(repaired, self.schema).value is not None:
+            content, outcome = repaired, 'repaired'
+        parse_stats.record(self.task, outcome or 'failed')
+        return content, outcome is not None
+
+
+# ==================== 统计 ====================
+
+class ParseStats:
+    """各任务的解析结果计数（本进程）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Counter] = {}
+
+    def record(self, task: str, outcome: str):
+        with self._lock:
+            self._counts.setdefault(task or 'other', Counter())[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {task: {outcome: counts[outcome] for outcome in OUTCOMES}
+                     for task, counts in self._counts.items()}
+        total = Counter()
+        for counts in tasks.values():
+            total.update(counts)
+        calls = sum(total.values())
+        return {
+            'tasks': tasks,
+            'total': {outcome: total[outcome] for outcome in OUTCOMES},
+            # 最终仍解析失败、只能返回默认结果的模型调用占比
+            'failure_rate': round(total['failed'] / calls, 4) if calls else 0.0,
+        }
+
+
+parse_stats = ParseStats()
@@ -0,0 +1,150 @@
+"""
+大模型响应缓存
+以 (模型, 系统提示, 提示词, 采样参数) 的哈希为键缓存 API 返回的文本：
+进程内 LRU 为一级缓存，data/ 下的 SQLite 文件为二级缓存（多进程共享、重启后仍有效），两级均有过期时间与容量上限
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+
+def make_cache_key(model: str, system_message: str, prompt: str, **params) -> str:
+    """计算缓存键，params 为温度等采样参数"""
+    payload = json.dumps({
+        'model': model,
+        'system': system_message,
+        'prompt': prompt,
+        'params': params,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """两级响应缓存"""
+
+    def __init__(self, db_file: Path, memory_entries: int = 512, max_entries: int = 10000,
+                 ttl_seconds: int = 7 * 24 * 3600):
+        self.db_file = Path(db_file)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # 键 -> (写入时间, 响应文本)，按最近使用排序
+        self._memory: OrderedDict = OrderedDict()
+        self._local = threading.local()
+        self._writes = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    response TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key: str, created_at: float, response: str):
+        with self._lock:
+            self._memory[key] = (created_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # ==================== 读写 ====================
+
+    def get(self, key: str) -> Optional[str]:
+        """返回未过期的缓存响应，未命中返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        conn = self._connect()
+        row = conn.execute('SELECT created_at, response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or now - row[0] >= self.ttl_seconds:
+            self._count('misses')
+            return None
+        with conn:
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        self._remember(key, row[0], row[1])
+        self._count('disk_hits')
+        return row[1]
+
+    def put(self, key: str, response: str):
+        """写入两级缓存，每写入一定次数清理一次过期与超量的磁盘条目"""
+        now = time.time()
+        self._remember(key, now, response)
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT INTO responses (key, created_at, accessed_at, response) VALUES (?, ?, ?, ?) '
+                         'ON CONFLICT(key) DO UPDATE SET created_at = excluded.created_at, '
+                         'accessed_at = excluded.accessed_at, response = excluded.response',
+                         (key, now, now, response))
+        with self._lock:
+            self._stats['writes'] += 1
+            self._writes += 1
+            should_evict = self._writes % 100 == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期条目，并按最近访问时间只保留 max_entries 条，返回删除数量"""
+        conn = self._connect()
+        with conn:
+            removed = conn.execute('DELETE FROM responses WHERE created_at < ?',
+                                   (time.time() - self.ttl_seconds,)).rowcount
+            removed += conn.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+        with self._lock:
+            self._stats['evictions'] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM responses')
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中计数（本进程）与当前条目数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        stats['disk_entries'] = self._connect().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
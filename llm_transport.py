@@ -0,0 +1,473 @@
+"""
+大模型调用传输层
+在 OpenAI 兼容客户端之外统一处理：并发上限（复用长连接）、每分钟请求数与 token 数限流（可由多个进程共用）、
+单次调用截止时间、带抖动的指数退避重试，以及上游持续故障时快速失败的熔断器。调用失败抛出 LLMError，而不是返回错误字符串
+"""
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, AsyncIterator
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+# 可重试的错误：超时、连接失败、限流与服务端 5xx
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMError(Exception):
+    """模型调用失败；transient 为 False 表示请求本身被拒绝（如参数或鉴权错误），重试也不会成功"""
+    status_code = 502
+
+    def __init__(self, message: str = '', transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class CircuitOpenError(LLMError):
+    """熔断器打开，暂停调用上游"""
+    status_code = 503
+
+
+class RateLimitedError(LLMError):
+    """在截止时间之前等不到限流配额"""
+    status_code = 429
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符每字约 1 个，其余字符每 4 个约 1 个"""
+    wide = sum(1 for char in text if ord(char) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按 rate_per_minute / 60 每秒匀速补充；允许欠账，欠账由后续请求排队偿还"""
+
+    def __init__(self, rate_per_minute: float, now: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取走 amount 个令牌需要等待的秒数（不取走）"""
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.tokens
+        return shortfall / self.rate if shortfall > 0 else 0.0
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    每分钟请求数与 token 数两个令牌桶，参数为 0 表示不限制
+    reserve 预先占用配额并返回应等待的秒数，调用方等待后再发起请求；同一进程内的同步与异步调用共用配额
+    """
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self._lock = threading.Lock()
+        now = self.clock()
+        self.requests = TokenBucket(requests_per_minute, now) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, now) if tokens_per_minute > 0 else None
+        self._throttled = 0
+
+    @contextmanager
+    def _locked(self):
+        """持有配额期间的锁，返回当前时间"""
+        with self._lock:
+            yield self.clock()
+
+    def reserve(self, tokens: int, max_wait: float) -> Optional[float]:
+        """占用一次请求与 tokens 个 token 的配额；需要等待超过 max_wait 秒时不占用并返回 None"""
+        with self._locked() as now:
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait > max_wait:
+                return None
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            if wait > 0:
+                self._throttled += 1
+            return wait
+
+    def adjust_tokens(self, delta: int):
+        """按实际用量修正预估：delta > 0 补扣，delta < 0 退还"""
+        if not self.tokens or not delta:
+            return
+        with self._locked() as now:
+            self.tokens._refill(now)
+            if delta > 0:
+                self.tokens.take(delta)
+            else:
+                self.tokens.give_back(-delta)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._locked() as now:
+            stats = {'throttled': self._throttled}
+            for name, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+                if bucket:
+                    bucket._refill(now)
+                    stats[f'{name}_per_minute'] = bucket.capacity
+                    stats[f'{name}_available'] = round(bucket.tokens, 1)
+            return stats
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    令牌桶状态保存在 SQLite 文件中，共用同一文件的所有进程（多个后端进程、工作进程）共享一份配额；
+    每次占用或修正配额都在一个写事务中读出、更新并写回桶的状态（以系统时间计时）
+    """
+    clock = staticmethod(time.time)
+
+    def __init__(self, db_file: Path, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self.db_file = Path(db_file)
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limits '
+                         '(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)')
+            self._conn = conn
+        return self._conn
+
+    def _buckets(self):
+        return [(name, bucket) for name, bucket in (('requests', self.requests), ('tokens', self.tokens)) if bucket]
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = self.clock()
+                for name, bucket in self._buckets():
+                    row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE name = ?',
+                                       (name,)).fetchone()
+                    # 其他进程尚未使用过时为满额；各进程的配额参数应一致，不一致时以本进程为准截断
+                    bucket.tokens, bucket.updated_at = (min(row[0], bucket.capacity), row[1]) if row \
+                        else (bucket.capacity, now)
+                yield now
+                conn.executemany('INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)',
+                                 [(name, bucket.tokens, bucket.updated_at) for name, bucket in self._buckets()])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内直接拒绝调用；
+    之后放行一次探测调用（半开），成功则关闭，失败则重新计时；探测调用未返回结果时，reset_timeout 后再放行一次
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def _retry_in(self, now) -> float:
+        """距离允许下一次调用的秒数"""
+        if self._opened_at is None:
+            return 0.0
+        retry_in = self.reset_timeout - (now - self._opened_at)
+        if self._probe_started is not None:
+            retry_in = max(retry_in, self.reset_timeout - (now - self._probe_started))
+        return retry_in
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'open' if self._retry_in(time.monotonic()) > 0 else 'half_open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            retry_in = self._retry_in(now)
+            if retry_in > 0:
+                raise CircuitOpenError(f"LLM upstream unavailable, retry in {retry_in:.0f}s")
+            self._probe_started = now
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_started = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """第 attempt 次重试前的等待时间（full jitter）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _retry_after(error) -> Optional[float]:
+    """读取限流响应中的 Retry-After（秒）"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMTransport:
+    """
+    同步与异步两种调用方式共用同一套超时、限流、重试与熔断策略
+    timeout 为单次 complete 调用（包括排队、限流等待与重试）的总截止时间
+    """
+
+    def __init__(self, api_key: str, base_url: str, model: str, params: Optional[Dict[str, Any]] = None,
+                 timeout: float = 60.0, max_retries: int = 3, max_concurrency: int = 20,
+                 breaker: Optional[CircuitBreaker] = None, rate_limiter: Optional[RateLimiter] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.params = dict(params or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.rate_limiter = rate_limiter
+        # 重试由本层负责，客户端自身不再重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_client = None
+        self._async_slots = None
+
+    def _messages(self, prompt, system_message):
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _content(completion) -> str:
+        if hasattr(completion, 'choices') and len(completion.choices) > 0:
+            content = completion.choices[0].message.content
+            if content:
+                return content
+        raise LLMError("No valid response from API")
+
+    def _next_delay(self, attempt, error, deadline) -> Optional[float]:
+        """返回重试前的等待时间，不应再重试时返回 None"""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            return None
+        delay = max(backoff_delay(attempt), _retry_after(error) or 0)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _record_error(self, error):
+        if isinstance(error, RETRYABLE_ERRORS):
+            self.breaker.record_failure()
+        else:
+            # 上游可达，只是请求本身被拒绝（如参数或鉴权错误）
+            self.breaker.record_success()
+
+    def _reserve(self, prompt, system_message, deadline):
+        """占用限流配额，返回 (预估 token 数, 需等待的秒数)"""
+        tokens = estimate_tokens(system_message) + estimate_tokens(prompt)
+        if self.rate_limiter is None:
+            return tokens, 0.0
+        wait = self.rate_limiter.reserve(tokens, deadline - time.monotonic())
+        if wait is None:
+            raise RateLimitedError("LLM rate limit reached, request would exceed its deadline")
+        return tokens, wait
+
+    def _settle(self, response, estimated):
+        """按响应中的实际用量修正 token 配额（流式响应没有用量信息）"""
+        usage = getattr(response, 'usage', None)
+        total = getattr(usage, 'total_tokens', None)
+        if self.rate_limiter is not None and isinstance(total, int):
+            self.rate_limiter.adjust_tokens(total - estimated)
+
+    @staticmethod
+    def _delta(chunk) -> str:
+        if chunk.choices:
+            return chunk.choices[0].delta.content or ''
+        return ''
+
+    # ==================== 同步调用 ====================
+
+    def _create(self, prompt, system_message, deadline, **kwargs):
+        """发起请求，按策略重试直到成功或放弃"""
+        attempt = 0
+        while True:
+            # 熔断器打开时直接失败，不占用限流配额
+            self.breaker.before_call()
+            estimated, wait = self._reserve(prompt, system_message, deadline)
+            if wait:
+                time.sleep(wait)
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(prompt, system_message),
+                    timeout=max(deadline - time.monotonic(), 0.001),
+                    **self.params,
+                    **kwargs
+                )
+            except openai.APIError as e:
+                self._record_error(e)
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise LLMError(f"Error calling LLM API: {e}",
+                                   transient=isinstance(e, RETRYABLE_ERRORS)) from e
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._settle(response, estimated)
+            return response
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise LLMError("Timed out waiting for a free LLM connection")
+
+    def complete(self, prompt: str, system_message: str) -> str:
+        deadline = time.monotonic() + self.timeout
+        self._acquire()
+        try:
+            return self._content(self._create(prompt, system_message, deadline))
+        finally:
+            self._slots.release()
+
+    def stream(self, prompt: str, system_message: str) -> Iterator[str]:
+        """
+        流式调用，逐段产出生成的文本
+        只在收到第一段之前重试；timeout 限制建立连接与相邻两段之间的等待，而非整个生成过程
+        """
+        deadline = time.monotonic() + self.timeout
+        self._acquire()
+        try:
+            response = self._create(prompt, system_message, deadline, stream=True)
+            try:
+                for chunk in response:
+                    delta = self._delta(chunk)
+                    if delta:
+                        yield delta
+            except openai.APIError as e:
+                self._record_error(e)
+                raise LLMError(f"LLM stream interrupted: {e}") from e
+            finally:
+                response.close()
+        finally:
+            self._slots.release()
+
+    # ==================== 异步调用 ====================
+
+    def _ensure_async(self):
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                             max_retries=0, timeout=self.timeout)
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def _acreate(self, prompt, system_message, deadline, **kwargs):
+        attempt = 0
+        while True:
+            # 熔断器打开时直接失败，不占用限流配额
+            self.breaker.before_call()
+            estimated, wait = self._reserve(prompt, system_message, deadline)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await self._async_client.chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(prompt, system_message),
+                    timeout=max(deadline - time.monotonic(), 0.001),
+                    **self.params,
+                    **kwargs
+                )
+            except openai.APIError as e:
+                self._record_error(e)
+                delay = self._next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise LLMError(f"Error calling LLM API: {e}",
+                                   transient=isinstance(e, RETRYABLE_ERRORS)) from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._settle(response, estimated)
+            return response
+
+    async def _aacquire(self):
+        self._ensure_async()
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMError("Timed out waiting for a free LLM connection")
+
+    async def acomplete(self, prompt: str, system_message: str) -> str:
+        deadline = time.monotonic() + self.timeout
+        await self._aacquire()
+        try:
+            return self._content(await self._acreate(prompt, system_message, deadline))
+        finally:
+            self._async_slots.release()
+
+    async def astream(self, prompt: str, system_message: str) -> AsyncIterator[str]:
+        """stream 的异步版本"""
+        deadline = time.monotonic() + self.timeout
+        await self._aacquire()
+        try:
+            response = await self._acreate(prompt, system_message, deadline, stream=True)
+            try:
+                async for chunk in response:
+                    delta = self._delta(chunk)
+                    if delta:
+                        yield delta
+            except openai.APIError as e:
+                self._record_error(e)
+                raise LLMError(f"LLM stream interrupted: {e}") from e
+            finally:
+                await response.close()
+        finally:
+            self._async_slots.release()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'model': self.model, 'base_url': self.base_url, 'circuit': self.breaker.state,
+                'rate_limit': self.rate_limiter.stats() if self.rate_limiter else None}
@@ -0,0 +1,335 @@
+"""
+本地快速分类
+明显的内容（空白、纯链接、接口错误 JSON、代码片段、近期分类过的重复内容）由规则直接判定；
+其余内容交给以字符 n-gram 为特征的朴素贝叶斯模型，否则返回 None 由调用方交给大模型。
+模型以已保存笔记（类型即标签）与剪切板历史中大模型给出的分类结果冷启动，之后持续学习大模型的高置信度结果。
+朴素贝叶斯的后验概率随特征数增加迅速趋于 1，不能作为置信度：模型只回答足够长、大部分 n-gram 见过、
+且明显优于次优类别的内容，置信度取该类别在留出样本上的准确率（冷启动时留出部分样本，之后每条大模型结果在学习前先评估）
+"""
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+
+from search_index import normalize
+from storage import original_content
+from ai_tasks import FALLBACK_REASON
+
+# 模型中“不是笔记”的标签
+NOT_NOTE = '__not_note__'
+
+URL_RE = re.compile(r'^(https?://|www\.)\S+$', re.IGNORECASE)
+LOOPBACK_RE = re.compile(r'^(https?://)?(localhost|127\.0\.0\.1|0\.0\.0\.0|\[::1\])([:/]|$)', re.IGNORECASE)
+CODE_LINE_RE = re.compile(
+    r'^\s*(def |class |import |from \S+ import |function\b|const |let |var |public |private |#include|package |'
+    r'return\b|if\s*\(|for\s*\(|while\s*\(|@\w+)'
+    r'|[;{}(]\s*$'
+)
+
+RuleResult = Dict[str, Any]
+
+
+def _result(is_note: bool, note_type: str, confidence: float, reason: str) -> RuleResult:
+    return {'is_note': is_note, 'note_type': note_type, 'confidence': confidence, 'reason': reason}
+
+
+def _error_blob(text: str) -> bool:
+    """形如 {"error": "Endpoint not found"} 的接口错误响应"""
+    if not (text.startswith('{') and text.endswith('}')) or len(text) > 2000:
+        return False
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(parsed, dict) and 0 < len(parsed) <= 4 and \
+        any(key in parsed for key in ('error', 'errors', 'detail', 'message')) and \
+        not any(isinstance(value, (dict, list)) and len(value) > 4 for value in parsed.values())
+
+
+def _looks_like_code(lines) -> bool:
+    """至少三行，且过半的行带有语句关键字或以 ; { } ( 结尾"""
+    if len(lines) < 3:
+        return False
+    code_lines = sum(1 for line in lines if CODE_LINE_RE.search(line))
+    return code_lines * 2 >= len(lines)
+
+
+def classify_by_rules(content: str) -> Optional[RuleResult]:
+    """规则判定，无法判定时返回 None"""
+    text = content.strip()
+    if len(text) < 2:
+        return _result(False, '其他', 0.95, '内容为空或过短')
+    if _error_blob(text):
+        return _result(False, '其他', 0.95, '接口错误响应，不是笔记内容')
+    if URL_RE.match(text):
+        if LOOPBACK_RE.match(text):
+            return _result(False, '其他', 0.9, '本地回环地址，通常只用于开发调试')
+        return _result(True, '参考材料', 0.9, '单独的链接，作为参考材料保存')
+    lines = [line for line in text.splitlines() if line.strip()]
+    if _looks_like_code(lines):
+        return _result(True, '代码片段', 0.9, '内容以代码语句为主')
+    return None
+
+
+def samples_from_history(history_file: Path) -> Iterator[Tuple[str, str]]:
+    """从剪切板历史中取出 (内容, 标签)，跳过没有分类、分类为兜底结果或沿用先前结果的重复条目"""
+    try:
+        history = json.loads(Path(history_file).read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return
+    for entry in history if isinstance(history, list) else []:
+        if not isinstance(entry, dict) or entry.get('duplicate_of'):
+            continue
+        label = label_for(entry.get('ai_classification'))
+        content = entry.get('content')
+        if label and isinstance(content, str) and content.strip():
+            yield content, label
+
+
+def label_for(result: Optional[Dict[str, Any]], min_confidence: float = 0.8) -> Optional[str]:
+    """将大模型分类结果转换为训练标签，结果不可信时返回 None"""
+    if not isinstance(result, dict) or result.get('reason') == FALLBACK_REASON or 'error' in result:
+        return None
+    try:
+        if float(result.get('confidence', 0)) < min_confidence:
+            return None
+    except (TypeError, ValueError):
+        return None
+    if not result.get('is_note'):
+        return NOT_NOTE
+    note_type = result.get('note_type')
+    return note_type if isinstance(note_type, str) and note_type else None
+
+
+class NaiveBayes:
+    """多项式朴素贝叶斯（字符 n-gram 特征，拉普拉斯平滑），支持增量学习"""
+
+    def __init__(self, ngram_sizes=(1, 2, 3), max_chars: int = 2000):
+        self.ngram_sizes = ngram_sizes
+        self.max_chars = max_chars
+        self.class_docs: Counter = Counter()
+        self.class_tokens: Counter = Counter()
+        self.token_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.vocabulary = set()
+
+    def features(self, text: str) -> Counter:
+        text = ' '.join(normalize(text[:self.max_chars]).split())
+        features = Counter()
+        for size in self.ngram_sizes:
+            for start in range(len(text) - size + 1):
+                features[text[start:start + size]] += 1
+        return features
+
+    @property
+    def documents(self) -> int:
+        return sum(self.class_docs.values())
+
+    def learn(self, text: str, label: str):
+        features = self.features(text)
+        self.class_docs[label] += 1
+        self.class_tokens[label] += sum(features.values())
+        self.token_counts[label].update(features)
+        self.vocabulary.update(features)
+
+    def predict(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        返回 {label, margin, known}，尚未学习任何文档或内容没有特征时返回 None
+        margin 为最优与次优类别平均每个特征的对数似然差（只有一个类别时为 inf），known 为最长 n-gram 中见过的比例
+        """
+        total_docs = self.documents
+        features = self.features(text)
+        if not total_docs or not features:
+            return None
+        longest = max(self.ngram_sizes)
+        grams = [(token, count) for token, count in features.items() if len(token) == longest]
+        grams_total = sum(count for _, count in grams)
+        known = sum(count for token, count in grams if token in self.vocabulary) / grams_total if grams_total else 0.0
+        vocabulary_size = len(self.vocabulary) + 1
+        scores = {}
+        for label, docs in self.class_docs.items():
+            counts = self.token_counts[label]
+            denominator = math.log(self.class_tokens[label] + vocabulary_size)
+            score = math.log(docs / total_docs)
+            for token, count in features.items():
+                score += count * (math.log(counts.get(token, 0) + 1) - denominator)
+            scores[label] = score
+        ranked = sorted(scores.values(), reverse=True)
+        best = max(scores, key=scores.get)
+        margin = (ranked[0] - ranked[1]) / sum(features.values()) if len(ranked) > 1 else math.inf
+        return {'label': best, 'margin': margin, 'known': known}
+
+
+class LocalClassifier:
+    """
+    classify(content) 返回带 source 字段（rules / model / duplicate）的分类结果，不够确定时返回 None
+    模型在首次分类时由 bootstrap 提供的样本训练；learn 记录大模型结果，供重复内容直接复用并继续训练模型
+
+    模型只在以下条件都满足时回答：已学习 min_documents 篇且至少两个类别、每个类别都不少于 min_class_docs 篇；
+    内容规范化后不少于 min_chars 个字符、最长 n-gram 中见过的比例不低于 min_known、平均对数似然差不低于 min_margin；
+    预测类别已有 min_evaluations 条留出评估且准确率（即返回的 confidence）不低于 min_confidence
+    """
+
+    def __init__(self, min_confidence: float = 0.95, min_class_docs: int = 20, min_documents: int = 50,
+                 min_chars: int = 20, min_known: float = 0.6, min_margin: float = 0.3, min_evaluations: int = 20,
+                 holdout_every: int = 5, recent_entries: int = 1024, bootstrap=None):
+        self.min_confidence = min_confidence
+        self.min_class_docs = min_class_docs
+        self.min_documents = min_documents
+        self.min_chars = min_chars
+        self.min_known = min_known
+        self.min_margin = min_margin
+        self.min_evaluations = min_evaluations
+        self.holdout_every = holdout_every
+        self.recent_entries = recent_entries
+        self.model = NaiveBayes()
+        self._bootstrap = bootstrap
+        self._trained = bootstrap is None
+        self._lock = threading.Lock()
+        # 内容哈希 -> 最近的分类结果
+        self._recent: OrderedDict = OrderedDict()
+        self._stats = Counter()
+        # 各预测类别在留出样本上的回答次数与正确次数
+        self._evaluated: Counter = Counter()
+        self._correct: Counter = Counter()
+
+    @staticmethod
+    def _digest(content: str) -> str:
+        return hashlib.sha1(content.strip().encode('utf-8')).hexdigest()
+
+    def _ensure_trained(self):
+        with self._lock:
+            if self._trained:
+                return
+            self._trained = True
+            samples = self._bootstrap()
+        # 每 holdout_every 条留出一条，其余训练完后再逐条评估、学习
+        held_out = []
+        for position, (text, label) in enumerate(samples):
+            if self.holdout_every and position % self.holdout_every == self.holdout_every - 1:
+                held_out.append((text, label))
+            else:
+                self.train(text, label)
+        for text, label in held_out:
+            self._evaluate(text, label)
+            self.train(text, label)
+
+    def train(self, text: str, label: str):
+        with self._lock:
+            self.model.learn(text, label)
+
+    def _remember(self, content: str, result: RuleResult):
+        with self._lock:
+            key = self._digest(content)
+            self._recent[key] = result
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.recent_entries:
+                self._recent.popitem(last=False)
+
+    def _candidate(self, content: str) -> Optional[str]:
+        """内容足够长、见过的 n-gram 足够多且明显优于次优类别时返回预测标签（调用方持有锁）"""
+        if len(' '.join(normalize(content).split())) < self.min_chars:
+            return None
+        prediction = self.model.predict(content)
+        if prediction is None or prediction['known'] < self.min_known or prediction['margin'] < self.min_margin:
+            return None
+        return prediction['label']
+
+    def _evaluate(self, content: str, label: str):
+        """以尚未学习该样本的模型预测，记录预测类别的回答与正确次数"""
+        with self._lock:
+            predicted = self._candidate(content)
+            if predicted is not None:
+                self._evaluated[predicted] += 1
+                if predicted == label:
+                    self._correct[predicted] += 1
+
+    def _precision(self, label: str) -> Optional[float]:
+        evaluated = self._evaluated[label]
+        if evaluated < self.min_evaluations:
+            return None
+        return self._correct[label] / evaluated
+
+    def _model_ready(self) -> bool:
+        class_docs = self.model.class_docs
+        return self.model.documents >= self.min_documents and len(class_docs) >= 2 and \
+            min(class_docs.values()) >= self.min_class_docs
+
+    def _predict(self, content: str) -> Optional[RuleResult]:
+        with self._lock:
+            if not self._model_ready():
+                return None
+            label = self._candidate(content)
+            confidence = self._precision(label) if label is not None else None
+            if confidence is None or confidence < self.min_confidence:
+                return None
+        if label == NOT_NOTE:
+            return _result(False, '其他', round(confidence, 4), '与以往判定为非笔记的内容相似')
+        return _result(True, label, round(confidence, 4), f'与已有的“{label}”类内容相似')
+
+    def classify(self, content: str) -> Optional[RuleResult]:
+        key = self._digest(content)
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                self._recent.move_to_end(key)
+        if recent is not None:
+            self._stats['duplicate'] += 1
+            return dict(recent, source='duplicate')
+
+        result = classify_by_rules(content)
+        if result is not None:
+            source = 'rules'
+        else:
+            self._ensure_trained()
+            result = self._predict(content)
+            source = 'model'
+        if result is None:
+            self._stats['escalated'] += 1
+            return None
+        self._stats[source] += 1
+        self._remember(content, result)
+        return dict(result, source=source)
+
+    def learn(self, content: str, result: Dict[str, Any]):
+        """记录大模型的分类结果：可信的结果用于训练，并作为重复内容的直接答案"""
+        label = label_for(result)
+        if label is None:
+            return
+        self._ensure_trained()
+        self._evaluate(content, label)
+        self.train(content, label)
+        self._remember(content, {key: value for key, value in result.items() if key != 'source'})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['documents'] = self.model.documents
+            stats['classes'] = dict(self.model.class_docs)
+            stats['model_ready'] = self._model_ready()
+            stats['held_out'] = {
+                label: {'evaluated': evaluated, 'precision': round(self._correct[label] / evaluated, 4)}
+                for label, evaluated in self._evaluated.items()
+            }
+        return stats
+
+
+def bootstrap_samples(history_file: Path, store, items: Iterable[Dict[str, Any]],
+                      max_notes: int = 2000) -> Iterator[Tuple[str, str]]:
+    """冷启动样本：剪切板历史中的大模型结果，加上最近 max_notes 条笔记的原始内容（类型即标签）"""
+    yield from samples_from_history(history_file)
+    recent = sorted(items, key=lambda item: item.get('created_at', ''), reverse=True)[:max_notes]
+    for item in recent:
+        note_type = item.get('type')
+        if not note_type:
+            continue
+        try:
+            body = store.read_body(item)
+        except Exception:
+            continue
+        text = original_content(body) if body else ''
+        if text:
+            yield text, note_type
@@ -0,0 +1,171 @@
+"""
+数据迁移工具
+将现有的 index.json + data/notes/*.md 导入 SQLite 存储后端、调整笔记目录布局，以及回收未被引用的正文内容
+
+用法：
+    python migrate.py sqlite [--with-bodies] [--data-dir ./data] [--db ./data/notes.sqlite3]
+    python migrate.py reshard --layout month [--backend json] [--batch-size 500] [--data-dir ./data]
+    python migrate.py blob-gc [--backend json] [--data-dir ./data] [--db ./data/notes.sqlite3]
+"""
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from blob_store import BlobStore
+from storage import JsonFileStore, SQLiteStore, create_store, iter_note_files, shard_file_name, NOTES_LAYOUTS
+
+
+def migrate_to_sqlite(data_dir: Path, db_file: Path, with_bodies: bool = False) -> dict:
+    """将 JSON 索引（及可选的笔记正文）导入 SQLite"""
+    notes_dir = data_dir / 'notes'
+    source = JsonFileStore(data_dir / 'index.json', notes_dir)
+    target = SQLiteStore(db_file, notes_dir, store_bodies=with_bodies)
+
+    items = source.load_index()
+    print(f"📥 Importing {len(items)} index entries into {db_file}")
+    target.import_items(items)
+
+    stats = {'notes': len(items), 'bodies': 0, 'missing_bodies': 0, 'orphan_files': 0}
+
+    if with_bodies:
+        for item in items:
+            content = source.read_body(item)
+            if content is None:
+                stats['missing_bodies'] += 1
+                print(f"⚠️  Note file not found: {item['file_name']}")
+                continue
+            target.write_body(item, content)
+            stats['bodies'] += 1
+
+    # 报告索引中未引用的笔记文件
+    indexed = {item['file_name'] for item in items}
+    for file_name, _ in iter_note_files(notes_dir):
+        if file_name not in indexed:
+            stats['orphan_files'] += 1
+            print(f"⚠️  Orphan note file (not in index): {file_name}")
+
+    target.close()
+    return stats
+
+
+def reshard_notes(backend: str, data_dir: Path, db_file: Path, layout: str, batch_size: int = 500) -> dict:
+    """
+    将笔记文件移动到新的目录布局，可在服务运行时执行，中断后重新运行即可继续
+
+    每批在写锁内完成：先为文件建立新路径的硬链接，再一次提交索引中的 file_name，最后删除旧路径；
+    任何时刻索引指向的文件都存在。进度即索引本身，已迁移的条目会被跳过
+    """
+    notes_dir = data_dir / 'notes'
+    store = create_store(backend, data_dir, notes_dir, data_dir / 'index.json',
+                         sqlite_file=db_file, journal_file=data_dir / 'index.journal')
+    stats = {'moved': 0, 'missing': 0, 'batches': 0}
+
+    while True:
+        with store.write_lock:
+            pending = []
+            for item in store.load_index():
+                target = shard_file_name(item['file_name'], layout)
+                if target != item['file_name']:
+                    pending.append((item, target))
+                    if len(pending) >= batch_size:
+                        break
+            if not pending:
+                break
+
+            ops = []
+            old_paths = []
+            for item, target in pending:
+                old_path, new_path = notes_dir / item['file_name'], notes_dir / target
+                if old_path.exists():
+                    new_path.parent.mkdir(parents=True, exist_ok=True)
+                    # 上次中断可能留下未提交的新路径，以索引当前指向的文件为准
+                    if new_path.exists():
+                        new_path.unlink()
+                    try:
+                        os.link(old_path, new_path)
+                    except OSError:
+                        shutil.copy2(old_path, new_path)
+                    old_paths.append(old_path)
+                    stats['moved'] += 1
+                elif not new_path.exists():
+                    stats['missing'] += 1
+                    print(f"⚠️  Note file not found: {item['file_name']}")
+                ops.append(('update', dict(item, file_name=target)))
+
+            store.apply_batch(ops)
+            for old_path in old_paths:
+                old_path.unlink()
+                # 清理迁移后留下的空分片目录
+                parent = old_path.parent
+                while parent != notes_dir:
+                    try:
+                        parent.rmdir()
+                    except OSError:
+                        break
+                    parent = parent.parent
+            stats['batches'] += 1
+        print(f"📦 Batch {stats['batches']}: {len(pending)} note(s)")
+
+    store.close()
+    return stats
+
+
+def collect_blobs(backend: str, data_dir: Path, db_file: Path) -> int:
+    """删除 data/blobs 中未被任何笔记引用的内容，返回删除数量"""
+    store = create_store(backend, data_dir, data_dir / 'notes', data_dir / 'index.json',
+                         sqlite_file=db_file, journal_file=data_dir / 'index.journal')
+    blob_store = BlobStore(data_dir / 'blobs', lock=store.write_lock)
+    # 持有写锁期间读取索引，保证统计引用时没有并发提交
+    with store.write_lock:
+        referenced = {digest for item in store.load_index() for digest in item.get('blobs', [])}
+        return blob_store.sweep(referenced)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AI-Noter 数据迁移工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sqlite_parser = subparsers.add_parser('sqlite', help='导入 index.json 与笔记文件到 SQLite')
+    sqlite_parser.add_argument('--data-dir', default='./data', help='数据目录（默认 ./data）')
+    sqlite_parser.add_argument('--db', default=None, help='SQLite 文件路径（默认 <data-dir>/notes.sqlite3）')
+    sqlite_parser.add_argument('--with-bodies', action='store_true', help='同时将笔记正文写入数据库')
+
+    reshard_parser = subparsers.add_parser('reshard', help='将笔记文件迁移到新的目录布局（可在线执行、可中断续跑）')
+    reshard_parser.add_argument('--layout', required=True, choices=NOTES_LAYOUTS, help='目标布局')
+    reshard_parser.add_argument('--backend', default='json', choices=['json', 'sqlite'], help='存储后端（默认 json）')
+    reshard_parser.add_argument('--batch-size', type=int, default=500, help='每次提交迁移的笔记数（默认 500）')
+    reshard_parser.add_argument('--data-dir', default='./data', help='数据目录（默认 ./data）')
+    reshard_parser.add_argument('--db', default=None, help='SQLite 文件路径（默认 <data-dir>/notes.sqlite3）')
+
+    gc_parser = subparsers.add_parser('blob-gc', help='回收 data/blobs 中未被引用的正文内容')
+    gc_parser.add_argument('--backend', default='json', choices=['json', 'sqlite'], help='存储后端（默认 json）')
+    gc_parser.add_argument('--data-dir', default='./data', help='数据目录（默认 ./data）')
+    gc_parser.add_argument('--db', default=None, help='SQLite 文件路径（默认 <data-dir>/notes.sqlite3）')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'sqlite':
+        data_dir = Path(args.data_dir)
+        db_file = Path(args.db) if args.db else data_dir / 'notes.sqlite3'
+        stats = migrate_to_sqlite(data_dir, db_file, with_bodies=args.with_bodies)
+        print(f"✅ Migration finished: {stats}")
+        print("   Set STORAGE_BACKEND=sqlite to use the new store"
+              + (" (and SQLITE_STORE_BODIES=true)" if args.with_bodies else ""))
+    elif args.command == 'reshard':
+        data_dir = Path(args.data_dir)
+        db_file = Path(args.db) if args.db else data_dir / 'notes.sqlite3'
+        stats = reshard_notes(args.backend, data_dir, db_file, args.layout, batch_size=args.batch_size)
+        print(f"✅ Reshard finished: {stats}")
+        print(f"   Set NOTES_LAYOUT={args.layout} so new notes use the same layout")
+    elif args.command == 'blob-gc':
+        data_dir = Path(args.data_dir)
+        db_file = Path(args.db) if args.db else data_dir / 'notes.sqlite3'
+        removed = collect_blobs(args.backend, data_dir, db_file)
+        print(f"✅ Removed {removed} unreferenced blob(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
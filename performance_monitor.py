@@ -2,6 +2,7 @@
 性能监控工具
 监控系统运行状态和性能指标
 """
+import os
 import time
 import psutil
 import json
@@ -43,10 +44,15 @@ class PerformanceMonitor:
         data_dir = Path('./data')
         total_size = 0
         
-        if data_dir.exists():
-            for file in data_dir.rglob('*'):
-                if file.is_file():
-                    total_size += file.stat().st_size
+        # scandir 的目录项自带类型信息，每个文件只需一次 stat（笔记按目录分片后也能遍历）
+        stack = [str(data_dir)] if data_dir.exists() else []
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total_size += entry.stat(follow_symlinks=False).st_size
         
         return total_size / (1024**2)  # MB
     
@@ -0,0 +1,299 @@
+"""
+相关笔记
+对笔记标题、摘要与正文建立 TF-IDF 稀疏矩阵（CSR：indptr / indices / data），以查询笔记的向量与整个矩阵
+一次向量化运算求余弦相似度并取前 k 条。词元（见 search_index.tokenize）经特征哈希映射到固定维度，无需维护词表；
+矩阵保存词频（1 + log tf），IDF 与行范数在查询时按当前文档频率向量化计算。
+
+保存/编辑笔记时只更新对应的行：旧行标记为失效，新行追加在末尾，失效行过多时压缩。
+矩阵以 .npy 文件保存在 data/ 下（在后台线程中写入，查询不等待磁盘），重启后以内存映射方式加载，只重新计算与索引缓存对不上的笔记。
+依赖 NumPy（可选）
+"""
+import io
+import json
+import math
+import zlib
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from file_lock import FileLock, atomic_write_bytes, atomic_write_text
+from search_index import tokenize
+
+MATRIX_FILES = ('indptr', 'indices', 'data', 'df')
+META_FILE = 'meta.json'
+
+
+def features(text: str, n_features: int) -> Dict[int, float]:
+    """特征哈希后的词频权重 {列: 1 + log(tf)}（crc32 在各进程间一致，可随矩阵一起保存）"""
+    counts = Counter(zlib.crc32(token.encode('utf-8')) % n_features for token in tokenize(text))
+    return {column: 1.0 + math.log(count) for column, count in counts.items()}
+
+
+class RelatedNotesIndex:
+    """
+    维护方式与 SearchIndex 相同：首次查询时加载或建立，随保存/编辑/删除增量更新，并按 updated_at 与索引缓存对账
+    directory 为 None 时只保存在内存中
+    """
+
+    def __init__(self, store, notes_index, directory: Optional[Path] = None, n_features: int = 1 << 20,
+                 flush_rows: int = 64, compact_ratio: float = 0.25):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError('Related notes require numpy (pip install numpy)')
+        self.store = store
+        self.notes_index = notes_index
+        self.directory = Path(directory) if directory is not None else None
+        self.n_features = n_features
+        self.flush_rows = flush_rows
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.directory / '.lock') if self.directory is not None else None
+        self._generation = None
+        # 已合并的矩阵（加载自文件时为只读内存映射）
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._data = np.zeros(0, dtype=np.float32)
+        # 尚未合并的新行 [(列, 权重)]
+        self._pending: List[Tuple[Any, Any]] = []
+        # 行号 -> 笔记 id（失效行为 None），笔记 id -> 行号
+        self._row_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        # 笔记 id -> 建索引时的 updated_at
+        self._indexed: Dict[str, Optional[str]] = {}
+        # 各列的文档频率（只统计有效行）
+        self._df = np.zeros(n_features, dtype=np.int32)
+        # 查询用的派生数组，矩阵变化后重新计算
+        self._weights = None
+        self._row_of_entry = None
+        self._norms = None
+        self._live = None
+        self._unsaved = 0
+        self._save_thread: Optional[threading.Thread] = None
+
+    # ==================== 维护 ====================
+
+    def _row_columns(self, row: int):
+        base_rows = len(self._indptr) - 1
+        if row < base_rows:
+            start, end = self._indptr[row], self._indptr[row + 1]
+            return self._indices[start:end]
+        return self._pending[row - base_rows][0]
+
+    def _index(self, item: Dict[str, Any], content: str):
+        note_id = item['id']
+        self._remove(note_id)
+        text = '\n'.join([item.get('title') or '', item.get('summary') or '', content or ''])
+        weights = features(text, self.n_features)
+        columns = np.fromiter(weights.keys(), dtype=np.int32, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        self._df[columns] += 1
+        self._rows[note_id] = len(self._row_ids)
+        self._row_ids.append(note_id)
+        self._pending.append((columns, values))
+        self._indexed[note_id] = item.get('updated_at')
+        self._weights = None
+        self._unsaved += 1
+
+    def _remove(self, note_id: str):
+        row = self._rows.pop(note_id, None)
+        if row is not None:
+            self._df[self._row_columns(row)] -= 1
+            self._row_ids[row] = None
+            self._weights = None
+            self._unsaved += 1
+        self._indexed.pop(note_id, None)
+
+    def _consolidate(self):
+        """合并新行并压缩失效行"""
+        live = [row for row, note_id in enumerate(self._row_ids) if note_id is not None]
+        dead = len(self._row_ids) - len(live)
+        if not self._pending and dead <= self.compact_ratio * len(self._row_ids):
+            return
+        indptr = self._indptr
+        blocks_indices = [self._indices]
+        blocks_data = [self._data]
+        lengths = [np.diff(indptr)]
+        for columns, values in self._pending:
+            blocks_indices.append(columns)
+            blocks_data.append(values)
+            lengths.append(np.array([len(columns)], dtype=np.int64))
+        indices = np.concatenate(blocks_indices)
+        data = np.concatenate(blocks_data)
+        lengths = np.concatenate(lengths)
+        row_ids = self._row_ids
+        if dead > self.compact_ratio * len(row_ids):
+            keep = np.zeros(len(row_ids), dtype=bool)
+            keep[live] = True
+            entry_keep = np.repeat(keep, lengths)
+            indices = indices[entry_keep]
+            data = data[entry_keep]
+            lengths = lengths[keep]
+            row_ids = [row_ids[row] for row in live]
+        self._indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._indices = indices
+        self._data = data
+        self._pending = []
+        self._row_ids = row_ids
+        self._rows = {note_id: row for row, note_id in enumerate(row_ids) if note_id is not None}
+        self._weights = None
+
+    def _prepare(self):
+        """按当前文档频率计算 TF-IDF 权重与行范数"""
+        if self._weights is not None:
+            return
+        self._consolidate()
+        total_docs = len(self._rows)
+        idf = np.log((1.0 + total_docs) / (1.0 + self._df.astype(np.float32))).astype(np.float32) + 1.0
+        self._weights = self._data * idf[self._indices]
+        self._row_of_entry = np.repeat(np.arange(len(self._row_ids)), np.diff(self._indptr))
+        self._norms = np.sqrt(np.bincount(self._row_of_entry, weights=self._weights ** 2,
+                                          minlength=len(self._row_ids)))
+        self._live = np.array([note_id is not None for note_id in self._row_ids], dtype=bool)
+
+    def _sync(self):
+        generation = self.notes_index.generation
+        if self._generation == generation:
+            return
+        if self._generation is None:
+            self._load()
+        current = {item['id']: item for item in self.notes_index.all()}
+        for note_id in [note_id for note_id in self._indexed if note_id not in current]:
+            self._remove(note_id)
+        for note_id, item in current.items():
+            if note_id not in self._indexed or self._indexed[note_id] != item.get('updated_at'):
+                self._index(item, self.store.read_body(item) or '')
+        self._generation = generation
+        self._prepare()
+
+    def add_document(self, item: Dict[str, Any], content: str):
+        """新增或更新一篇笔记"""
+        with self._lock:
+            if self._generation is not None:
+                self._index(item, content)
+
+    def remove_documents(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                self._remove(note_id)
+
+    # ==================== 持久化 ====================
+
+    def _load(self):
+        """加载已保存的矩阵；文件缺失、维度不同或互相对不上时从空矩阵开始"""
+        if self.directory is None or not (self.directory / META_FILE).exists():
+            return
+        try:
+            with self._file_lock:
+                meta = json.loads((self.directory / META_FILE).read_text(encoding='utf-8'))
+                arrays = {name: np.load(self.directory / f'{name}.npy', mmap_mode='r') for name in MATRIX_FILES}
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Related notes matrix not loaded: {e}")
+            return
+        row_ids = meta.get('row_ids', [])
+        indptr = arrays['indptr']
+        if meta.get('n_features') != self.n_features or len(indptr) != len(row_ids) + 1 or \
+                int(indptr[-1]) != len(arrays['indices']) or len(arrays['indices']) != len(arrays['data']) or \
+                len(arrays['df']) != self.n_features:
+            return
+        self._indptr = indptr
+        self._indices = arrays['indices']
+        self._data = arrays['data']
+        self._df = np.array(arrays['df'])
+        self._row_ids = row_ids
+        self._rows = {note_id: row for row, note_id in enumerate(row_ids) if note_id is not None}
+        updated = meta.get('updated_at', {})
+        self._indexed = {note_id: updated.get(note_id) for note_id in self._rows}
+        self._weights = None
+        self._unsaved = 0
+
+    def _save(self):
+        """累计 flush_rows 行变化后在后台线程写回（未写回的变化在重启后由对账补上）"""
+        if self.directory is None or self._unsaved < self.flush_rows or \
+                (self._save_thread is not None and self._save_thread.is_alive()):
+            return
+        self._save_thread = threading.Thread(target=self._write, name='related-notes-save', daemon=True)
+        self._save_thread.start()
+
+    def _snapshot(self):
+        """在锁内合并矩阵并取出要写入的数组与元数据，写文件时不再持有锁"""
+        with self._lock:
+            self._consolidate()
+            # 覆盖文件前先读入内存，不再引用旧文件的内存映射（Windows 上无法替换仍被映射的文件）
+            if isinstance(self._indices, np.memmap):
+                self._indptr, self._indices, self._data = (np.array(array) for array in
+                                                           (self._indptr, self._indices, self._data))
+            # 合并后的数组不再原地修改，文档频率会随增删变化，需要复制
+            arrays = {'indptr': self._indptr, 'indices': self._indices, 'data': self._data, 'df': self._df.copy()}
+            meta = {
+                'n_features': self.n_features,
+                'row_ids': list(self._row_ids),
+                'updated_at': {note_id: self._indexed.get(note_id) for note_id in self._rows},
+            }
+            self._unsaved = 0
+        return arrays, meta
+
+    def _write(self):
+        arrays, meta = self._snapshot()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with self._file_lock:
+                for name, array in arrays.items():
+                    buffer = io.BytesIO()
+                    np.save(buffer, np.ascontiguousarray(array))
+                    atomic_write_bytes(self.directory / f'{name}.npy', buffer.getvalue())
+                # 元数据最后写入，加载时据此校验各数组是否一致
+                atomic_write_text(self.directory / META_FILE, json.dumps(meta, ensure_ascii=False))
+        except OSError as e:
+            print(f"⚠️  Related notes matrix not saved: {e}")
+
+    def flush(self):
+        """等待后台写回结束，并立即写回其后未保存的变化"""
+        if self._save_thread is not None:
+            self._save_thread.join()
+        with self._lock:
+            pending = self.directory is not None and self._generation is not None and self._unsaved
+        if pending:
+            self._write()
+
+    # ==================== 查询 ====================
+
+    def related(self, note_id: str, k: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """与笔记内容最相关的 k 篇笔记 [(笔记 id, 余弦相似度)]，按相似度降序；笔记不存在时返回 None"""
+        with self._lock:
+            self._sync()
+            self._prepare()
+            self._save()
+            row = self._rows.get(note_id)
+            if row is None:
+                return None
+            start, end = self._indptr[row], self._indptr[row + 1]
+            query_norm = self._norms[row]
+            if not query_norm or k <= 0:
+                return []
+            query = np.zeros(self.n_features, dtype=np.float32)
+            query[self._indices[start:end]] = self._weights[start:end]
+            dots = np.bincount(self._row_of_entry, weights=self._weights * query[self._indices],
+                               minlength=len(self._row_ids))
+            norms = self._norms * query_norm
+            scores = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+            scores[~self._live] = 0.0
+            scores[row] = 0.0
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(self._row_ids[index], round(float(scores[index]), 4)) for index in top if scores[index] > 0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'documents': len(self._rows),
+                'rows': len(self._row_ids),
+                'entries': int(self._indptr[-1]) + sum(len(columns) for columns, _ in self._pending),
+                'unsaved': self._unsaved,
+            }
@@ -0,0 +1,305 @@
+"""
+全文倒排索引
+对笔记标题、摘要与正文建立位置倒排表，中文按字符二元组（bigram）切分，英文/数字按单词切分；
+支持多词 AND、引号短语与类型过滤，随保存/编辑/删除增量维护；结果按 BM25 排序并可生成高亮摘要
+"""
+import re
+import math
+import heapq
+import threading
+import unicodedata
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+# 中日韩字符（统一表意文字、扩展 A、兼容表意文字、假名、韩文音节）
+CJK_PATTERN = r'぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+TOKEN_RE = re.compile(rf'[{CJK_PATTERN}]+|[^\W{CJK_PATTERN}]+')
+CJK_RE = re.compile(rf'[{CJK_PATTERN}]')
+QUERY_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize(text: str) -> str:
+    """全角转半角并转为小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分文本为词元序列
+    中文连续片段切为重叠的二元组（单字片段保留单字），其余按单词切分
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(normalize(text)):
+        if CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """解析查询：空白分隔的每一项、以及引号内的短语，各自为一个需连续出现的词元序列"""
+    terms = []
+    for phrase, word in QUERY_TERM_RE.findall(query or ''):
+        tokens = tokenize(phrase or word)
+        if tokens:
+            terms.append(tokens)
+    return terms
+
+
+def _normalize_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """逐字符规范化，并记录规范化文本每个字符对应的原文位置"""
+    chars = []
+    offsets = []
+    for index, char in enumerate(text):
+        normalized = normalize(char)
+        chars.append(normalized)
+        offsets.extend([index] * len(normalized))
+    offsets.append(len(text))
+    return ''.join(chars), offsets
+
+
+def find_matches(text: str, query: str, limit: int = 50) -> List[Tuple[int, int]]:
+    """返回查询项在原文中的命中区间 [start, end)，按位置排序并合并重叠"""
+    patterns = []
+    for phrase, word in QUERY_TERM_RE.findall(query or ''):
+        words = normalize(phrase or word).split()
+        if words:
+            patterns.append(r'\s+'.join(re.escape(w) for w in words))
+    if not patterns or not text:
+        return []
+
+    normalized, offsets = _normalize_with_offsets(text)
+    spans = []
+    for match in re.finditer('|'.join(patterns), normalized):
+        if match.end() > match.start():
+            spans.append((offsets[match.start()], offsets[match.end()]))
+        if len(spans) >= limit:
+            break
+
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_snippet(text: str, query: str, width: int = 120) -> Dict[str, Any]:
+    """
+    生成命中摘要
+    截取第一个命中附近 width 个字符，highlights 为摘要内的命中区间，offset 为摘要在原文中的起点
+    """
+    text = text or ''
+    matches = find_matches(text, query)
+    if not matches:
+        return {'text': text[:width].strip(), 'offset': 0, 'highlights': []}
+
+    first_start = matches[0][0]
+    start = max(0, first_start - width // 4)
+    end = min(len(text), start + width)
+    highlights = [
+        [max(match_start, start) - start, min(match_end, end) - start]
+        for match_start, match_end in matches
+        if match_start < end and match_end > start
+    ]
+    return {'text': text[start:end], 'offset': start, 'highlights': highlights}
+
+
+class SearchIndex:
+    """增量维护的位置倒排索引"""
+
+    def __init__(self, store, notes_index):
+        self.store = store
+        self.notes_index = notes_index
+        self._lock = threading.RLock()
+        self._generation = None
+        # 词元 -> {笔记 id -> 位置列表}
+        self._postings: Dict[str, Dict[str, List[int]]] = {}
+        # 汉字 -> 包含该字的二元组（用于单字查询）
+        self._char_bigrams: Dict[str, Set[str]] = {}
+        # 笔记 id -> 词元集合（用于删除）
+        self._doc_tokens: Dict[str, Set[str]] = {}
+        self._doc_types: Dict[str, str] = {}
+        self._type_docs: Dict[str, Set[str]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        # 笔记 id -> 建索引时的 updated_at（用于与索引缓存对账）
+        self._indexed: Dict[str, Optional[str]] = {}
+
+    # ==================== 维护 ====================
+
+    def _index(self, item: Dict[str, Any], content: str):
+        note_id = item['id']
+        self._remove(note_id)
+        text = '\n'.join([item.get('title') or '', item.get('summary') or '', content or ''])
+        tokens = tokenize(text)
+        positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        self._doc_lengths[note_id] = len(tokens)
+        self._total_length += len(tokens)
+        for token, token_positions in positions.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._add_bigram(token)
+            postings[note_id] = token_positions
+        self._doc_tokens[note_id] = set(positions)
+        self._doc_types[note_id] = item.get('type')
+        self._type_docs.setdefault(item.get('type'), set()).add(note_id)
+        self._indexed[note_id] = item.get('updated_at')
+
+    def _remove(self, note_id: str):
+        for token in self._doc_tokens.pop(note_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(note_id, None)
+                if not postings:
+                    del self._postings[token]
+                    self._remove_bigram(token)
+        note_type = self._doc_types.pop(note_id, None)
+        type_docs = self._type_docs.get(note_type)
+        if type_docs is not None:
+            type_docs.discard(note_id)
+            if not type_docs:
+                del self._type_docs[note_type]
+        self._indexed.pop(note_id, None)
+        self._total_length -= self._doc_lengths.pop(note_id, 0)
+
+    def _add_bigram(self, token: str):
+        if len(token) == 2 and CJK_RE.match(token):
+            for char in set(token):
+                self._char_bigrams.setdefault(char, set()).add(token)
+
+    def _remove_bigram(self, token: str):
+        if len(token) == 2 and CJK_RE.match(token):
+            for char in set(token):
+                bigrams = self._char_bigrams.get(char)
+                if bigrams is not None:
+                    bigrams.discard(token)
+                    if not bigrams:
+                        del self._char_bigrams[char]
+
+    def _sync(self):
+        """
+        与索引缓存对账：首次使用时全量建立，索引被其他进程修改后只重建有变化的笔记
+        """
+        generation = self.notes_index.generation
+        if self._generation == generation:
+            return
+        current = {item['id']: item for item in self.notes_index.all()}
+        for note_id in [note_id for note_id in self._indexed if note_id not in current]:
+            self._remove(note_id)
+        for note_id, item in current.items():
+            if note_id not in self._indexed or self._indexed[note_id] != item.get('updated_at'):
+                self._index(item, self.store.read_body(item) or '')
+        self._generation = generation
+
+    def add_document(self, item: Dict[str, Any], content: str):
+        """新增或更新一篇笔记"""
+        with self._lock:
+            if self._generation is not None:
+                self._index(item, content)
+
+    def remove_documents(self, note_ids):
+        """删除笔记"""
+        with self._lock:
+            for note_id in note_ids:
+                self._remove(note_id)
+
+    # ==================== 查询 ====================
+
+    def _token_docs(self, token: str) -> Dict[str, List[int]]:
+        return self._postings.get(token, {})
+
+    def _match_term(self, tokens: List[str], candidates: Optional[Set[str]]) -> Set[str]:
+        """返回包含连续词元序列的笔记 id"""
+        if len(tokens) == 1 and len(tokens[0]) == 1 and CJK_RE.match(tokens[0]):
+            # 单个汉字：匹配单字片段以及所有包含该字的二元组
+            char = tokens[0]
+            matched = set(self._token_docs(char))
+            for token in self._char_bigrams.get(char, ()):
+                matched.update(self._postings[token])
+            return matched if candidates is None else matched & candidates
+
+        # 从最短的倒排表开始求交集
+        postings = [self._token_docs(token) for token in tokens]
+        if any(not p for p in postings):
+            return set()
+        docs = set(min(postings, key=len))
+        if candidates is not None:
+            docs &= candidates
+        for p in postings:
+            docs.intersection_update(p)
+            if not docs:
+                return docs
+
+        if len(tokens) == 1:
+            return docs
+
+        # 校验词元位置是否连续
+        matched = set()
+        for note_id in docs:
+            position_sets = [set(p[note_id]) for p in postings[1:]]
+            for start in postings[0][note_id]:
+                if all(start + offset + 1 in positions for offset, positions in enumerate(position_sets)):
+                    matched.add(note_id)
+                    break
+        return matched
+
+    def _score(self, note_ids: Set[str], tokens: Set[str]) -> Dict[str, float]:
+        """BM25 打分"""
+        total_docs = len(self._indexed)
+        avg_length = (self._total_length / total_docs) if total_docs else 0
+        scores = dict.fromkeys(note_ids, 0.0)
+        for token in tokens:
+            postings = self._token_docs(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for note_id in note_ids:
+                positions = postings.get(note_id)
+                if not positions:
+                    continue
+                tf = len(positions)
+                norm = 1 - BM25_B + BM25_B * self._doc_lengths.get(note_id, 0) / (avg_length or 1)
+                scores[note_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+    def search(self, query: str, note_type: str = '', limit: Optional[int] = None,
+               offset: int = 0) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        查询笔记
+        所有查询项需同时命中（AND），引号内为短语；note_type 非空时只返回该类型
+        返回 (命中总数, [(笔记 id, 得分)])，按得分降序、同分时新笔记在前，取 offset 起的 limit 条
+        """
+        terms = parse_query(query)
+        with self._lock:
+            self._sync()
+            candidates = self._type_docs.get(note_type, set()) if note_type else None
+            if not terms:
+                matched = set(candidates) if candidates is not None else set(self._indexed)
+                scores = dict.fromkeys(matched, 0.0)
+            else:
+                # 先计算命中文档最少的查询项
+                terms.sort(key=lambda tokens: min(len(self._token_docs(t)) for t in tokens))
+                for tokens in terms:
+                    candidates = self._match_term(tokens, candidates)
+                    if not candidates:
+                        return 0, []
+                scores = self._score(candidates, {token for tokens in terms for token in tokens})
+
+            end = None if limit is None else offset + limit
+            if end is None:
+                ranked = sorted(scores.items(), key=lambda hit: (hit[1], hit[0]), reverse=True)
+            else:
+                ranked = heapq.nlargest(end, scores.items(), key=lambda hit: (hit[1], hit[0]))
+            return len(scores), ranked[offset:end]
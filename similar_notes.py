@@ -0,0 +1,197 @@
+"""
+相似笔记检索
+对笔记原始内容的字符三元组（shingle）集合计算 MinHash 签名，按 LSH 分段（band）建立桶，
+查询时只比较与新内容至少有一段签名相同的笔记，按估计的 Jaccard 相似度取前 k 条；随保存/编辑/删除增量维护。
+签名使用进程内的 hash()，只保存在内存中，每个进程首次查询时重新建立
+"""
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from search_index import normalize
+from storage import original_content
+
+MASK64 = (1 << 64) - 1
+
+
+def shingles(text: str, size: int = 3, max_chars: int = 10000) -> set:
+    """规范化并合并空白后的字符 size 元组集合；文本不足 size 个字符时整体作为一个元素"""
+    text = ' '.join(normalize(text[:max_chars]).split())
+    if len(text) < size:
+        return {text} if text else set()
+    return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+
+class MinHashLSH:
+    """
+    单次哈希的 MinHash（one permutation hashing）：哈希值的高位决定分箱、低位取最小值，
+    空箱从其后第一个非空箱借值（加上距离偏移以免与真实值相同），每篇只需哈希一遍 shingle
+    签名分为 bands 段、每段 rows 个值，任一段完全相同即成为候选；两篇的 Jaccard 相似度为 s 时
+    成为候选的概率为 1 - (1 - s^rows)^bands
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 64):
+        if num_perm & (num_perm - 1) or num_perm % bands:
+            raise ValueError('num_perm must be a power of two divisible by bands')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._bin_shift = 64 - (num_perm.bit_length() - 1)
+        self._value_mask = (1 << self._bin_shift) - 1
+        # (段序号, 段内签名) -> 笔记 id 集合
+        self._buckets: Dict[Tuple[int, tuple], set] = {}
+        self._signatures: Dict[str, tuple] = {}
+
+    def signature(self, items) -> Optional[tuple]:
+        """集合为空时返回 None"""
+        bins = [None] * self.num_perm
+        for item in items:
+            value = hash(item) & MASK64
+            index = value >> self._bin_shift
+            value &= self._value_mask
+            if bins[index] is None or value < bins[index]:
+                bins[index] = value
+        filled = [index for index, value in enumerate(bins) if value is not None]
+        if not filled:
+            return None
+        if len(filled) < self.num_perm:
+            for index in range(self.num_perm):
+                if bins[index] is not None:
+                    continue
+                for distance in range(1, self.num_perm):
+                    borrowed = bins[(index + distance) % self.num_perm]
+                    if borrowed is not None and borrowed <= self._value_mask:
+                        bins[index] = borrowed + (distance << self._bin_shift)
+                        break
+        return tuple(bins)
+
+    def _band_keys(self, signature: tuple):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def add(self, key: str, signature: tuple):
+        self.remove(key)
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def candidates(self, signature: tuple) -> set:
+        found = set()
+        for band_key in self._band_keys(signature):
+            found.update(self._buckets.get(band_key, ()))
+        return found
+
+    def similarity(self, signature: tuple, key: str) -> float:
+        """估计的 Jaccard 相似度（相同签名值的比例）"""
+        other = self._signatures.get(key)
+        if other is None:
+            return 0.0
+        return sum(1 for a, b in zip(signature, other) if a == b) / self.num_perm
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+class SimilarNotesIndex:
+    """笔记原始内容的相似度索引，维护方式与 SearchIndex 相同（首次查询时全量建立，之后增量更新并与索引缓存对账）"""
+
+    def __init__(self, store, notes_index, num_perm: int = 128, bands: int = 64, excerpt_chars: int = 300):
+        self.store = store
+        self.notes_index = notes_index
+        self.excerpt_chars = excerpt_chars
+        self.lsh = MinHashLSH(num_perm, bands)
+        self._lock = threading.RLock()
+        self._generation = None
+        self._doc_types: Dict[str, str] = {}
+        self._excerpts: Dict[str, str] = {}
+        # 笔记 id -> 建索引时的 updated_at
+        self._indexed: Dict[str, Optional[str]] = {}
+
+    # ==================== 维护 ====================
+
+    def _index(self, item: Dict[str, Any], content: str):
+        note_id = item['id']
+        self._remove(note_id)
+        text = original_content(content or '')
+        signature = self.lsh.signature(shingles(text))
+        if signature is not None:
+            self.lsh.add(note_id, signature)
+            self._doc_types[note_id] = item.get('type')
+            self._excerpts[note_id] = ' '.join(text[:self.excerpt_chars].split())
+        self._indexed[note_id] = item.get('updated_at')
+
+    def _remove(self, note_id: str):
+        self.lsh.remove(note_id)
+        self._doc_types.pop(note_id, None)
+        self._excerpts.pop(note_id, None)
+        self._indexed.pop(note_id, None)
+
+    def _sync(self):
+        generation = self.notes_index.generation
+        if self._generation == generation:
+            return
+        current = {item['id']: item for item in self.notes_index.all()}
+        for note_id in [note_id for note_id in self._indexed if note_id not in current]:
+            self._remove(note_id)
+        for note_id, item in current.items():
+            if note_id not in self._indexed or self._indexed[note_id] != item.get('updated_at'):
+                self._index(item, self.store.read_body(item) or '')
+        self._generation = generation
+
+    def add_document(self, item: Dict[str, Any], content: str):
+        """新增或更新一篇笔记（content 为笔记正文）"""
+        with self._lock:
+            if self._generation is not None:
+                self._index(item, content)
+
+    def remove_documents(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                self._remove(note_id)
+
+    # ==================== 查询 ====================
+
+    def query(self, content: str, k: int = 5, note_type: str = '',
+              min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        与 content 最相似的 k 篇笔记，按相似度降序：[{id, title, type, similarity, excerpt}]
+        note_type 非空时只返回该类型，相似度低于 min_similarity 的不返回
+        """
+        signature = self.lsh.signature(shingles(content))
+        if signature is None:
+            return []
+        with self._lock:
+            self._sync()
+            scored = []
+            for note_id in self.lsh.candidates(signature):
+                if note_type and self._doc_types.get(note_id) != note_type:
+                    continue
+                similarity = self.lsh.similarity(signature, note_id)
+                if similarity >= min_similarity:
+                    scored.append((similarity, note_id))
+            scored.sort(reverse=True)
+            results = []
+            for similarity, note_id in scored[:k]:
+                item = self.notes_index.get(note_id) or {}
+                results.append({
+                    'id': note_id,
+                    'title': item.get('title', ''),
+                    'type': self._doc_types.get(note_id),
+                    'similarity': round(similarity, 4),
+                    'excerpt': self._excerpts.get(note_id, ''),
+                })
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'documents': len(self.lsh)}
@@ -0,0 +1,516 @@
+"""
+笔记存储后端
+提供可插拔的索引与正文存储：JSON 文件（默认，适合小规模）与 SQLite（WAL 模式）
+"""
+import os
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
+
+from file_lock import FileLock, atomic_write_text
+
+
+class NoteStore:
+    """
+    存储后端基类
+    索引条目为字典（id/title/type/summary/file_name/...），正文为 Markdown 文本
+
+    索引修改统一通过 apply_batch 提交，一批操作只做一次持久化（group commit）；
+    write_lock 为跨进程文件锁，所有写入者（包括其他后端进程与维护脚本）共用
+    """
+
+    name = 'base'
+    write_lock: FileLock
+    # 可选的内容寻址存储（见 blob_store.py），启用后正文中的大段落以引用形式保存
+    blob_store = None
+
+    def load_index(self) -> List[Dict[str, Any]]:
+        """按插入顺序返回全部索引条目"""
+        raise NotImplementedError
+
+    def fingerprint(self):
+        """
+        返回能反映索引是否被修改的廉价标识（不解析索引）
+        其他进程写入后该值会变化，供内存缓存判断是否失效
+        """
+        raise NotImplementedError
+
+    def get_item(self, note_id: str) -> Optional[Dict[str, Any]]:
+        """按 id 获取单个索引条目"""
+        return next((item for item in self.load_index() if item['id'] == note_id), None)
+
+    def apply_batch(self, ops: List[Tuple[str, Any]]) -> List[Any]:
+        """
+        在一次提交中按顺序执行多个索引操作，返回每个操作的结果：
+        - ('put', item)：新增或覆盖条目，结果为该条目
+        - ('update', item)：仅当条目存在时覆盖，结果为该条目或 None
+        - ('delete', note_ids)：删除条目，结果为实际被删除的条目列表
+        """
+        raise NotImplementedError
+
+    def add_item(self, item: Dict[str, Any]):
+        """新增索引条目"""
+        self.apply_batch([('put', item)])
+
+    def update_item(self, item: Dict[str, Any]):
+        """按 id 覆盖已有索引条目"""
+        self.apply_batch([('update', item)])
+
+    def delete_items(self, note_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """删除索引条目，返回实际被删除的条目"""
+        return self.apply_batch([('delete', list(note_ids))])[0]
+
+    def import_items(self, items: List[Dict[str, Any]]):
+        """批量导入索引条目（迁移使用）"""
+        self.apply_batch([('put', item) for item in items])
+
+    def read_body(self, item: Dict[str, Any]) -> Optional[str]:
+        """读取笔记正文，不存在时返回 None"""
+        content = self._read_raw(item)
+        if content is not None and self.blob_store is not None:
+            content = self.blob_store.unpack(content)
+        return content
+
+    def write_body(self, item: Dict[str, Any], content: str):
+        """
+        写入笔记正文
+        启用内容寻址存储时，会把引用的内容哈希记录到 item['blobs']（需随后提交索引）
+        """
+        if self.blob_store is not None:
+            content, digests = self.blob_store.pack(content)
+            if digests or 'blobs' in item:
+                item['blobs'] = digests
+        self._write_raw(item, content)
+
+    def delete_body(self, item: Dict[str, Any]):
+        """删除笔记正文（引用的内容由调用方在索引提交后回收）"""
+        self._delete_raw(item)
+
+    def _read_raw(self, item: Dict[str, Any]) -> Optional[str]:
+        raise NotImplementedError
+
+    def _write_raw(self, item: Dict[str, Any], content: str):
+        raise NotImplementedError
+
+    def _delete_raw(self, item: Dict[str, Any]):
+        raise NotImplementedError
+
+    def close(self):
+        """释放资源"""
+        pass
+
+
+# 笔记目录布局：flat（单一目录）、month（按 YYYY/MM 分目录）、hash（按文件名哈希前两位分目录）
+NOTES_LAYOUTS = ('flat', 'month', 'hash')
+
+
+def shard_file_name(file_name: str, layout: str = 'flat') -> str:
+    """
+    返回笔记文件相对 notes_dir 的路径（即索引中的 file_name，以 / 分隔）
+    文件名不以日期开头时 month 布局退化为 flat
+    """
+    name = file_name.replace('\\', '/').rsplit('/', 1)[-1]
+    if layout == 'month' and len(name) >= 6 and name[:6].isdigit():
+        return f"{name[:4]}/{name[4:6]}/{name}"
+    if layout == 'hash':
+        return f"{hashlib.sha1(name.encode('utf-8')).hexdigest()[:2]}/{name}"
+    if layout in NOTES_LAYOUTS:
+        return name
+    raise ValueError(f"Unknown notes layout: {layout}")
+
+
+# 笔记正文中“原始内容”一节（见 app.build_note）
+ORIGINAL_CONTENT_RE = re.compile(r'^## 原始内容\s*\n(.*?)\n---\s*\n', re.MULTILINE | re.DOTALL)
+
+
+def original_content(markdown: str) -> str:
+    """从笔记正文中取出“原始内容”一节；格式不符时返回全文"""
+    match = ORIGINAL_CONTENT_RE.search(markdown)
+    return match.group(1).strip() if match else markdown
+
+
+def iter_note_files(notes_dir: Path) -> Iterator[Tuple[str, os.DirEntry]]:
+    """递归遍历 notes_dir 下的 .md 文件，产出 (相对路径, DirEntry)；使用 scandir 避免逐个 stat"""
+    stack = [(str(notes_dir), '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append((entry.path, f"{prefix}{entry.name}/"))
+            elif entry.name.endswith('.md') and entry.is_file():
+                yield prefix + entry.name, entry
+
+
+class FileBodyMixin:
+    """
+    正文以 Markdown 文件形式保存在 notes_dir 中，写入采用临时文件 + 重命名
+    索引的 file_name 为相对 notes_dir 的路径，可包含分片子目录
+    """
+
+    notes_dir: Path
+    write_lock: FileLock
+
+    def note_path(self, item: Dict[str, Any]) -> Path:
+        return self.notes_dir / item['file_name']
+
+    def _read_raw(self, item):
+        file_path = self.note_path(item)
+        if not file_path.exists():
+            return None
+        return file_path.read_text(encoding='utf-8')
+
+    def _write_raw(self, item, content):
+        self.note_path(item).parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.note_path(item), content, lock=self.write_lock)
+
+    def _delete_raw(self, item):
+        file_path = self.note_path(item)
+        with self.write_lock:
+            if file_path.exists():
+                file_path.unlink()
+
+
+class StorageError(Exception):
+    """存储数据损坏或不可读"""
+    pass
+
+
+def _file_identity(path: Path):
+    """文件标识（inode、修改时间、大小），文件不存在时返回 None"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class JsonFileStore(FileBodyMixin, NoteStore):
+    """
+    JSON 文件后端
+    index.json 为快照，每次修改只向 index.journal 追加一行记录，读取时回放；
+    日志超过阈值后在后台线程中压缩为新的快照
+    """
+
+    name = 'json'
+
+    def __init__(self, index_file: Path, notes_dir: Path, journal_file: Optional[Path] = None,
+                 compact_threshold: int = 1024 * 1024, lock_file: Optional[Path] = None):
+        self.index_file = Path(index_file)
+        self.notes_dir = Path(notes_dir)
+        self.journal_file = Path(journal_file) if journal_file else self.index_file.with_suffix('.journal')
+        self.compact_threshold = compact_threshold
+        self.write_lock = FileLock(lock_file or self.index_file.parent / '.write.lock')
+        self._lock = threading.RLock()
+        self._items: Optional[Dict[str, Dict[str, Any]]] = None
+        self._snapshot_identity = None
+        self._journal_offset = 0
+        self._compacting = False
+
+        with self.write_lock:
+            if not self.index_file.exists():
+                self._write_snapshot([])
+
+    # ==================== 快照与日志 ====================
+
+    def _write_snapshot(self, index_data):
+        """原子写入快照"""
+        atomic_write_text(self.index_file, json.dumps(index_data, ensure_ascii=False, indent=2))
+
+    def _read_snapshot(self):
+        try:
+            text = self.index_file.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return []
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            # 不再静默返回空索引，避免后续写入覆盖掉全部笔记
+            raise StorageError(f"Index snapshot {self.index_file} is corrupted: {e}")
+
+    def _journal_size(self):
+        try:
+            return self.journal_file.stat().st_size
+        except OSError:
+            return 0
+
+    def _apply(self, record):
+        if record.get('op') == 'put':
+            item = record['item']
+            self._items[item['id']] = item
+        elif record.get('op') == 'delete':
+            for note_id in record.get('ids', []):
+                self._items.pop(note_id, None)
+
+    def _replay_journal(self):
+        """从上次读到的位置继续回放日志"""
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                # 写入中途崩溃留下的不完整记录，下次追加前截断
+                break
+            self._journal_offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"⚠️  Skipping corrupted journal record at offset {self._journal_offset - len(line)}")
+                continue
+            self._apply(record)
+
+    def _refresh(self):
+        """同步内存状态：快照被替换或日志被截断时整体重载，否则只回放新增日志"""
+        snapshot_identity = _file_identity(self.index_file)
+        journal_size = self._journal_size()
+        if (self._items is None or snapshot_identity != self._snapshot_identity
+                or journal_size < self._journal_offset):
+            self._items = {item['id']: item for item in self._read_snapshot()}
+            self._snapshot_identity = snapshot_identity
+            self._journal_offset = 0
+        if journal_size > self._journal_offset:
+            self._replay_journal()
+
+    def _prepare(self, op, records):
+        """校验单个操作、生成日志记录并应用到内存状态，返回操作结果"""
+        kind, payload = op
+        if kind == 'put' or (kind == 'update' and payload['id'] in self._items):
+            record = {'op': 'put', 'item': dict(payload)}
+        elif kind == 'update':
+            return None
+        elif kind == 'delete':
+            deleted = [self._items[note_id] for note_id in dict.fromkeys(payload) if note_id in self._items]
+            if not deleted:
+                return []
+            record = {'op': 'delete', 'ids': [item['id'] for item in deleted]}
+        else:
+            raise ValueError(f"Unknown index operation: {kind}")
+        records.append(record)
+        self._apply(record)
+        return deleted if kind == 'delete' else dict(payload)
+
+    def _append(self, records):
+        """追加日志记录（调用方需持有 write_lock），整批只 fsync 一次"""
+        payload = b''.join(
+            json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n' for record in records
+        )
+        with open(self.journal_file, 'ab') as f:
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(payload)
+
+        if self._journal_offset > self.compact_threshold and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """将快照与日志合并为新的快照，并清空日志"""
+        with self.write_lock, self._lock:
+            try:
+                self._refresh()
+                self._write_snapshot(list(self._items.values()))
+                with open(self.journal_file, 'wb') as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._snapshot_identity = _file_identity(self.index_file)
+                self._journal_offset = 0
+            finally:
+                self._compacting = False
+
+    # ==================== NoteStore 接口 ====================
+
+    def load_index(self):
+        with self._lock:
+            self._refresh()
+            return [dict(item) for item in self._items.values()]
+
+    def fingerprint(self):
+        return (_file_identity(self.index_file), self._journal_size())
+
+    def get_item(self, note_id):
+        with self._lock:
+            self._refresh()
+            item = self._items.get(note_id)
+            return dict(item) if item is not None else None
+
+    def apply_batch(self, ops):
+        with self.write_lock, self._lock:
+            try:
+                # 持锁后先回放其他进程追加的记录，再在最新状态上校验
+                self._refresh()
+                records = []
+                results = [self._prepare(op, records) for op in ops]
+                if records:
+                    self._append(records)
+            except Exception:
+                # 内存状态可能已与磁盘不一致，下次访问时重新加载
+                self._items = None
+                raise
+            return results
+
+
+class SQLiteStore(FileBodyMixin, NoteStore):
+    """
+    SQLite 后端（WAL 模式）
+    每条索引占一行，增删改只触及对应行；可选将正文一并存入数据库
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS notes (
+        id TEXT PRIMARY KEY,
+        type TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_notes_type ON notes(type);
+    CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at);
+    CREATE TABLE IF NOT EXISTS note_bodies (
+        id TEXT PRIMARY KEY,
+        content TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, db_file: Path, notes_dir: Path, store_bodies: bool = False,
+                 lock_file: Optional[Path] = None):
+        self.db_file = Path(db_file)
+        self.notes_dir = Path(notes_dir)
+        self.store_bodies = store_bodies
+        self.write_lock = FileLock(lock_file or self.db_file.parent / '.write.lock')
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(item):
+        return (
+            item['id'],
+            item.get('type'),
+            item.get('created_at'),
+            item.get('updated_at'),
+            json.dumps(item, ensure_ascii=False),
+        )
+
+    @staticmethod
+    def _bump_version(conn):
+        """索引每次修改都递增版本号（与修改处于同一事务）"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def load_index(self):
+        rows = self._connect().execute('SELECT data FROM notes ORDER BY rowid').fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def fingerprint(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def get_item(self, note_id):
+        row = self._connect().execute('SELECT data FROM notes WHERE id = ?', (note_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _execute_op(self, conn, op):
+        kind, payload = op
+        if kind == 'put':
+            conn.execute(
+                'INSERT INTO notes (id, type, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET type = excluded.type, created_at = excluded.created_at, '
+                'updated_at = excluded.updated_at, data = excluded.data',
+                self._row(payload)
+            )
+            return dict(payload)
+        if kind == 'update':
+            row = self._row(payload)
+            cursor = conn.execute('UPDATE notes SET type = ?, created_at = ?, updated_at = ?, data = ? WHERE id = ?',
+                                  row[1:] + row[:1])
+            return dict(payload) if cursor.rowcount else None
+        if kind == 'delete':
+            deleted = []
+            for note_id in dict.fromkeys(payload):
+                row = conn.execute('SELECT data FROM notes WHERE id = ?', (note_id,)).fetchone()
+                if row:
+                    deleted.append(json.loads(row[0]))
+                    conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+            return deleted
+        raise ValueError(f"Unknown index operation: {kind}")
+
+    def apply_batch(self, ops):
+        conn = self._connect()
+        with self.write_lock, conn:
+            results = [self._execute_op(conn, op) for op in ops]
+            self._bump_version(conn)
+        return results
+
+    def _read_raw(self, item):
+        if not self.store_bodies:
+            return super()._read_raw(item)
+        row = self._connect().execute('SELECT content FROM note_bodies WHERE id = ?', (item['id'],)).fetchone()
+        if row:
+            return row[0]
+        # 迁移前写入的笔记仍可能只存在于文件中
+        return super()._read_raw(item)
+
+    def _write_raw(self, item, content):
+        if not self.store_bodies:
+            return super()._write_raw(item, content)
+        conn = self._connect()
+        with self.write_lock, conn:
+            conn.execute('INSERT INTO note_bodies (id, content) VALUES (?, ?) '
+                         'ON CONFLICT(id) DO UPDATE SET content = excluded.content',
+                         (item['id'], content))
+
+    def _delete_raw(self, item):
+        if self.store_bodies:
+            conn = self._connect()
+            with self.write_lock, conn:
+                conn.execute('DELETE FROM note_bodies WHERE id = ?', (item['id'],))
+        super()._delete_raw(item)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_store(backend: str, data_dir: Path, notes_dir: Path, index_file: Path,
+                 sqlite_file: Optional[Path] = None, store_bodies: bool = False,
+                 journal_file: Optional[Path] = None, compact_threshold: int = 1024 * 1024) -> NoteStore:
+    """根据配置创建存储后端"""
+    backend = (backend or 'json').lower()
+    if backend == 'json':
+        return JsonFileStore(index_file, notes_dir, journal_file=journal_file, compact_threshold=compact_threshold)
+    if backend == 'sqlite':
+        return SQLiteStore(sqlite_file or Path(data_dir) / 'notes.sqlite3', notes_dir, store_bodies=store_bodies)
+    raise ValueError(f"Unknown storage backend: {backend}")
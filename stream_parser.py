@@ -0,0 +1,167 @@
+"""
+增量 JSON 解析
+模型以流式输出一个 JSON 对象时，边接收边解析：指定的字符串字段（如 organized_markdown）逐段产出解码后的文本，
+其余字段在值完整后立即产出。可忽略对象前后的 Markdown 代码块标记
+"""
+import json
+from typing import Iterable, List, Tuple
+
+SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    """
+    feed(text) 返回事件列表：
+        ('delta', key, text)  流式字符串字段新增的文本
+        ('field', key, value) 其他字段的完整值
+    顶层对象结束后忽略剩余文本；输入不是 JSON 对象时不产出事件，由调用方对完整文本兜底解析
+    """
+
+    def __init__(self, stream_keys: Iterable[str] = ()):
+        self.stream_keys = set(stream_keys)
+        self.state = 'start'
+        self.key = None
+        self.done = False
+        self._buffer = []
+        # 原始值的嵌套深度与字符串状态
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # 流式字符串中未完成的转义序列，以及等待低位代理的高位代理
+        self._escape = None
+        self._high_surrogate = None
+
+    def feed(self, text: str) -> List[Tuple]:
+        events = []
+        delta = []
+        for char in text:
+            if self.done:
+                break
+            state = self.state
+            if state == 'start':
+                if char == '{':
+                    self.state = 'key_or_end'
+            elif state == 'key_or_end':
+                if char == '"':
+                    self._buffer = []
+                    self._escaped = False
+                    self.state = 'key'
+                elif char == '}':
+                    self.done = True
+            elif state == 'key':
+                if self._escaped:
+                    self._buffer.append(char)
+                    self._escaped = False
+                elif char == '\\':
+                    self._buffer.append(char)
+                    self._escaped = True
+                elif char == '"':
+                    self.key = json.loads('"' + ''.join(self._buffer) + '"')
+                    self.state = 'colon'
+                else:
+                    self._buffer.append(char)
+            elif state == 'colon':
+                if char == ':':
+                    self.state = 'value_start'
+            elif state == 'value_start':
+                if char.isspace():
+                    continue
+                if char == '"' and self.key in self.stream_keys:
+                    self._escape = None
+                    self._high_surrogate = None
+                    self.state = 'stream_string'
+                else:
+                    self._buffer = [char]
+                    self._depth = 1 if char in '{[' else 0
+                    self._in_string = char == '"'
+                    self._escaped = False
+                    self.state = 'raw_value'
+            elif state == 'stream_string':
+                if self._escape is not None:
+                    self._escape += char
+                    decoded = self._decode_escape()
+                    if decoded is not None:
+                        delta.append(decoded)
+                elif char == '\\':
+                    self._escape = ''
+                elif char == '"':
+                    if delta:
+                        events.append(('delta', self.key, ''.join(delta)))
+                        delta = []
+                    self.state = 'after_value'
+                else:
+                    delta.append(char)
+            elif state == 'raw_value':
+                ended = self._feed_raw(char)
+                if ended:
+                    events.append(self._finish_raw())
+                    # 数字、布尔等值以其后的分隔符结束
+                    if ended == 'delimiter':
+                        if char == '}':
+                            self.done = True
+                        elif char == ',':
+                            self.state = 'key_or_end'
+            elif state == 'after_value':
+                if char == ',':
+                    self.state = 'key_or_end'
+                elif char == '}':
+                    self.done = True
+        if delta:
+            events.append(('delta', self.key, ''.join(delta)))
+        return events
+
+    def _decode_escape(self):
+        """转义序列完整时返回解码文本（可能为空串），否则返回 None"""
+        escape = self._escape
+        if escape[0] == 'u':
+            if len(escape) < 5:
+                return None
+            self._escape = None
+            code = int(escape[1:5], 16)
+            if 0xD800 <= code <= 0xDBFF:
+                self._high_surrogate = code
+                return ''
+            if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                high, self._high_surrogate = self._high_surrogate, None
+                return chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00))
+            return chr(code)
+        self._escape = None
+        return SIMPLE_ESCAPES.get(escape, escape)
+
+    def _feed_raw(self, char):
+        """
+        累积非流式字段的原始文本
+        值以当前字符结束时返回 'value'，当前字符是值之后的分隔符时返回 'delimiter'，否则返回 None
+        """
+        if self._in_string:
+            self._buffer.append(char)
+            if self._escaped:
+                self._escaped = False
+            elif char == '\\':
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    return 'value'
+            return None
+        if self._depth == 0 and (char in ',}' or char.isspace()):
+            return 'delimiter'
+        self._buffer.append(char)
+        if char == '"':
+            self._in_string = True
+        elif char in '{[':
+            self._depth += 1
+        elif char in '}]':
+            self._depth -= 1
+            if self._depth == 0:
+                return 'value'
+        return None
+
+    def _finish_raw(self):
+        raw = ''.join(self._buffer)
+        self.state = 'after_value'
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        return ('field', self.key, value)
@@ -0,0 +1,96 @@
+"""
+测试共用的夹具：
+notes — 临时数据目录中的存储与索引缓存（JSON 后端）
+app_module / client — 在临时目录中导入的 Flask 应用与测试客户端
+fake_llm — 替换模型调用，按顺序返回预设的响应
+"""
+import os
+
+import pytest
+
+from index_cache import IndexCache
+from storage import JsonFileStore
+
+
+class Notes:
+    """临时数据目录中的存储与索引缓存，add 写入正文并提交索引条目"""
+
+    def __init__(self, data_dir):
+        (data_dir / 'notes').mkdir(exist_ok=True)
+        self.store = JsonFileStore(data_dir / 'index.json', data_dir / 'notes')
+        self.index = IndexCache(self.store)
+
+    def add(self, note_id, content='', **fields):
+        item = dict({'id': note_id, 'title': '', 'type': '零散知识', 'file_name': f'{note_id}.md',
+                     'updated_at': '2024-01-01T00:00:00'}, **fields)
+        self.store.write_body(item, content)
+        self.index.add(item)
+        return item
+
+    def external_put(self, item):
+        """模拟其他进程直接修改索引"""
+        JsonFileStore(self.store.index_file, self.store.notes_dir).apply_batch([('put', item)])
+
+
+@pytest.fixture
+def notes(tmp_path):
+    return Notes(tmp_path)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    在临时目录中导入 app（数据目录为当前目录下的 data/）；
+    不启动后台任务工作线程，关闭响应缓存、本地分类与相关笔记，结果只取决于模型响应
+    """
+    os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+    os.environ.update({
+        'LLM_CACHE_ENABLED': 'False',
+        'LOCAL_CLASSIFIER_ENABLED': 'False',
+        'JOB_WORKERS': '0',
+        'RELATED_NOTES_ENABLED': 'False',
+    })
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    """Flask 测试客户端，每个测试开始前删除全部笔记"""
+    test_client = app_module.app.test_client()
+    for item in app_module.get_index():
+        test_client.delete(f"/api/notes/{item['id']}")
+    return test_client
+
+
+class FakeLLM:
+    """按顺序返回 replies 中的响应：字符串原样返回，异常抛出，函数以提示词调用后返回结果"""
+
+    def __init__(self):
+        self.replies = []
+        self.prompts = []
+
+    def complete(self, prompt, system_message):
+        self.prompts.append(prompt)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply(prompt) if callable(reply) else reply
+
+    def stream(self, prompt, system_message):
+        text = self.complete(prompt, system_message)
+        for start in range(0, len(text), 7):
+            yield text[start:start + 7]
+
+
+@pytest.fixture
+def fake_llm(app_module, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(app_module.llm, 'complete', fake.complete)
+    monkeypatch.setattr(app_module.llm, 'stream', fake.stream)
+    return fake
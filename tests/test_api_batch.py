@@ -0,0 +1,41 @@
+"""/api/notes/batch 与批量删除：一次提交写入多条笔记，派生索引随之更新"""
+
+
+def search_ids(client, query):
+    return [hit['id'] for hit in client.get(f'/api/search?q={query}').get_json()['results']]
+
+
+def test_batch_save_update_and_delete(client, app_module):
+    response = client.post('/api/notes/batch', json={'notes': [
+        {'title': '批量一', 'type': '学习笔记', 'original_content': '向量检索', 'tags': ['a']},
+        {'title': '批量二', 'type': '待办事项', 'original_content': '提交报告',
+         'key_dates': [{'date': '2024-05-01', 'description': '截止'}]},
+    ]})
+    body = response.get_json()
+    assert response.status_code == 200 and body['saved_count'] == 2
+    first, second = [note['id'] for note in body['notes']]
+    assert search_ids(client, '检索') == [first]
+    assert [event['note']['id'] for event in client.get('/api/timeline').get_json()['results']] == [second]
+
+    response = client.put('/api/notes/batch', json={'updates': [
+        {'id': first, 'add_tags': ['b'], 'is_pinned': True}, {'id': 'missing', 'tags': []}]})
+    body = response.get_json()
+    assert body['updated_count'] == 1 and body['not_found'] == ['missing']
+    assert body['notes'][0]['tags'] == ['a', 'b'] and body['notes'][0]['is_pinned']
+    # 派生索引记录的 updated_at 与索引一致，之后的对账不会重读这条笔记
+    updated_at = body['notes'][0]['updated_at']
+    assert app_module.search_index._indexed[first] == updated_at
+    assert search_ids(client, '检索') == [first]
+    facets = client.get('/api/facets').get_json()
+    assert facets['pinned'] == 1 and facets['tags'] == {'a': 1, 'b': 1}
+
+    response = client.delete('/api/notes/batch-delete', json={'note_ids': [first, second, 'missing']})
+    assert response.get_json()['deleted_count'] == 2
+    assert search_ids(client, '检索') == [] and client.get('/api/timeline').get_json()['count'] == 0
+    assert client.get('/api/facets').get_json()['total'] == 0
+
+
+def test_invalid_requests(client):
+    assert client.post('/api/notes/batch', json={'notes': []}).status_code == 400
+    assert client.put('/api/notes/batch', json={'updates': []}).status_code == 400
+    assert client.delete('/api/notes/batch-delete', json={'note_ids': []}).status_code == 400
@@ -0,0 +1,50 @@
+"""/api/classify-batch：多条内容打包进一个提示，缺失的条目逐条重试"""
+import json
+import re
+
+from llm_transport import LLMError
+
+
+def batch_reply(skip=()):
+    """按提示中的条目序号生成批量分类结果，skip 中的序号不返回"""
+    def reply(prompt):
+        ids = [int(number) for number in re.findall(r'^\[(\d+)\]$', prompt, re.MULTILINE)]
+        return json.dumps([{'id': index, 'is_note': True, 'note_type': '待办事项', 'confidence': 0.9,
+                            'reason': f'第 {index} 条'} for index in ids if index not in skip], ensure_ascii=False)
+    return reply
+
+
+SINGLE = json.dumps({'is_note': False, 'note_type': '其他', 'confidence': 0.6, 'reason': '逐条'}, ensure_ascii=False)
+
+
+def test_one_prompt_for_many_items(client, fake_llm):
+    fake_llm.replies = [batch_reply()]
+    response = client.post('/api/classify-batch', json={'items': ['买牛奶', {'id': 'x', 'content': '交报告'}, '买牛奶']})
+    body = response.get_json()
+    assert response.status_code == 200 and len(fake_llm.prompts) == 1
+    assert body['count'] == 3 and [item['id'] for item in body['results']] == ['0', 'x', '2']
+    assert all(item['source'] == 'batch' and item['note_type'] == '待办事项' for item in body['results'])
+    # 相同内容只分类一次
+    assert body['results'][0]['reason'] == body['results'][2]['reason']
+
+
+def test_missing_items_retried_individually(client, fake_llm):
+    fake_llm.replies = [batch_reply(skip={2}), SINGLE]
+    body = client.post('/api/classify-batch', json={'items': ['一', '二', '']}).get_json()
+    first, second, empty = body['results']
+    assert first['source'] == 'batch'
+    assert second['source'] == 'single' and second['reason'] == '逐条'
+    assert empty == {'id': '2', 'error': 'Content is required'}
+
+
+def test_failed_single_retry_reports_error(client, fake_llm):
+    fake_llm.replies = [LLMError('batch failed'), LLMError('single failed')]
+    body = client.post('/api/classify-batch', json={'items': ['一']}).get_json()
+    assert body['results'] == [{'id': '0', 'error': 'single failed', 'source': 'single'}]
+
+
+def test_invalid_requests(client, app_module):
+    assert client.post('/api/classify-batch', json={'items': []}).status_code == 400
+    assert client.post('/api/classify-batch', json={'items': [1]}).status_code == 400
+    too_many = ['x'] * (app_module.CLASSIFY_BATCH_MAX_ITEMS + 1)
+    assert client.post('/api/classify-batch', json={'items': too_many}).status_code == 400
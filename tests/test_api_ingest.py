@@ -0,0 +1,47 @@
+"""/api/ingest：一次模型调用得到分类与整理结果，按需保存"""
+import json
+
+from llm_transport import LLMError
+
+REPLY = {
+    'is_note': True, 'note_type': '会议记录', 'confidence': 0.9, 'reason': '会议安排',
+    'title': '周会安排', 'organized_markdown': '## 周会\n\n- 周五下午三点', 'key_dates': [],
+    'key_points': ['周五开会'], 'summary': '周五下午开周会',
+}
+
+
+def test_ingest_and_save(client, fake_llm):
+    fake_llm.replies = [json.dumps(REPLY, ensure_ascii=False)]
+    response = client.post('/api/ingest', json={'content': '周五下午三点开周会', 'save': True, 'tags': ['工作']})
+    body = response.get_json()
+    assert response.status_code == 200 and len(fake_llm.prompts) == 1
+    assert body['note_type'] == '会议记录' and body['saved'] and body['note']['title'] == '周会安排'
+    note = client.get(f"/api/notes/{body['note']['id']}").get_json()
+    assert note['note']['type'] == '会议记录' and note['note']['tags'] == ['工作']
+    assert '周五下午三点开周会' in note['content'] and '## 周会' in note['content']
+
+
+def test_ingest_without_save(client, fake_llm):
+    fake_llm.replies = [json.dumps(dict(REPLY, is_note=False), ensure_ascii=False)] * 2
+    body = client.post('/api/ingest', json={'content': '哈哈'}).get_json()
+    assert body['saved'] is False and body['note'] is None
+    # 模型判断不是笔记且未指定类型时不保存
+    body = client.post('/api/ingest', json={'content': '哈哈', 'save': True}).get_json()
+    assert body['saved'] is False
+    assert client.get('/api/notes').get_json()['total'] == 0
+
+
+def test_note_type_overrides_model(client, fake_llm):
+    fake_llm.replies = [json.dumps(dict(REPLY, is_note=False), ensure_ascii=False)]
+    body = client.post('/api/ingest', json={'content': '哈哈', 'note_type': '灵感想法', 'save': True,
+                                            'title': '自定义标题'}).get_json()
+    assert body['note_type'] == '灵感想法' and body['saved'] and body['note']['title'] == '自定义标题'
+    assert '笔记类型已确定为：灵感想法' in fake_llm.prompts[0]
+
+
+def test_errors(client, fake_llm):
+    assert client.post('/api/ingest', json={'content': ''}).status_code == 400
+    fake_llm.replies = [LLMError('upstream down')]
+    response = client.post('/api/ingest', json={'content': '内容', 'save': True})
+    assert response.status_code == 502 and 'upstream down' in response.get_json()['error']
+    assert client.get('/api/notes').get_json()['total'] == 0
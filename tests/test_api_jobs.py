@@ -0,0 +1,59 @@
+"""/api/jobs：提交、执行、查询、筛选与取消后台任务"""
+import json
+
+from llm_transport import LLMError
+
+CLASSIFY = json.dumps({'is_note': True, 'note_type': '待办事项', 'confidence': 0.9, 'reason': '待办'},
+                      ensure_ascii=False)
+
+
+def test_submit_run_and_poll(client, app_module, fake_llm):
+    response = client.post('/api/jobs', json={'type': 'classify', 'content': '明天交报告'})
+    job = response.get_json()
+    assert response.status_code == 202 and job['status'] == 'queued'
+    fake_llm.replies = [CLASSIFY]
+    assert app_module.job_queue.run_once()
+    done = client.get(f"/api/jobs/{job['id']}?wait=1").get_json()
+    assert done['status'] == 'done' and done['result']['note_type'] == '待办事项'
+    listed = client.get('/api/jobs?status=done').get_json()['jobs']
+    assert job['id'] in [item['id'] for item in listed]
+    assert job['id'] not in [item['id'] for item in client.get('/api/jobs?status=queued').get_json()['jobs']]
+    # 已结束的任务不能取消
+    assert client.delete(f"/api/jobs/{job['id']}").status_code == 409
+
+
+def test_transient_llm_error_requeues_job(client, app_module, fake_llm):
+    job = client.post('/api/jobs', json={'type': 'classify', 'content': '明天交报告'}).get_json()
+    fake_llm.replies = [LLMError('upstream down')]
+    assert app_module.job_queue.run_once()
+    queued = client.get(f"/api/jobs/{job['id']}").get_json()
+    assert queued['status'] == 'queued' and queued['error'] == 'upstream down' and queued['retry_at']
+    assert client.delete(f"/api/jobs/{job['id']}").status_code == 200
+
+    job = client.post('/api/jobs', json={'type': 'classify', 'content': '明天交报告'}).get_json()
+    fake_llm.replies = [LLMError('invalid api key', transient=False)]
+    assert app_module.job_queue.run_once()
+    assert client.get(f"/api/jobs/{job['id']}").get_json()['status'] == 'failed'
+
+
+def test_cancel_queued_job(client, app_module):
+    job = client.post('/api/jobs', json={'type': 'organize', 'content': '内容'}).get_json()
+    response = client.delete(f"/api/jobs/{job['id']}")
+    assert response.status_code == 200 and response.get_json()['status'] == 'cancelled'
+    assert not app_module.job_queue.run_once()
+
+
+def test_job_events_stream(client, app_module, fake_llm):
+    job = client.post('/api/jobs', json={'type': 'classify', 'content': '明天交报告'}).get_json()
+    fake_llm.replies = [CLASSIFY]
+    app_module.job_queue.run_once()
+    body = client.get(f"/api/jobs/{job['id']}/events").get_data(as_text=True)
+    assert body.startswith('event: status\n') and '"status": "done"' in body
+
+
+def test_invalid_requests(client):
+    assert client.post('/api/jobs', json={'type': 'classify'}).status_code == 400
+    assert client.post('/api/jobs', json={'type': 'unknown', 'content': 'x'}).status_code == 400
+    assert client.get('/api/jobs/missing').status_code == 404
+    assert client.get('/api/jobs/missing/events').status_code == 404
+    assert client.delete('/api/jobs/missing').status_code == 404
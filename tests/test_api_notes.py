@@ -0,0 +1,56 @@
+"""/api/notes：游标分页、字段投影与 ETag 条件请求"""
+
+
+def save(client, title):
+    response = client.post('/api/save-note', json={'title': title, 'type': '零散知识', 'original_content': title})
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def collect(client, query):
+    """沿 next_cursor 取完所有页"""
+    ids = []
+    cursor = ''
+    while True:
+        body = client.get(f'/api/notes?{query}&cursor={cursor}').get_json()
+        assert len(body['notes']) <= 2 and body['total'] == 5
+        ids += [note['id'] for note in body['notes']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+def test_cursor_pagination(client):
+    ids = [save(client, f'笔记 {index}') for index in range(5)]
+    assert collect(client, 'limit=2') == ids[::-1]
+    assert collect(client, 'limit=2&order=asc') == ids
+    assert collect(client, 'limit=2&sort=updated_at&order=asc') == ids
+    # 不带参数时按插入顺序返回全部笔记
+    body = client.get('/api/notes').get_json()
+    assert [note['id'] for note in body['notes']] == ids and body['next_cursor'] is None
+
+
+def test_field_projection(client):
+    save(client, '投影')
+    notes = client.get('/api/notes?fields=title,type').get_json()['notes']
+    assert notes == [{'id': notes[0]['id'], 'title': '投影', 'type': '零散知识'}]
+
+
+def test_etag_revalidation(client):
+    save(client, '第一篇')
+    response = client.get('/api/notes?limit=10')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/notes?limit=10', headers={'If-None-Match': etag}).status_code == 304
+    # 查询参数不同或索引变化后标识随之改变
+    assert client.get('/api/notes?limit=5', headers={'If-None-Match': etag}).status_code == 200
+    save(client, '第二篇')
+    response = client.get('/api/notes?limit=10', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_invalid_parameters(client):
+    assert client.get('/api/notes?sort=title').status_code == 400
+    assert client.get('/api/notes?order=up').status_code == 400
+    assert client.get('/api/notes?limit=abc').status_code == 400
+    assert client.get('/api/notes?cursor=not-a-cursor').status_code == 400
@@ -0,0 +1,45 @@
+"""/api/search：相关度排序、游标分页、类型过滤与摘要高亮"""
+
+
+def save(client, title, content, note_type='学习笔记', summary=''):
+    response = client.post('/api/save-note', json={'title': title, 'type': note_type, 'summary': summary,
+                                                   'original_content': content})
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def test_ranking_and_snippets(client):
+    dense = save(client, '缓存设计', '缓存 缓存 缓存，命中率与淘汰策略')
+    sparse = save(client, '杂记', '顺带提到缓存。' + '无关的内容。' * 40)
+    save(client, '其他', '完全无关的笔记')
+    body = client.get('/api/search?q=缓存').get_json()
+    assert body['count'] == 2 and body['next_cursor'] is None
+    assert [item['id'] for item in body['results']] == [dense, sparse]
+    assert body['results'][0]['score'] > body['results'][1]['score'] > 0
+    for item in body['results']:
+        snippet = item['snippet']
+        start, end = snippet['highlights'][0]
+        assert snippet['text'][start:end] == '缓存'
+
+
+def test_pagination_and_type_filter(client):
+    ids = {save(client, f'笔记 {index}', '分页 ' * (index + 1), note_type='学习笔记' if index % 2 else '零散知识')
+           for index in range(5)}
+    seen = []
+    cursor = ''
+    while True:
+        body = client.get(f'/api/search?q=分页&limit=2&cursor={cursor}').get_json()
+        assert body['count'] == 5 and len(body['results']) <= 2
+        seen += [item['id'] for item in body['results']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert len(seen) == 5 and set(seen) == ids
+    body = client.get('/api/search?q=分页&type=学习笔记').get_json()
+    assert body['count'] == 2 and {item['type'] for item in body['results']} == {'学习笔记'}
+
+
+def test_invalid_parameters(client):
+    assert client.get('/api/search?q=x&limit=abc').status_code == 400
+    assert client.get('/api/search?q=x&cursor=abc').status_code == 400
+    assert client.get('/api/search?q=没有命中').get_json() == {'results': [], 'count': 0, 'next_cursor': None}
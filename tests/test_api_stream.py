@@ -0,0 +1,47 @@
+"""/api/organize-content/stream：Server-Sent Events 流式整理"""
+import json
+
+from llm_transport import LLMError
+
+REPLY = {
+    'organized_markdown': '## 标题\n\n整理后的正文，分多段流式返回。',
+    'key_dates': [{'date': '2024-05-01', 'description': '上线'}],
+    'key_points': ['要点一', '要点二'],
+    'summary': '一句话总结',
+}
+
+
+def events(response):
+    """解析 SSE 响应为 [(事件, 数据)]"""
+    parsed = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            parsed.append((lines['event'], json.loads(lines['data'])))
+    return parsed
+
+
+def test_stream_events(client, fake_llm):
+    fake_llm.replies = ['```json\n' + json.dumps(REPLY, ensure_ascii=False) + '\n```\n以上是整理结果']
+    response = client.post('/api/organize-content/stream', json={'content': '原始内容'})
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    received = events(response)
+    deltas = ''.join(data['delta'] for event, data in received if event == 'markdown')
+    assert deltas == REPLY['organized_markdown']
+    fields = {data['key']: data['value'] for event, data in received if event == 'field'}
+    assert fields['key_points'] == REPLY['key_points'] and fields['summary'] == REPLY['summary']
+    assert received[-1] == ('result', REPLY)
+
+
+def test_unparseable_output_falls_back(client, fake_llm):
+    fake_llm.replies = ['模型没有按格式输出']
+    received = events(client.post('/api/organize-content/stream', json={'content': '原始内容'}))
+    assert received[-1][0] == 'result' and received[-1][1]['organized_markdown'] == '原始内容'
+
+
+def test_errors(client, fake_llm):
+    assert client.post('/api/organize-content/stream', json={'content': ''}).status_code == 400
+    # 上游在第一段之前失败时返回 JSON 错误与对应的状态码
+    fake_llm.replies = [LLMError('upstream down')]
+    response = client.post('/api/organize-content/stream', json={'content': '原始内容'})
+    assert response.status_code == 502 and response.get_json()['error'] == 'upstream down'
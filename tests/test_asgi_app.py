@@ -0,0 +1,102 @@
+"""ASGI 入口：异步 AI 端点、请求体校验、本地分类器在线程中学习，其余请求转交 Flask 应用"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('a2wsgi')
+
+import json_extract  # noqa: E402
+
+CLASSIFY = json.dumps({'is_note': True, 'note_type': '待办事项', 'confidence': 0.9, 'reason': '待办'},
+                      ensure_ascii=False)
+
+
+@pytest.fixture
+def asgi(client, fake_llm, monkeypatch):
+    """asgi_app 模块；异步模型调用同样按 fake_llm.replies 返回"""
+    import asgi_app
+
+    async def acomplete(prompt, system_message):
+        return fake_llm.complete(prompt, system_message)
+
+    monkeypatch.setattr(asgi_app.llm, 'acomplete', acomplete)
+    return asgi_app
+
+
+def request(application, method, path, body=b''):
+    """发送一个 HTTP 请求，返回 (状态码, 响应体)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        'server': ('127.0.0.1', 5001), 'client': ('127.0.0.1', 50000),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+class RecordingClassifier:
+    """本地分类器替身：从不确定，记录 learn 调用所在的线程"""
+
+    def __init__(self):
+        self.learned = []
+
+    def classify(self, content):
+        return None
+
+    def learn(self, content, result):
+        self.learned.append((content, threading.current_thread()))
+
+
+def test_body_must_be_a_json_object(asgi):
+    for body in (b'{not json', b'[1, 2]', b'\xff'):
+        status, payload = request(asgi.application, 'POST', '/api/classify-content', body)
+        assert status == 400 and json.loads(payload) == {'error': 'Request body must be a JSON object'}
+
+
+def test_classifier_learns_off_the_event_loop(asgi, fake_llm, monkeypatch):
+    classifier = RecordingClassifier()
+    monkeypatch.setattr(asgi, 'local_classifier', classifier)
+    fake_llm.replies = [CLASSIFY]
+    status, payload = request(asgi.application, 'POST', '/api/classify-content',
+                              json.dumps({'content': '明天交报告'}).encode())
+    assert status == 200 and json.loads(payload)['source'] == 'llm'
+
+    fake_llm.replies = [json.dumps([{'id': 1, 'is_note': True, 'note_type': '待办事项', 'confidence': 0.9,
+                                     'reason': '批量'}], ensure_ascii=False), CLASSIFY]
+    status, payload = request(asgi.application, 'POST', '/api/classify-batch',
+                              json.dumps({'items': ['买牛奶', '交报告']}).encode())
+    assert status == 200 and [item['source'] for item in json.loads(payload)['results']] == ['batch', 'single']
+    assert [content for content, _ in classifier.learned] == ['明天交报告', '买牛奶', '交报告']
+    assert threading.main_thread() not in [thread for _, thread in classifier.learned]
+
+
+def test_repair_flow_shared_with_sync_path(asgi, fake_llm):
+    before = json_extract.parse_stats.stats()['tasks'].get('classify', {}).get('repaired', 0)
+    fake_llm.replies = ['不是 JSON', CLASSIFY]
+    status, payload = request(asgi.application, 'POST', '/api/classify-content',
+                              json.dumps({'content': '明天交报告'}).encode())
+    assert status == 200 and json.loads(payload)['note_type'] == '待办事项'
+    assert '不是 JSON' in fake_llm.prompts[1]
+    assert json_extract.parse_stats.stats()['tasks']['classify']['repaired'] == before + 1
+
+
+def test_other_routes_forwarded_to_flask(asgi):
+    status, payload = request(asgi.application, 'POST', '/api/save-note',
+                              json.dumps({'title': '经由 ASGI', 'original_content': '内容'}).encode())
+    assert status == 200
+    status, payload = request(asgi.application, 'GET', '/api/notes')
+    assert status == 200 and [note['title'] for note in json.loads(payload)['notes']] == ['经由 ASGI']
@@ -0,0 +1,64 @@
+"""内容寻址存储：大段落打包为引用、读取还原、去重与回收"""
+import os
+import time
+
+from blob_store import BlobStore, BLOB_REF_RE
+
+
+def note_body(original, organized):
+    return f"# 标题\n\n---\n\n## 原始内容\n\n{original}\n\n---\n\n## AI 整理内容\n\n{organized}\n\n---\n\n*元数据*\n"
+
+
+def test_pack_large_sections_and_unpack(tmp_path):
+    blobs = BlobStore(tmp_path / 'blobs', min_size=64)
+    content = note_body('原文' * 100, '短')
+    packed, digests = blobs.pack(content)
+    assert len(digests) == 1 and len(BLOB_REF_RE.findall(packed)) == 1
+    assert '原文原文' not in packed and '\n## AI 整理内容\n\n短\n' in packed
+    assert blobs.unpack(packed) == content
+    # 已经是引用的段落不会再次打包，引用仍计入结果
+    assert blobs.pack(packed) == (packed, digests)
+
+
+def test_identical_content_stored_once(tmp_path):
+    for compression in ('gzip', 'none'):
+        blobs = BlobStore(tmp_path / compression, compression=compression, min_size=16)
+        first, digests_a = blobs.pack(note_body('相同的长段落内容' * 20, '另一段相同的长段落内容' * 20))
+        second, digests_b = blobs.pack(note_body('相同的长段落内容' * 20, '另一段相同的长段落内容' * 20))
+        assert first == second and digests_a == digests_b
+        assert len([path for path in (tmp_path / compression).glob('??/*')]) == 2
+        assert blobs.get(digests_a[0]).strip() == '相同的长段落内容' * 20
+
+
+def test_disabled_store_still_unpacks(tmp_path):
+    packed, _ = BlobStore(tmp_path / 'blobs', min_size=16).pack(note_body('x' * 100, ''))
+    disabled = BlobStore(tmp_path / 'blobs', enabled=False)
+    assert disabled.pack(note_body('y' * 100, '')) == (note_body('y' * 100, ''), [])
+    assert 'x' * 100 in disabled.unpack(packed)
+    # 缺失的内容保持引用原样
+    missing = '<!-- blob:sha256:' + '0' * 64 + ' -->'
+    assert disabled.unpack(missing) == missing
+
+
+def test_collect_respects_refcount_and_grace_period(tmp_path):
+    blobs = BlobStore(tmp_path / 'blobs', gc_grace_seconds=60)
+    kept, orphan, fresh = (blobs.put(text) for text in ('被引用', '无引用', '刚写入'))
+    old = time.time() - 3600
+    for digest in (kept, orphan):
+        os.utime(blobs._path(digest), (old, old))
+    refcounts = {kept: 1}
+    assert blobs.collect([kept, orphan, fresh, 'f' * 64], lambda digest: refcounts.get(digest, 0)) == 1
+    assert blobs.get(orphan) is None and blobs.get(kept) == '被引用' and blobs.get(fresh) == '刚写入'
+    # 复用已有内容会刷新修改时间，宽限期内不被回收
+    os.utime(blobs._path(kept), (old, old))
+    blobs.put('被引用')
+    assert blobs.sweep([]) == 0
+
+
+def test_store_round_trip_records_blobs(notes, tmp_path):
+    notes.store.blob_store = BlobStore(tmp_path / 'blobs', min_size=16)
+    content = note_body('很长的原始内容' * 30, '整理后的内容' * 30)
+    item = notes.add('a', content)
+    assert len(item['blobs']) == 2 and notes.index.blob_refcount(item['blobs'][0]) == 1
+    assert '很长的原始内容' not in notes.store.note_path(item).read_text(encoding='utf-8')
+    assert notes.store.read_body(item) == content
@@ -0,0 +1,50 @@
+"""剪贴板近期内容去重：规范化、完全重复、近似重复与时间窗口"""
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from clipboard_monitor import RecentFingerprints, normalize_text, SIMHASH_MIN_CHARS
+
+LONG_TEXT = '明天下午三点在三号会议室讨论第二季度的产品路线图，请提前准备好各自负责模块的进度说明和风险清单。' * 3
+
+
+def test_normalize_text():
+    assert normalize_text('  Ｈｅｌｌｏ\r\n\tWORLD　 ') == 'hello world'
+    assert normalize_text(None) == ''
+
+
+def test_exact_match_after_normalization():
+    recent = RecentFingerprints()
+    recent.add('Hello  World', {'type': 'note'}, '2024-01-01T00:00:00')
+    found = recent.find('hello\nworld ')
+    assert found == {'match': 'exact', 'distance': 0, 'classification': {'type': 'note'},
+                     'timestamp': '2024-01-01T00:00:00'}
+    # 短文本只做完全相同的判断
+    assert len(normalize_text('hello world!')) < SIMHASH_MIN_CHARS
+    assert recent.find('hello world!') is None
+
+
+def test_near_duplicate():
+    recent = RecentFingerprints(max_distance=5)
+    recent.add(LONG_TEXT, {'type': 'todo'}, 't1')
+    for edited in (LONG_TEXT + '谢谢', LONG_TEXT.replace('三号', '四号', 1)):
+        found = recent.find(edited)
+        assert found['match'] == 'near' and 0 < found['distance'] <= 5
+        assert found['classification'] == {'type': 'todo'}
+    assert recent.find('完全无关的另一段内容，讲的是周末去郊外爬山需要带的装备和路线安排以及天气情况。' * 3) is None
+
+
+def test_window_and_capacity():
+    recent = RecentFingerprints(window_seconds=60, max_entries=2)
+    recent.add('old', {}, 't0', captured_at=time.time() - 120)
+    assert recent.find('old') is None and len(recent) == 0
+    for text in ('a', 'b', 'c'):
+        recent.add(text, {}, text)
+    assert len(recent) == 2
+    assert recent.find('a') is None and recent.find('c') is not None
+    # 再次加入的内容移到最新位置
+    recent.add('b', {}, 'b2')
+    recent.add('d', {}, 'd')
+    assert recent.find('b')['timestamp'] == 'b2' and recent.find('c') is None
@@ -0,0 +1,62 @@
+"""分面索引：位图求交集的筛选与计数、增量维护与空位压缩"""
+from facet_index import FacetIndex, item_facets, popcount
+
+
+def test_helpers():
+    assert popcount(0b101101) == 4
+    assert item_facets({'type': '待办事项', 'tags': ['a', 'a', 1, 'b'], 'is_pinned': 1}) == ('待办事项', ('a', 'b'), True)
+    assert item_facets({}) == ('', (), False)
+
+
+def populated(notes):
+    notes.add('n1', type='待办事项', tags=['工作', '紧急'], is_pinned=True)
+    notes.add('n2', type='待办事项', tags=['工作'])
+    notes.add('n3', type='学习笔记', tags=['数学'])
+    notes.add('n4', type='学习笔记', tags=['工作', '数学'], is_pinned=True)
+    return FacetIndex(notes.index)
+
+
+def test_select_intersects_filters(notes):
+    facets = populated(notes)
+    assert facets.select() == ['n1', 'n2', 'n3', 'n4']
+    assert facets.select(note_type='待办事项') == ['n1', 'n2']
+    assert facets.select(tags=['工作', '数学']) == ['n4']
+    assert facets.select(note_type='学习笔记', pinned=False) == ['n3']
+    assert facets.select(pinned=True) == ['n1', 'n4']
+    assert facets.select(tags=['不存在']) == [] and facets.select(note_type='不存在') == []
+
+
+def test_counts_with_and_without_filters(notes):
+    facets = populated(notes)
+    assert facets.counts() == {'total': 4, 'types': {'待办事项': 2, '学习笔记': 2},
+                               'tags': {'工作': 3, '数学': 2, '紧急': 1}, 'pinned': 2}
+    assert facets.counts(tags=['工作']) == {'total': 3, 'types': {'待办事项': 2, '学习笔记': 1},
+                                            'tags': {'工作': 3, '紧急': 1, '数学': 1}, 'pinned': 2}
+
+
+def test_incremental_updates_match_rebuild(notes):
+    facets = populated(notes)
+    facets.select()
+    facets.add_documents([{'id': 'n2', 'type': '灵感想法', 'tags': ['紧急'], 'is_pinned': True},
+                          {'id': 'n5', 'type': '待办事项', 'tags': []}])
+    facets.remove_documents(['n3'])
+    expected = {'total': 4, 'types': {'待办事项': 2, '灵感想法': 1, '学习笔记': 1},
+                'tags': {'紧急': 2, '工作': 2, '数学': 1}, 'pinned': 3}
+    assert facets.counts() == expected
+    assert facets.select(tags=['紧急']) == ['n1', 'n2']
+
+    rebuilt = FacetIndex(notes.index)
+    notes.index.apply([('put', dict(notes.index.get('n2'), type='灵感想法', tags=['紧急'], is_pinned=True)),
+                       ('put', {'id': 'n5', 'type': '待办事项', 'tags': [], 'file_name': 'n5.md'}),
+                       ('delete', ['n3'])])
+    assert rebuilt.counts() == expected
+
+
+def test_compaction_renumbers_after_many_deletes(notes):
+    facets = FacetIndex(notes.index)
+    facets.select()
+    facets.add_documents([{'id': f'n{i}', 'type': 't', 'tags': [f'g{i % 3}']} for i in range(3000)])
+    facets.remove_documents([f'n{i}' for i in range(2900)])
+    assert len(facets._ids) == 100
+    assert facets.select(tags=['g0']) == [f'n{i}' for i in range(2900, 3000) if i % 3 == 0]
+    assert facets.counts()['total'] == 100
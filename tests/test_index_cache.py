@@ -0,0 +1,116 @@
+"""索引缓存：并发写入的 group commit 与其他进程修改后的失效"""
+import threading
+import time
+
+import pytest
+
+from index_cache import IndexCache
+from storage import JsonFileStore, SQLiteStore
+
+
+class CountingStore(JsonFileStore):
+    """每次提交稍作停顿，使并发写入在队列中积累"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def apply_batch(self, ops):
+        time.sleep(0.005)
+        self.batches.append(len(ops))
+        return super().apply_batch(ops)
+
+
+def open_store(backend, data_dir):
+    if backend == 'json':
+        return JsonFileStore(data_dir / 'index.json', data_dir / 'notes')
+    return SQLiteStore(data_dir / 'notes.sqlite3', data_dir / 'notes')
+
+
+def note(note_id, **fields):
+    return dict({'id': note_id, 'title': note_id, 'type': '零散知识', 'file_name': f'{note_id}.md'}, **fields)
+
+
+def test_group_commit_concurrent_writers(tmp_path):
+    store = CountingStore(tmp_path / 'index.json', tmp_path / 'notes')
+    cache = IndexCache(store)
+    writers, per_writer = 8, 30
+    seen = {}
+    errors = []
+
+    def writer(index):
+        try:
+            results = []
+            for n in range(per_writer):
+                note_id = f'{index}-{n}'
+                cache.add(note(note_id))
+                results.append(cache.apply([('update', note(note_id, title='x')), ('update', note(f'{index}-missing'))]))
+            results.append(cache.delete([f'{index}-0', f'{index}-missing']))
+            seen[index] = results
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    # 每个写入者拿到的是自己操作的结果
+    for index, results in seen.items():
+        for n, (updated, missing) in enumerate(results[:-1]):
+            assert updated == note(f'{index}-{n}', title='x') and missing is None
+        assert [item['id'] for item in results[-1]] == [f'{index}-0']
+
+    # 并发提交被合并，且全部持久化
+    total_ops = writers * (per_writer * 3 + 1)
+    assert sum(store.batches) == total_ops and len(store.batches) < writers * (per_writer * 2 + 1)
+    expected = {f'{index}-{n}' for index in range(writers) for n in range(1, per_writer)}
+    reopened = JsonFileStore(tmp_path / 'index.json', tmp_path / 'notes')
+    assert {item['id'] for item in reopened.load_index()} == expected
+    assert all(item['title'] == 'x' for item in reopened.load_index())
+    assert {item['id'] for item in cache.all()} == expected
+
+
+def test_failed_commit_raises_for_every_waiter(tmp_path):
+    class BrokenStore(JsonFileStore):
+        def apply_batch(self, ops):
+            raise OSError('disk full')
+
+    cache = IndexCache(BrokenStore(tmp_path / 'index.json', tmp_path / 'notes'))
+    with pytest.raises(OSError):
+        cache.add(note('a'))
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_external_modification_bumps_generation(tmp_path, backend):
+    cache = IndexCache(open_store(backend, tmp_path))
+    cache.add(note('a'))
+    assert [item['id'] for item in cache.all()] == ['a']
+    generation = cache.generation
+    # 本进程的写入增量更新，不触发重载
+    cache.add(note('b'))
+    assert cache.generation == generation
+
+    other = open_store(backend, tmp_path)
+    other.apply_batch([('put', note('c')), ('delete', ['a'])])
+    assert [item['id'] for item in cache.all()] == ['b', 'c']
+    assert cache.generation == generation + 1
+    assert cache.get('a') is None and cache.get('c') == note('c')
+    # 之后的本进程写入在重载后的状态上继续
+    cache.update(note('c', title='C'))
+    assert other.get_item('c')['title'] == 'C'
+    assert cache.generation == generation + 1
+
+
+def test_write_after_unseen_external_change_reloads(tmp_path):
+    store = open_store('json', tmp_path)
+    cache = IndexCache(store)
+    cache.add(note('a'))
+    cache.all()
+    open_store('json', tmp_path).apply_batch([('put', note('b'))])
+    # 提交前指纹已变化：不做增量更新，下次读取整体重载
+    cache.add(note('c'))
+    assert [item['id'] for item in cache.all()] == ['a', 'b', 'c']
@@ -0,0 +1,124 @@
+"""后台任务队列：提交与执行、租约过期后重新领取、执行期间续租，失去租约的执行者不能写入结果，暂时性失败退避重试"""
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+def test_submit_and_run(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', {'echo': lambda payload: {'echo': payload}}, workers=0)
+    with pytest.raises(ValueError):
+        queue.submit('unknown', {})
+    job = queue.submit('echo', {'n': 1})
+    assert job['status'] == 'queued' and queue.stats()['jobs']['queued'] == 1
+    assert queue.run_once() and not queue.run_once()
+    done = queue.get(job['id'])
+    assert done['status'] == 'done' and done['result'] == {'echo': {'n': 1}} and done['attempts'] == 1
+    assert [item['id'] for item in queue.list('done')] == [job['id']]
+
+
+def test_expired_lease_reclaimed_until_max_attempts(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', {'echo': lambda payload: {}}, workers=0, max_attempts=2)
+    job = queue.submit('echo', {})
+    # 领取后执行者退出，租约过期的任务被重新领取
+    for attempt in (1, 2):
+        assert queue._claim()['id'] == job['id']
+        queue._connect().execute('UPDATE jobs SET lease_until = 0 WHERE id = ?', (job['id'],))
+    assert queue._claim() is None
+    failed = queue.get(job['id'])
+    assert failed['status'] == 'failed' and failed['attempts'] == 2
+
+
+def test_lease_renewed_while_handler_runs(tmp_path):
+    started = threading.Event()
+    calls = []
+
+    def slow(payload):
+        calls.append(payload)
+        started.set()
+        time.sleep(1.0)
+        return {'ok': True}
+
+    db_file = tmp_path / 'jobs.sqlite3'
+    queue = JobQueue(db_file, {'slow': slow}, workers=0, lease_seconds=0.3)
+    other = JobQueue(db_file, {'slow': slow}, workers=0, lease_seconds=0.3)
+    job = queue.submit('slow', {'n': 1})
+    runner = threading.Thread(target=queue.run_once)
+    runner.start()
+    started.wait(5)
+    # 租约 0.3 秒，执行 1 秒：续租后其他进程不会重新领取
+    deadline = time.monotonic() + 0.9
+    while time.monotonic() < deadline:
+        assert not other.run_once()
+        time.sleep(0.05)
+    runner.join()
+    finished = queue.get(job['id'])
+    assert finished['status'] == 'done' and finished['attempts'] == 1
+    assert calls == [{'n': 1}]
+
+
+def test_stale_attempt_cannot_overwrite_result(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', {'echo': lambda payload: {'attempt': 2}}, workers=0, lease_seconds=60)
+    job = queue.submit('echo', {})
+    row = queue._claim()
+    # 第一次领取的租约过期（执行者卡住），任务被重新领取并完成
+    queue._connect().execute('UPDATE jobs SET lease_until = 0 WHERE id = ?', (job['id'],))
+    assert queue.run_once()
+    assert not queue._finish(job['id'], row['attempts'] + 1, 'done', result={'attempt': 1})
+    finished = queue.get(job['id'])
+    assert finished['status'] == 'done' and finished['result'] == {'attempt': 2} and finished['attempts'] == 2
+
+
+def test_handler_error_recorded(tmp_path):
+    class Unavailable(Exception):
+        status_code = 503
+
+    def broken(payload):
+        raise Unavailable('upstream down')
+
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', {'broken': broken}, workers=0)
+    job = queue.submit('broken', {})
+    assert queue.run_once() and not queue.run_once()
+    failed = queue.get(job['id'])
+    assert failed['status'] == 'failed' and failed['error'] == 'upstream down' and failed['error_status'] == 503
+
+
+def test_transient_errors_retried_with_backoff(tmp_path):
+    class Transient(Exception):
+        status_code = 503
+
+    outcomes = [Transient('busy'), Transient('busy'), {'ok': True}]
+
+    def flaky(payload):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    queue = JobQueue(tmp_path / 'jobs.sqlite3', {'flaky': flaky, 'broken': flaky}, workers=0,
+                     is_transient=lambda error: isinstance(error, Transient), retry_base_seconds=60)
+    job = queue.submit('flaky', {})
+    assert queue.run_once()
+    queued = queue.get(job['id'])
+    assert queued['status'] == 'queued' and queued['error'] == 'busy' and queued['retry_at']
+    # 退避期间不会被领取
+    assert not queue.run_once()
+    for _ in range(2):
+        queue._connect().execute('UPDATE jobs SET retry_at = 0 WHERE id = ?', (job['id'],))
+        assert queue.run_once()
+    done = queue.get(job['id'])
+    assert done['status'] == 'done' and done['attempts'] == 3 and done['error'] is None
+
+    # 执行满 max_attempts 次后记为失败；非暂时性错误不重试
+    outcomes[:] = [Transient('busy')] * 3 + [ValueError('bad input')]
+    job = queue.submit('flaky', {})
+    for _ in range(3):
+        queue._connect().execute('UPDATE jobs SET retry_at = 0 WHERE id = ?', (job['id'],))
+        assert queue.run_once()
+    failed = queue.get(job['id'])
+    assert failed['status'] == 'failed' and failed['attempts'] == 3 and failed['error_status'] == 503
+    job = queue.submit('broken', {})
+    assert queue.run_once()
+    assert queue.get(job['id'])['status'] == 'failed' and queue.get(job['id'])['attempts'] == 1
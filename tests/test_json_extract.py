@@ -0,0 +1,78 @@
+"""模型响应的 JSON 提取：说明文字与代码块、尾随逗号、类型转换、跳过不合格的候选与修复提示"""
+from json_extract import JSONScanner, ParseStats, extract, validate, repair_prompt, REPAIR_MAX_CHARS
+
+CLASSIFY = {'is_note': bool, 'note_type': str, 'confidence': float, 'reason': str}
+MERGE = {'should_merge': bool, 'merge_target': (str, None), 'confidence': float}
+GOOD = '{"is_note": true, "note_type": "灵感想法", "confidence": 0.9, "reason": "r"}'
+
+
+def test_plain_json_is_ok():
+    extraction = extract(GOOD, CLASSIFY)
+    assert extraction.outcome == 'ok' and extraction.value['note_type'] == '灵感想法'
+
+
+def test_json_inside_prose_and_code_fence():
+    for text in ('好的！分析如下：\n' + GOOD + '\n如有疑问请告诉我。', '```json\n' + GOOD + '\n```'):
+        extraction = extract(text, CLASSIFY)
+        assert extraction.outcome == 'extracted' and extraction.value['confidence'] == 0.9
+
+
+def test_trailing_commas_and_string_types_coerced():
+    text = '{"is_note": "true", "note_type": "待办事项", "confidence": "0.8", "reason": "r",}'
+    extraction = extract(text, CLASSIFY)
+    assert extraction.value == {'is_note': True, 'note_type': '待办事项', 'confidence': 0.8, 'reason': 'r'}
+    assert validate({'should_merge': 0, 'merge_target': None, 'confidence': 1}, MERGE) == (
+        {'should_merge': False, 'merge_target': None, 'confidence': 1.0}, [])
+
+
+def test_skips_unparseable_and_nonconforming_candidates():
+    text = '说明里有 {占位符} 和 {"other": 1}，真正的结果：' + GOOD
+    assert extract(text, CLASSIFY).value['reason'] == 'r'
+    # 字符串中的括号不影响配平
+    text = '{"is_note": false, "note_type": "其他", "confidence": 1, "reason": "含有 } 与 { 的说明"}'
+    assert extract(text, CLASSIFY).value['reason'] == '含有 } 与 { 的说明'
+
+
+def test_failure_reports_errors():
+    extraction = extract('{"is_note": "maybe", "note_type": "x"}', CLASSIFY)
+    assert extraction.value is None and extraction.outcome is None
+    assert any('is_note' in error for error in extraction.errors)
+    assert any('missing field "confidence"' in error for error in extraction.errors)
+    assert extract('没有 JSON', CLASSIFY).errors == ['no JSON value found']
+
+
+def test_array_schema_accepts_results_wrapper():
+    schema = [dict(CLASSIFY, id=int)]
+    assert extract('[{"id": 1}]', schema).value == [{'id': 1}]
+    assert extract('结果：{"results": [{"id": 2}]}', schema).value == [{'id': 2}]
+    assert extract('[1, 2]', schema).value is None
+
+
+def test_scanner_incremental_feed():
+    scanner = JSONScanner('{')
+    for chunk in ('前言 {"a": ', '[1, {"b": "}"}', ']} 之后的文字'):
+        scanner.feed(chunk)
+    assert scanner.done and scanner.value == {'a': [1, {'b': '}'}]}
+
+    # 逐字传入：跨段的无效候选被跳过，resume 从已找到结果的起始括号之后继续
+    text = '说明 {占位 [符} 前文' * 200 + '{"x": {"y": 1}}' + ' 尾部' * 200
+    scanner = JSONScanner('{')
+    for char in text:
+        if scanner.feed(char):
+            break
+    assert scanner.value == {'x': {'y': 1}} and not scanner._candidate
+    assert scanner.resume() and scanner.value == {'y': 1}
+    assert not scanner.resume()
+
+
+def test_repair_prompt_and_stats():
+    prompt = repair_prompt('not json', CLASSIFY, ['no JSON value found'])
+    assert 'not json' in prompt and '"is_note": boolean' in prompt and 'no JSON value found' in prompt
+    assert repair_prompt('x' * (REPAIR_MAX_CHARS + 1), CLASSIFY, []) is None
+    assert repair_prompt('', CLASSIFY, []) is None
+
+    stats = ParseStats()
+    for outcome in ('ok', 'ok', 'repaired', 'failed'):
+        stats.record('classify', outcome)
+    result = stats.stats()
+    assert result['tasks']['classify']['ok'] == 2 and result['failure_rate'] == 0.25
@@ -0,0 +1,105 @@
+"""大模型响应缓存：缓存键、两级命中、过期与容量清理"""
+import time
+import sqlite3
+import threading
+
+from llm_cache import LLMCache, make_cache_key
+
+
+def test_cache_key_covers_all_parameters():
+    key = make_cache_key('qwen-plus', '系统', '提示词', temperature=0.3)
+    assert key == make_cache_key('qwen-plus', '系统', '提示词', temperature=0.3)
+    assert key != make_cache_key('qwen-max', '系统', '提示词', temperature=0.3)
+    assert key != make_cache_key('qwen-plus', '系统', '提示词', temperature=0.7)
+    assert key != make_cache_key('qwen-plus', '其他', '提示词', temperature=0.3)
+
+
+def test_memory_then_disk_hits(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db')
+    assert cache.get('a') is None
+    cache.put('a', '响应')
+    assert cache.get('a') == '响应'
+    # 另一个实例（相当于另一个进程或重启后）从 SQLite 读取，命中后进入内存
+    other = LLMCache(tmp_path / 'cache.db')
+    assert other.get('a') == '响应'
+    assert other.get('a') == '响应'
+    stats = other.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+    assert stats['disk_entries'] == 1 and stats['hit_rate'] == 1.0
+    assert cache.stats()['misses'] == 1
+
+
+def test_put_overwrites(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db')
+    cache.put('a', '旧')
+    cache.put('a', '新')
+    assert cache.get('a') == '新'
+    assert LLMCache(tmp_path / 'cache.db').get('a') == '新'
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_memory_lru_is_bounded(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db', memory_entries=2)
+    for key in 'abc':
+        cache.put(key, key.upper())
+    assert cache.stats()['memory_entries'] == 2
+    # 被挤出内存的条目仍能从磁盘读取
+    assert cache.get('a') == 'A'
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_expired_entries_miss_and_are_evicted(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db', ttl_seconds=60)
+    cache.put('old', '过期')
+    cache.put('new', '有效')
+    conn = sqlite3.connect(str(tmp_path / 'cache.db'))
+    with conn:
+        conn.execute('UPDATE responses SET created_at = ? WHERE key = ?', (time.time() - 120, 'old'))
+    conn.close()
+    fresh = LLMCache(tmp_path / 'cache.db', ttl_seconds=60)
+    assert fresh.get('old') is None and fresh.get('new') == '有效'
+    assert fresh.evict() == 1
+    assert fresh.stats()['disk_entries'] == 1
+
+
+def test_evict_keeps_most_recently_accessed(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db', max_entries=3)
+    for index in range(5):
+        cache.put(f'k{index}', str(index))
+        time.sleep(0.01)
+    # 最早写入的 k0 最近被读过，应当保留
+    other = LLMCache(tmp_path / 'cache.db', max_entries=3)
+    assert other.get('k0') == '0'
+    assert other.evict() == 2
+    reader = LLMCache(tmp_path / 'cache.db')
+    assert [key for key in ('k0', 'k1', 'k2', 'k3', 'k4') if reader.get(key) is not None] == ['k0', 'k3', 'k4']
+
+
+def test_concurrent_threads(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db', max_entries=1000)
+    errors = []
+
+    def worker(offset):
+        try:
+            for index in range(50):
+                key = f'{offset}-{index}'
+                cache.put(key, key)
+                assert cache.get(key) == key
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert cache.stats()['disk_entries'] == 200
+
+
+def test_clear(tmp_path):
+    cache = LLMCache(tmp_path / 'cache.db')
+    cache.put('a', 'A')
+    cache.clear()
+    assert cache.get('a') is None
+    assert cache.stats()['disk_entries'] == 0
@@ -0,0 +1,181 @@
+"""大模型传输层：重试、熔断、限流（含多进程共用的配额）与流式调用（以假客户端代替上游）"""
+import asyncio
+import time
+import types
+
+import openai
+import pytest
+
+import llm_transport
+from llm_transport import (LLMTransport, LLMError, CircuitBreaker, CircuitOpenError, RateLimiter,
+                           RateLimitedError, SharedRateLimiter, estimate_tokens)
+
+
+def completion(text, total_tokens=None):
+    usage = types.SimpleNamespace(total_tokens=total_tokens) if total_tokens is not None else None
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+                                 usage=usage)
+
+
+def api_error(cls, message='upstream error'):
+    """构造 openai 异常而不依赖其 HTTP 库的请求/响应对象"""
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    error.message = message
+    error.response = None
+    return error
+
+
+def server_error():
+    return api_error(openai.InternalServerError)
+
+
+def bad_request():
+    return api_error(openai.BadRequestError)
+
+
+def transport(responses, **kwargs):
+    """按顺序返回或抛出 responses 中的结果，记录每次调用的参数"""
+    llm = LLMTransport('key', 'http://llm.test/v1', 'test-model', **kwargs)
+    calls = []
+
+    def create(**request):
+        calls.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    llm.client.chat.completions.create = create
+    return llm, calls
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_transport, 'backoff_delay', lambda attempt: 0.0)
+
+
+def test_retries_transient_errors_then_succeeds():
+    llm, calls = transport([api_error(openai.APITimeoutError), server_error(), completion('ok')])
+    assert llm.complete('prompt', 'system') == 'ok'
+    assert len(calls) == 3
+    assert calls[0]['messages'] == [{'role': 'system', 'content': 'system'}, {'role': 'user', 'content': 'prompt'}]
+    assert llm.breaker.state == 'closed'
+
+
+def test_gives_up_after_max_retries_and_on_client_errors():
+    llm, calls = transport([server_error() for _ in range(3)], max_retries=2)
+    with pytest.raises(LLMError) as excinfo:
+        llm.complete('p', 's')
+    assert len(calls) == 3 and excinfo.value.status_code == 502
+
+    assert excinfo.value.transient
+
+    llm, calls = transport([bad_request()])
+    with pytest.raises(LLMError) as excinfo:
+        llm.complete('p', 's')
+    assert len(calls) == 1 and llm.breaker.state == 'closed' and not excinfo.value.transient
+
+
+def test_empty_response_is_an_error():
+    llm, _ = transport([completion('')])
+    with pytest.raises(LLMError):
+        llm.complete('p', 's')
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    llm, calls = transport([server_error(), server_error(), completion('back')], max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            llm.complete('p', 's')
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as excinfo:
+        llm.complete('p', 's')
+    assert excinfo.value.status_code == 503 and len(calls) == 2
+    # 熔断期间被拒绝的调用不占用限流配额
+    limiter = RateLimiter(requests_per_minute=60)
+    llm.rate_limiter = limiter
+    with pytest.raises(CircuitOpenError):
+        llm.complete('p', 's')
+    assert limiter.stats()['requests_available'] == 60
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    assert llm.complete('p', 's') == 'back'
+    assert breaker.state == 'closed'
+
+
+def test_rate_limiter_waits_or_rejects():
+    limiter = RateLimiter(requests_per_minute=60)
+    assert limiter.reserve(10, max_wait=5) == 0.0
+    limiter.requests.tokens = 0
+    wait = limiter.reserve(10, max_wait=5)
+    assert 0.9 < wait <= 1.0
+    assert limiter.reserve(10, max_wait=0.5) is None
+    assert limiter.stats()['throttled'] == 1
+
+    tokens = RateLimiter(tokens_per_minute=600)
+    tokens.reserve(500, max_wait=0)
+    tokens.adjust_tokens(-400)
+    assert tokens.stats()['tokens_available'] >= 499
+
+
+def test_shared_rate_limiter_spans_instances(tmp_path):
+    """两个实例（相当于两个进程）共用同一数据库中的配额"""
+    first = SharedRateLimiter(tmp_path / 'jobs.sqlite3', requests_per_minute=2)
+    second = SharedRateLimiter(tmp_path / 'jobs.sqlite3', requests_per_minute=2)
+    assert first.reserve(1, max_wait=0) == 0.0
+    assert second.reserve(1, max_wait=0) == 0.0
+    assert first.reserve(1, max_wait=1) is None and second.reserve(1, max_wait=1) is None
+    assert 29 < second.reserve(1, max_wait=60) <= 30
+    assert first.stats()['requests_available'] < 0
+
+
+def test_transport_raises_429_when_limit_exceeds_deadline():
+    limiter = RateLimiter(tokens_per_minute=60)
+    limiter.tokens.tokens = 0
+    llm, calls = transport([completion('unused')], rate_limiter=limiter, timeout=0.5)
+    with pytest.raises(RateLimitedError) as excinfo:
+        llm.complete('很长的提示' * 100, 's')
+    assert excinfo.value.status_code == 429 and not calls
+
+
+def test_usage_settles_token_estimate():
+    limiter = RateLimiter(tokens_per_minute=10000)
+    llm, _ = transport([completion('ok', total_tokens=5000)], rate_limiter=limiter)
+    llm.complete('short', 's')
+    assert limiter.stats()['tokens_available'] < 5100
+
+
+def test_stream_yields_deltas_and_closes():
+    closed = []
+
+    class Stream:
+        def __iter__(self):
+            for text in ('你', '', '好'):
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))])
+
+        def close(self):
+            closed.append(True)
+
+    llm, calls = transport([Stream()])
+    assert list(llm.stream('p', 's')) == ['你', '好']
+    assert calls[0]['stream'] is True and closed == [True]
+
+
+def test_async_complete_shares_retry_policy():
+    llm, calls = transport([server_error(), completion('async ok')])
+    llm._ensure_async()
+
+    async def create(**request):
+        return llm.client.chat.completions.create(**request)
+
+    llm._async_client.chat.completions.create = create
+    assert asyncio.run(llm.acomplete('p', 's')) == 'async ok'
+    assert len(calls) == 2
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('中文') == 2
+    assert estimate_tokens('abcdefgh') == 2
@@ -0,0 +1,107 @@
+"""本地快速分类：短内容、陌生内容与样本不足的类别交给大模型，模型结果的置信度取留出样本准确率"""
+import random
+
+from local_classifier import LocalClassifier, NaiveBayes, classify_by_rules
+
+TEMPLATES = {
+    '待办事项': ('明天{time}记得去{place}办理{thing}，别忘了带上身份证和{thing}的材料',
+             '提醒我{time}之前去{place}交{thing}的费用，顺便确认一下{thing}的进度'),
+    '学习笔记': ('今天学习了{topic}中的{concept}，核心思想是通过{concept}来简化{topic}的推导过程',
+             '{topic}课程笔记：{concept}的定义、性质以及在{topic}中的典型应用和例题'),
+    '灵感想法': ('突然想到一个点子：可以把{idea}和{idea2}结合起来，做成一个面向年轻人的小产品',
+             '灵感记录：如果用{idea}的思路去改造{idea2}，也许能解决大家日常遇到的麻烦'),
+}
+WORDS = {
+    'time': ['上午九点', '下午三点', '周五', '月底', '后天中午'],
+    'place': ['银行', '派出所', '社保中心', '物业办公室', '邮局'],
+    'thing': ['护照', '社保卡', '水电费', '营业执照', '居住证'],
+    'topic': ['线性代数', '概率论', '操作系统', '编译原理', '微观经济学'],
+    'concept': ['特征值', '条件概率', '虚拟内存', '语法分析', '边际效用'],
+    'idea': ['共享单车', '智能音箱', '二手交易', '宠物寄养', '社区团购'],
+    'idea2': ['旧书回收', '健身打卡', '外卖包装', '家庭菜园', '拼车通勤'],
+}
+
+
+def samples(per_class=120, seed=0):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(per_class):
+        for label, templates in TEMPLATES.items():
+            text = rng.choice(templates).format(**{key: rng.choice(values) for key, values in WORDS.items()})
+            result.append((text, label))
+    return result
+
+
+def trained_classifier(**kwargs):
+    data = samples()
+    return LocalClassifier(bootstrap=lambda: iter(data), **kwargs)
+
+
+def test_rules():
+    assert classify_by_rules('')['is_note'] is False
+    assert classify_by_rules('{"error": "not found", "code": 404}')['is_note'] is False
+    assert classify_by_rules('https://example.com/docs')['note_type'] == '参考材料'
+    assert classify_by_rules('import os\n\ndef main():\n    return os.getcwd()\n')['note_type'] == '代码片段'
+    assert classify_by_rules('http://localhost:5000/api')['is_note'] is False
+    assert classify_by_rules('明天下午去银行办理护照，记得带上身份证') is None
+
+
+def test_naive_bayes_reports_margin_and_known_fraction():
+    model = NaiveBayes()
+    for text, label in samples(20):
+        model.learn(text, label)
+    known = model.predict('今天学习了线性代数中的特征值，核心思想是通过特征值来简化线性代数的推导过程')
+    assert known['label'] == '学习笔记'
+    assert known['known'] == 1.0 and known['margin'] > 0
+    unknown = model.predict('TODO: renew passport')
+    assert unknown['known'] < 0.2
+
+
+def test_in_domain_content_answered_with_held_out_precision():
+    classifier = trained_classifier()
+    result = classifier.classify('提醒我周五之前去银行交水电费的费用，顺便确认一下护照的进度')
+    assert result is not None and result['source'] == 'model'
+    assert result['note_type'] == '待办事项'
+    stats = classifier.stats()
+    assert stats['model_ready']
+    assert result['confidence'] == stats['held_out']['待办事项']['precision']
+
+
+def test_short_and_unknown_content_escalates():
+    classifier = trained_classifier()
+    for content in ('TODO: renew passport', 'Meeting notes: discussed Q3 roadmap with the design team',
+                    'Idea: a browser extension that summarizes tabs', 'ok thanks', 'hello', '明天开会'):
+        assert classifier.classify(content) is None, content
+    assert classifier.stats()['escalated'] == 6
+
+
+def test_model_off_until_every_class_has_enough_samples():
+    data = samples() + [('这条内容属于一个几乎没有样本的类别，只出现过一次而已', '参考材料')]
+    classifier = LocalClassifier(bootstrap=lambda: iter(data))
+    assert classifier.classify('提醒我周五之前去银行交水电费的费用，顺便确认一下护照的进度') is None
+    assert not classifier.stats()['model_ready']
+
+
+def test_model_off_without_held_out_evaluations():
+    data = samples()
+    classifier = LocalClassifier(bootstrap=lambda: iter(data), holdout_every=0)
+    assert classifier.classify('提醒我周五之前去银行交水电费的费用，顺便确认一下护照的进度') is None
+    assert classifier.stats()['held_out'] == {}
+
+
+def test_learn_evaluates_before_training():
+    classifier = LocalClassifier(min_documents=1, min_class_docs=1, min_evaluations=1, holdout_every=0)
+    for text, label in samples(30):
+        classifier.learn(text, {'is_note': True, 'note_type': label, 'confidence': 0.95, 'reason': ''})
+    held_out = classifier.stats()['held_out']
+    assert held_out and all(0 < entry["evaluated"] <= 90 for entry in held_out.values())
+
+
+def test_learn_trains_and_remembers_confident_results():
+    classifier = LocalClassifier()
+    classifier.learn('不确定的内容', {'is_note': True, 'note_type': '待办事项', 'confidence': 0.5, 'reason': ''})
+    assert classifier.stats()['documents'] == 0
+    result = {'is_note': True, 'note_type': '待办事项', 'confidence': 0.95, 'reason': '待办', 'source': 'llm'}
+    classifier.learn('明天交报告', result)
+    assert classifier.stats()['documents'] == 1
+    assert classifier.classify('明天交报告') == dict(result, source='duplicate')
@@ -0,0 +1,51 @@
+"""长文分块整理：分块数上限、单块失败保留原文、全部失败时返回错误"""
+import json
+import re
+
+import ai_tasks
+from llm_transport import LLMError
+
+
+def test_split_content_merges_neighbours_beyond_max_chunks():
+    content = '\n\n'.join(f'# 第 {index} 节\n\n' + '内容' * 20 for index in range(30))
+    chunks = ai_tasks.split_content(content, 100)
+    assert len(chunks) > 8 and all(len(chunk) <= 100 for chunk in chunks)
+    capped = ai_tasks.split_content(content, 100, max_chunks=8)
+    assert len(capped) == 8
+    assert ''.join(''.join(capped).split()) == ''.join(content.split())
+    job = ai_tasks.OrganizeMapReduce(content, '学习笔记', 100, 8)
+    assert len(job.chunks) <= 8
+
+
+def organize_reply(prompt):
+    """分块整理时第二部分失败，汇总正常返回"""
+    if '"summary": "一句话总结"\n}' in prompt and '原始内容' not in prompt:
+        return json.dumps({'summary': '整体总结'}, ensure_ascii=False)
+    part = re.search(r'第 (\d+)/\d+ 部分', prompt).group(1)
+    if part == '2':
+        raise LLMError('upstream down')
+    return json.dumps({'organized_markdown': f'## 第 {part} 部分', 'key_dates': [], 'key_points': [part],
+                       'summary': f'摘要 {part}'}, ensure_ascii=False)
+
+
+def long_content():
+    return '\n\n'.join(f'段落 {index} ' + '文字' * 30 for index in range(3))
+
+
+def test_failed_chunk_keeps_original_text(client, app_module, fake_llm, monkeypatch):
+    monkeypatch.setattr(app_module, 'ORGANIZE_CHUNK_CHARS', 80)
+    monkeypatch.setattr(app_module, 'ORGANIZE_WORKERS', 1)
+    fake_llm.replies = [organize_reply] * 4
+    response = client.post('/api/organize-content', json={'content': long_content()})
+    body = response.get_json()
+    assert response.status_code == 200 and len(body['chunks']) == 3
+    assert [chunk.get('error') for chunk in body['chunks']] == [None, 'upstream down', None]
+    assert body['organized_markdown'].split('\n\n')[1].startswith('段落 1 ')
+    assert body['key_points'] == ['1', '3'] and body['summary'] == '整体总结'
+
+
+def test_all_chunks_failed_returns_error(client, app_module, fake_llm, monkeypatch):
+    monkeypatch.setattr(app_module, 'ORGANIZE_CHUNK_CHARS', 80)
+    fake_llm.replies = [LLMError('upstream down')] * 3
+    response = client.post('/api/organize-content', json={'content': long_content()})
+    assert response.status_code == 502 and response.get_json()['error'] == 'upstream down'
@@ -0,0 +1,58 @@
+"""相关笔记：TF-IDF 余弦相似度排序、增量维护、矩阵持久化与重启后对账（需要 numpy）"""
+import pytest
+
+pytest.importorskip('numpy')
+
+from related_notes import RelatedNotesIndex
+
+TEXTS = {
+    'db1': 'PostgreSQL 索引 B-tree 查询计划 vacuum 索引维护',
+    'db2': 'MySQL 索引 B-tree 查询优化 慢查询 索引覆盖',
+    'cook': '红烧肉 焯水 炒糖色 小火慢炖 收汁',
+    'cook2': '糖醋排骨 焯水 炒糖色 收汁 装盘',
+}
+
+
+def populated(notes, directory=None, **kwargs):
+    for note_id, text in TEXTS.items():
+        notes.add(note_id, text, title=note_id)
+    return RelatedNotesIndex(notes.store, notes.index, directory, n_features=1 << 16, **kwargs)
+
+
+def test_related_ranked_by_cosine(notes):
+    related = populated(notes)
+    hits = related.related('db1', 3)
+    assert hits[0][0] == 'db2' and 0 < hits[0][1] <= 1
+    assert 'db1' not in [note_id for note_id, _ in hits]
+    assert [note_id for note_id, _ in related.related('cook', 1)] == ['cook2']
+    assert related.related('missing') is None
+    assert related.related('db1', 0) == []
+
+
+def test_incremental_update_and_remove(notes):
+    related = populated(notes)
+    related.related('db1')
+    item = notes.add('db3', 'PostgreSQL vacuum 查询计划 索引维护', title='db3')
+    related.add_document(item, 'PostgreSQL vacuum 查询计划 索引维护')
+    assert related.related('db1', 1)[0][0] == 'db3'
+    related.remove_documents(['db3'])
+    assert 'db3' not in [note_id for note_id, _ in related.related('db1')]
+    assert related.stats()['documents'] == 4
+
+
+def test_saved_matrix_reloaded_and_reconciled(notes, tmp_path):
+    directory = tmp_path / 'related'
+    related = populated(notes, directory, flush_rows=1)
+    expected = related.related('db1')
+    related.flush()
+    assert (directory / 'meta.json').exists()
+
+    reads = []
+    original = notes.store.read_body
+    notes.store.read_body = lambda item: reads.append(item['id']) or original(item)
+    reloaded = RelatedNotesIndex(notes.store, notes.index, directory, n_features=1 << 16)
+    assert reloaded.related('db1') == expected and reads == []
+
+    # 维度不同的矩阵不使用，全部重新计算
+    other = RelatedNotesIndex(notes.store, notes.index, directory, n_features=1 << 12)
+    assert other.related('db1')[0][0] == 'db2' and len(reads) == 4
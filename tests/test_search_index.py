@@ -0,0 +1,65 @@
+"""全文索引：分词、AND/短语查询、类型过滤、BM25 排序、增量维护与摘要"""
+from search_index import SearchIndex, tokenize, parse_query, find_matches, make_snippet
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize('机器学习 Python３') == ['机器', '器学', '学习', 'python3']
+    assert tokenize('猫') == ['猫']
+    assert parse_query('"machine learning" 索引') == [['machine', 'learning'], ['索引']]
+
+
+def test_and_phrase_and_type_filter(notes):
+    notes.add('a', '向量数据库使用近似最近邻索引', title='向量检索', type='学习笔记')
+    notes.add('b', '数据库索引与事务隔离级别', title='数据库', type='零散知识')
+    notes.add('c', 'machine learning is fun, learning machine is not', type='学习笔记')
+    index = SearchIndex(notes.store, notes.index)
+    assert index.search('数据库 索引')[0] == 2
+    assert [note_id for note_id, _ in index.search('数据库 索引', note_type='学习笔记')[1]] == ['a']
+    assert [note_id for note_id, _ in index.search('"machine learning"')[1]] == ['c']
+    assert index.search('"learning is not"')[0] == 0
+    # 单个汉字匹配所有包含该字的二元组
+    assert index.search('务')[0] == 1
+    assert index.search('')[0] == 3
+
+
+def test_bm25_ranks_denser_matches_first_and_paginates(notes):
+    notes.add('dense', '缓存 缓存 缓存 命中率')
+    notes.add('sparse', '缓存 ' + '无关内容 ' * 50)
+    notes.add('other', '完全无关的笔记')
+    index = SearchIndex(notes.store, notes.index)
+    total, hits = index.search('缓存')
+    assert total == 2 and [note_id for note_id, _ in hits] == ['dense', 'sparse']
+    assert hits[0][1] > hits[1][1] > 0
+    assert [note_id for note_id, _ in index.search('缓存', limit=1, offset=1)[1]] == ['sparse']
+
+
+def test_incremental_updates_and_external_changes(notes):
+    notes.add('a', '第一篇笔记')
+    index = SearchIndex(notes.store, notes.index)
+    assert index.search('笔记')[0] == 1
+    item = notes.add('b', '第二篇笔记')
+    index.add_document(item, '第二篇笔记')
+    edited = dict(notes.index.get('a'), updated_at='2024-01-02T00:00:00')
+    notes.store.write_body(edited, '内容已改写')
+    notes.index.update(edited)
+    index.add_document(edited, '内容已改写')
+    assert [note_id for note_id, _ in index.search('笔记')[1]] == ['b']
+    index.remove_documents(['b'])
+    assert index.search('笔记')[0] == 0
+    # 单字查询所用的 字 -> 二元组 映射随删除一起清理
+    assert index.search('篇')[0] == 0 and '篇' not in index._char_bigrams
+    assert index.search('改')[0] == 1
+    # 其他进程写入的笔记在对账时补上
+    notes.store.write_body({'id': 'c', 'file_name': 'c.md'}, '外部写入的笔记')
+    notes.external_put({'id': 'c', 'title': '', 'type': '零散知识', 'file_name': 'c.md', 'updated_at': 'x'})
+    assert [note_id for note_id, _ in index.search('外部')[1]] == ['c']
+
+
+def test_snippet_highlights_original_text():
+    text = '前言。' + '填充' * 40 + 'ＧＰＵ 加速的向量检索' + '结尾'
+    snippet = make_snippet(text, 'gpu 向量')
+    start, end = snippet['highlights'][0]
+    assert snippet['text'][start:end] == 'ＧＰＵ'
+    assert snippet['offset'] > 0 and len(snippet['text']) <= 120
+    assert find_matches('abc', '') == []
+    assert make_snippet('没有命中', 'xyz') == {'text': '没有命中', 'offset': 0, 'highlights': []}
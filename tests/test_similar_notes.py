@@ -0,0 +1,57 @@
+"""相似笔记检索：MinHash 估计 Jaccard 相似度，LSH 只比较候选，随增删改维护"""
+import random
+
+from similar_notes import MinHashLSH, SimilarNotesIndex, shingles
+
+BASE = '周末去图书馆借了三本关于分布式系统的书，打算下个月读完并写读书笔记，重点关注一致性协议与故障恢复'
+
+
+def body(original):
+    return f'# 标题\n\n---\n\n## 原始内容\n\n{original}\n\n---\n\n## AI 整理内容\n\n无关的整理结果\n\n---\n'
+
+
+def test_shingles():
+    assert shingles('ab') == {'ab'}
+    assert shingles('') == set()
+    assert shingles('ＡＢＣ  d') == {'abc', 'bc ', 'c d'}
+
+
+def test_minhash_estimates_jaccard():
+    lsh = MinHashLSH(num_perm=128, bands=32)
+    rng = random.Random(1)
+    universe = [f'token{i}' for i in range(400)]
+    a = set(rng.sample(universe, 200))
+    b = set(list(a)[:150]) | set(rng.sample([token for token in universe if token not in a], 50))
+    exact = len(a & b) / len(a | b)
+    lsh.add('b', lsh.signature(b))
+    signature = lsh.signature(a)
+    assert abs(lsh.similarity(signature, 'b') - exact) < 0.15
+    assert 'b' in lsh.candidates(signature)
+    lsh.remove('b')
+    assert len(lsh) == 0 and not lsh.candidates(signature)
+    assert lsh.signature(set()) is None
+
+
+def test_query_ranks_near_duplicates(notes):
+    notes.add('near', body(BASE + '。'), title='读书计划', type='待办事项')
+    notes.add('partial', body(BASE[:30] + '，然后去超市买菜，晚上看一部电影放松一下'), type='零散知识')
+    notes.add('other', body('完全不同的内容：红烧肉的做法是先焯水再炒糖色，小火慢炖一个小时'), type='零散知识')
+    index = SimilarNotesIndex(notes.store, notes.index)
+    results = index.query(BASE, k=5)
+    assert [result['id'] for result in results][:2] == ['near', 'partial']
+    assert results[0]['similarity'] > 0.8 > results[1]['similarity']
+    assert results[0]['title'] == '读书计划' and results[0]['excerpt'].startswith('周末去图书馆')
+    assert 'other' not in [result['id'] for result in results]
+    assert [result['id'] for result in index.query(BASE, note_type='零散知识')] == ['partial']
+    assert [result['id'] for result in index.query(BASE, min_similarity=0.8)] == ['near']
+    assert index.query('') == []
+
+
+def test_incremental_maintenance(notes):
+    index = SimilarNotesIndex(notes.store, notes.index)
+    assert index.query(BASE) == []
+    item = notes.add('new', body(BASE))
+    index.add_document(item, body(BASE))
+    assert [result['id'] for result in index.query(BASE)] == ['new']
+    index.remove_documents(['new'])
+    assert index.query(BASE) == [] and index.stats() == {'documents': 0}
@@ -0,0 +1,146 @@
+"""JSON 文件后端：日志回放、不完整记录截断、后台压缩与多进程共用数据目录"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from storage import JsonFileStore, SQLiteStore, StorageError
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_store(data_dir: Path, **kwargs) -> JsonFileStore:
+    return JsonFileStore(data_dir / 'index.json', data_dir / 'notes', **kwargs)
+
+
+def note(note_id, **fields):
+    return dict({'id': note_id, 'title': note_id, 'type': '零散知识', 'file_name': f'{note_id}.md'}, **fields)
+
+
+def wait_compacted(store, timeout=10):
+    deadline = time.monotonic() + timeout
+    while store._compacting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not store._compacting
+
+
+def test_mutations_survive_restart(tmp_path):
+    store = make_store(tmp_path)
+    store.apply_batch([('put', note('a')), ('put', note('b')), ('put', note('c'))])
+    store.apply_batch([('update', note('b', title='B')), ('delete', ['c']), ('update', note('missing'))])
+    reopened = make_store(tmp_path)
+    assert [(item['id'], item['title']) for item in reopened.load_index()] == [('a', 'a'), ('b', 'B')]
+
+
+def test_replay_after_crash_between_snapshot_and_journal_truncate(tmp_path):
+    store = make_store(tmp_path)
+    store.apply_batch([('put', note('a')), ('put', note('b'))])
+    store.apply_batch([('update', note('a', title='A')), ('delete', ['b'])])
+    journal = store.journal_file.read_bytes()
+    # 压缩写入新快照后、清空日志前崩溃：新快照与完整的旧日志同时存在
+    store.compact()
+    store.journal_file.write_bytes(journal)
+    reopened = make_store(tmp_path)
+    assert reopened.load_index() == [note('a', title='A')]
+    # 之后的追加接在旧日志末尾，重启后仍然一致
+    reopened.apply_batch([('put', note('d'))])
+    assert [item['id'] for item in make_store(tmp_path).load_index()] == ['a', 'd']
+
+
+def test_torn_tail_ignored_and_truncated_on_next_append(tmp_path):
+    store = make_store(tmp_path)
+    store.apply_batch([('put', note('a'))])
+    with open(store.journal_file, 'ab') as f:
+        f.write(b'{"op": "put", "item": {"id": "torn"')
+    reopened = make_store(tmp_path)
+    assert [item['id'] for item in reopened.load_index()] == ['a']
+    reopened.apply_batch([('put', note('b'))])
+    lines = store.journal_file.read_bytes().splitlines()
+    assert all(json.loads(line) for line in lines) and len(lines) == 2
+    assert [item['id'] for item in make_store(tmp_path).load_index()] == ['a', 'b']
+
+
+def test_garbage_line_skipped(tmp_path, capsys):
+    store = make_store(tmp_path)
+    store.apply_batch([('put', note('a'))])
+    with open(store.journal_file, 'ab') as f:
+        f.write(b'\x00\x00not json\n')
+    store.apply_batch([('put', note('b'))])
+    assert [item['id'] for item in make_store(tmp_path).load_index()] == ['a', 'b']
+    assert 'Skipping corrupted journal record' in capsys.readouterr().out
+
+
+def test_corrupted_snapshot_raises(tmp_path):
+    store = make_store(tmp_path)
+    store.index_file.write_text('[{"id": ', encoding='utf-8')
+    with pytest.raises(StorageError):
+        make_store(tmp_path).load_index()
+
+
+def test_background_compaction_while_appending(tmp_path):
+    store = make_store(tmp_path, compact_threshold=2048)
+    errors = []
+
+    def writer(prefix):
+        try:
+            for n in range(100):
+                store.apply_batch([('put', note(f'{prefix}{n}'))])
+                if n % 10 == 9:
+                    store.apply_batch([('delete', [f'{prefix}{n - 1}'])])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(prefix,)) for prefix in 'wxyz']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_compacted(store)
+    assert not errors
+    expected = {f'{prefix}{n}' for prefix in 'wxyz' for n in range(100) if n % 10 != 8}
+    assert {item['id'] for item in store.load_index()} == expected
+    assert {item['id'] for item in make_store(tmp_path).load_index()} == expected
+    # 已压缩过：日志远小于全部记录的总长度
+    assert store.journal_file.stat().st_size < 40 * 1024
+
+
+WRITER_SCRIPT = '''
+import sys
+from pathlib import Path
+from storage import JsonFileStore
+data_dir, prefix = Path(sys.argv[1]), sys.argv[2]
+store = JsonFileStore(data_dir / 'index.json', data_dir / 'notes', compact_threshold=4096)
+for n in range(150):
+    note_id = f'{prefix}{n}'
+    store.apply_batch([('put', {'id': note_id, 'title': note_id, 'file_name': note_id + '.md'})])
+    # 另一进程的写入在持锁后可见
+    assert store.get_item(note_id) is not None
+store.compact()
+'''
+
+
+def test_two_processes_share_data_dir(tmp_path):
+    make_store(tmp_path)
+    env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+    processes = [subprocess.Popen([sys.executable, '-c', WRITER_SCRIPT, str(tmp_path), prefix], env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                 for prefix in ('p', 'q')]
+    for process in processes:
+        _, stderr = process.communicate(timeout=120)
+        assert process.returncode == 0, stderr.decode()
+    ids = [item['id'] for item in make_store(tmp_path).load_index()]
+    assert len(ids) == len(set(ids)) == 300
+    assert set(ids) == {f'{prefix}{n}' for prefix in 'pq' for n in range(150)}
+
+
+def test_sqlite_store_fingerprint_changes_on_write(tmp_path):
+    store = SQLiteStore(tmp_path / 'notes.sqlite3', tmp_path / 'notes')
+    before = store.fingerprint()
+    store.apply_batch([('put', note('a')), ('delete', ['missing'])])
+    assert store.fingerprint() != before
+    assert store.get_item('a') == note('a')
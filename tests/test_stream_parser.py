@@ -0,0 +1,70 @@
+"""增量 JSON 解析与流式整理：任意切分的输入产出相同的事件，转义与代理对跨段也能正确解码"""
+import json
+
+from ai_tasks import OrganizeStream
+from stream_parser import IncrementalJSONParser
+
+DOCUMENT = {
+    'organized_markdown': '# 标题\n\n- 引号 "x" 与反斜杠 \\ 😀\tend',
+    'key_dates': [{'date': '2024-05-01', 'description': '截止 {日期}'}],
+    'key_points': ['a, b', 'c'],
+    'confidence': 0.75,
+    'done': True,
+    'summary': None,
+}
+
+
+def run(chunks):
+    parser = IncrementalJSONParser(['organized_markdown'])
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+def collect(events):
+    markdown = ''.join(text for kind, key, text in events if kind == 'delta')
+    fields = {key: value for kind, key, value in events if kind == 'field'}
+    return markdown, fields
+
+
+def test_any_chunking_yields_same_result():
+    text = '```json\n' + json.dumps(DOCUMENT, ensure_ascii=True, indent=1) + '\n```\n以上。'
+    for size in (1, 2, 3, 7, len(text)):
+        parser, events = run([text[i:i + size] for i in range(0, len(text), size)])
+        markdown, fields = collect(events)
+        assert parser.done
+        assert markdown == DOCUMENT['organized_markdown']
+        assert fields == {key: value for key, value in DOCUMENT.items() if key != 'organized_markdown'}
+
+
+def test_markdown_streams_before_object_completes():
+    parser, events = run(['{"summary": "s", "organized_markdown": "第一', '段'])
+    assert events == [('field', 'summary', 's'), ('delta', 'organized_markdown', '第一'),
+                      ('delta', 'organized_markdown', '段')]
+    assert not parser.done
+
+
+def test_numbers_end_at_whitespace_or_delimiter_and_trailing_text_ignored():
+    parser, events = run(['{"a": 1 , "b":2}', ' {"c": 3}'])
+    assert events == [('field', 'a', 1), ('field', 'b', 2)]
+    assert parser.done
+
+
+def test_non_json_input_produces_no_events():
+    parser, events = run(['模型没有按格式输出'])
+    assert events == [] and not parser.done
+
+
+def test_organize_stream_outcomes():
+    good = OrganizeStream('原文')
+    messages = good.feed('{"organized_markdown": "# ok", "key_dates": [], "key_points": [], "summary": "s"} 多余')
+    assert good.complete and messages[0].startswith('event: markdown')
+    result = good.finish()
+    assert good.outcome == 'ok' and '"organized_markdown": "# ok"' in result
+
+    bad = OrganizeStream('原文')
+    bad.feed('只有说明文字')
+    result = bad.finish()
+    assert bad.outcome == 'failed' and result.startswith('event: result')
+    assert json.loads(result.split('data: ', 1)[1])['organized_markdown'] == '原文'
@@ -0,0 +1,63 @@
+"""重要日期时间线：日期规范化、区间查询、类型过滤、分页与增量维护"""
+from timeline_index import TimelineIndex, parse_date, normalize_key_dates
+
+
+def test_parse_and_normalize_dates():
+    assert parse_date('2024-3-5') == '2024-03-05'
+    assert parse_date('2024/03/05') == '2024-03-05'
+    assert parse_date('2024-03-05T08:00:00') == '2024-03-05'
+    assert parse_date('2024-02-30') is None and parse_date('下周一') is None and parse_date(None) is None
+    entries = [{'date': '2024/5/1', 'description': '劳动节'}, '2024-01-01', {'date': '无效'},
+               {'date': '2024-05-01', 'description': '劳动节'}]
+    assert normalize_key_dates(entries) == [{'date': '2024-01-01', 'description': ''},
+                                            {'date': '2024-05-01', 'description': '劳动节'}]
+    assert normalize_key_dates('2024-01-01') == []
+
+
+def test_range_queries_with_type_filter_and_paging(notes):
+    notes.add('exam', type='待办事项', key_dates=[{'date': '2024-11-23', 'description': '期中考试'},
+                                                 {'date': '2024-12-30', 'description': '期末考试'}])
+    notes.add('trip', type='灵感想法', key_dates=[{'date': '2024-11-23', 'description': '出发'}])
+    notes.add('none', type='待办事项')
+    timeline = TimelineIndex(notes.index)
+    total, events = timeline.between('2024-11-01', '2024-11-30')
+    assert total == 2
+    assert [(event['date'], event['note_id']) for event in events] == [('2024-11-23', 'exam'), ('2024-11-23', 'trip')]
+    # 结束日期包含当天
+    assert timeline.between(end='2024-11-23')[0] == 2
+    assert timeline.between(start='2024-12-01')[1] == [
+        {'date': '2024-12-30', 'description': '期末考试', 'note_id': 'exam'}]
+    assert timeline.between(note_type='待办事项')[0] == 2
+    total, page = timeline.between(limit=1, offset=1)
+    assert total == 3 and page[0]['note_id'] == 'trip'
+    assert timeline.between('2025-01-01', '2024-01-01') == (0, [])
+
+
+def test_incremental_updates_and_external_changes(notes):
+    notes.add('a', key_dates=[{'date': '2024-01-01', 'description': '旧'}])
+    timeline = TimelineIndex(notes.index)
+    assert timeline.between()[0] == 1
+    timeline.add_document({'id': 'a', 'key_dates': [{'date': '2024-02-01', 'description': '新'}]})
+    assert timeline.between()[1] == [{'date': '2024-02-01', 'description': '新', 'note_id': 'a'}]
+    timeline.remove_documents(['a'])
+    assert timeline.between() == (0, [])
+    # 其他进程修改索引后整体重建
+    notes.external_put({'id': 'b', 'title': '', 'type': '零散知识', 'file_name': 'b.md',
+                        'key_dates': [{'date': '2024-03-01', 'description': '外部'}]})
+    assert [event['note_id'] for event in timeline.between()[1]] == ['a', 'b']
+
+
+def test_edits_and_type_changes_keep_per_type_arrays_consistent(notes):
+    notes.add('a', type='待办事项', key_dates=['2024-01-01', '2024-01-02'])
+    timeline = TimelineIndex(notes.index)
+    assert timeline.between(note_type='待办事项')[0] == 2
+    # 日期不变的重复编辑不会产生重复事件；改为其他类型后从原类型中移除
+    for _ in range(3):
+        timeline.add_document({'id': 'a', 'type': '待办事项', 'key_dates': ['2024-01-01', '2024-01-02']})
+    assert timeline.between()[0] == 2
+    timeline.add_document({'id': 'a', 'type': '学习笔记', 'key_dates': ['2024-01-02']})
+    assert timeline.between(note_type='待办事项') == (0, [])
+    assert timeline.between('2024-01-02', '2024-01-02', note_type='学习笔记') == (
+        1, [{'date': '2024-01-02', 'description': '', 'note_id': 'a'}])
+    total, page = timeline.between(limit=5, offset=3)
+    assert total == 1 and page == []
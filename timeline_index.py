@@ -0,0 +1,147 @@
+"""
+重要日期时间线
+整理结果中的 key_dates 随笔记保存在索引条目中（[{"date": "YYYY-MM-DD", "description": "..."}]）；
+本模块将所有笔记的日期维护为按日期排序的数组（另按笔记类型各一份），区间查询以二分查找定位起止位置，耗时 O(log n + k)
+"""
+import bisect
+import threading
+from datetime import date
+from typing import Optional, Dict, Any, List, Tuple
+
+
+def parse_date(value) -> Optional[str]:
+    """规范化为 YYYY-MM-DD，无法识别时返回 None（接受 2024-3-5、2024/03/05 与带时间的 ISO 格式）"""
+    if not isinstance(value, str):
+        return None
+    text = value.strip()[:10].replace('/', '-')
+    parts = text.split('-')
+    if len(parts) != 3:
+        return None
+    try:
+        return date(int(parts[0]), int(parts[1]), int(parts[2][:2])).isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_key_dates(entries) -> List[Dict[str, str]]:
+    """整理 key_dates：只保留能识别日期的条目，按日期排序并去重"""
+    normalized = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict):
+            day = parse_date(entry.get('date'))
+            description = str(entry.get('description') or '').strip()
+        else:
+            day, description = parse_date(entry), ''
+        if day is not None:
+            normalized.setdefault((day, description), {'date': day, 'description': description})
+    return [normalized[key] for key in sorted(normalized)]
+
+
+class TimelineIndex:
+    """
+    所有笔记重要日期的有序数组，另按笔记类型各维护一份，随保存/编辑/删除增量维护；
+    索引被其他进程修改后从索引缓存整体重建（只读索引条目，不读正文）
+    """
+
+    def __init__(self, notes_index):
+        self.notes_index = notes_index
+        self._lock = threading.RLock()
+        self._generation = None
+        # 按 (日期, 笔记 id, 序号) 排序的键：全部笔记一份，每个笔记类型一份
+        self._keys: List[Tuple[str, str, int]] = []
+        self._type_keys: Dict[str, List[Tuple[str, str, int]]] = {}
+        # 键 -> 事件描述（只含现存的事件）
+        self._descriptions: Dict[Tuple[str, str, int], str] = {}
+        # 笔记 id -> (笔记类型, 该笔记的键)
+        self._doc_keys: Dict[str, Tuple[str, List[Tuple[str, str, int]]]] = {}
+        # 增删只追加到数组末尾或从 _descriptions 中移除，查询前统一排序清理
+        self._dirty = False
+
+    # ==================== 维护 ====================
+
+    def _index(self, item: Dict[str, Any]):
+        note_id = item['id']
+        self._remove(note_id)
+        note_type = item.get('type') or ''
+        keys = []
+        for seq, entry in enumerate(normalize_key_dates(item.get('key_dates'))):
+            key = (entry['date'], note_id, seq)
+            self._descriptions[key] = entry['description']
+            keys.append(key)
+        if keys:
+            self._doc_keys[note_id] = (note_type, keys)
+            self._keys.extend(keys)
+            self._type_keys.setdefault(note_type, []).extend(keys)
+            self._dirty = True
+
+    def _remove(self, note_id: str):
+        _, keys = self._doc_keys.pop(note_id, ('', ()))
+        for key in keys:
+            del self._descriptions[key]
+            self._dirty = True
+
+    def _live_keys(self, keys, note_type: Optional[str] = None) -> List[Tuple[str, str, int]]:
+        """排序并去掉已删除、重复或已改为其他类型的键（已有序的部分与末尾追加的部分归并，接近线性）"""
+        keys.sort()
+        return list(dict.fromkeys(
+            key for key in keys
+            if key in self._descriptions and (note_type is None or self._doc_keys[key[1]][0] == note_type)))
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        self._keys = self._live_keys(self._keys)
+        type_keys = {}
+        for note_type, keys in self._type_keys.items():
+            keys = self._live_keys(keys, note_type)
+            if keys:
+                type_keys[note_type] = keys
+        self._type_keys = type_keys
+        self._dirty = False
+
+    def _sync(self):
+        generation = self.notes_index.generation
+        if self._generation == generation:
+            self._flush()
+            return
+        self._keys = []
+        self._type_keys = {}
+        self._descriptions = {}
+        self._doc_keys = {}
+        for item in self.notes_index.all():
+            self._index(item)
+        self._flush()
+        self._generation = generation
+
+    def add_document(self, item: Dict[str, Any]):
+        """新增或更新一篇笔记的日期"""
+        with self._lock:
+            if self._generation is not None:
+                self._index(item)
+                # 长时间没有查询时，追加的旧键不会无限累积
+                if len(self._keys) > 2 * len(self._descriptions) + 1024:
+                    self._flush()
+
+    def remove_documents(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                self._remove(note_id)
+
+    # ==================== 查询 ====================
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None, note_type: str = '',
+              limit: Optional[int] = None, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        日期在 [start, end] 内（均为 YYYY-MM-DD，可省略）的事件，按日期升序
+        返回 (命中总数, [{date, description, note_id}])，取 offset 起的 limit 条；note_type 非空时只返回该类型笔记的日期
+        """
+        with self._lock:
+            self._sync()
+            keys = self._type_keys.get(note_type, []) if note_type else self._keys
+            low = bisect.bisect_left(keys, (start,)) if start else 0
+            high = max(low, bisect.bisect_right(keys, (end, '\uffff')) if end else len(keys))
+            stop = high if limit is None else min(high, low + offset + limit)
+            return high - low, [
+                {'date': key[0], 'description': self._descriptions[key], 'note_id': key[1]}
+                for key in keys[low + offset:stop]
+            ]